@@ -0,0 +1,128 @@
+# aggregate.py
+# Compilador de /analytics/aggregate: dimensiones, filtros y métricas de una
+# lista blanca -> una sola sentencia SQL parametrizada.
+#
+# El texto SQL depende solo de la "forma" de la petición (fuente, dimensiones,
+# métricas y qué filtros vienen), nunca de los valores: esos van como parámetros
+# (listas IN con bindparam expanding). compile_aggregate cachea la sentencia por
+# forma, y como el texto es idéntico SQL Server también reutiliza su plan.
+#
+# Fuentes (las elige analytics.py según lo que exista en la BD):
+#   agg    dbo.[hiring_agg] (agregados.py): sin mes, rangos de trimestres completos
+#   typed  hire_dt / hire_year / hire_quarter (migrar_fechas.py)
+#   raw    conversión del NVARCHAR [datetime] original
+# En las tres se ignoran las filas cuya fecha no se puede interpretar.
+
+from functools import lru_cache
+from typing import Dict, Tuple
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.sql.elements import TextClause
+
+from agregados import NO_ID, PARSE_HIRE_DT
+
+DIMENSIONS = ("department", "job", "year", "quarter", "month")
+METRICS = ("hires", "departments", "jobs")
+SOURCES = ("agg", "typed", "raw")
+
+_RAW_DT = "c.dt"
+_SOURCE = {
+    "agg": {
+        "from": "dbo.[hiring_agg] a",
+        "t": "a",
+        "year": "a.hire_year",
+        "quarter": "a.hire_quarter",
+        "month": None,
+        "range": ("a.hire_year BETWEEN :ylo AND :yhi "
+                  "AND a.hire_year * 4 + a.hire_quarter - 1 >= :qlo "
+                  "AND a.hire_year * 4 + a.hire_quarter - 1 < :qhi"),
+        "valid": None,
+        "hires": "SUM(a.hires)",
+        "departments": f"COUNT(DISTINCT NULLIF(a.department_id, {NO_ID}))",
+        "jobs": f"COUNT(DISTINCT NULLIF(a.job_id, {NO_ID}))",
+    },
+    "typed": {
+        "from": "dbo.[hired_employees] he",
+        "t": "he",
+        "year": "he.hire_year",
+        "quarter": "he.hire_quarter",
+        "month": "MONTH(he.hire_dt)",
+        "range": "he.hire_dt >= :desde AND he.hire_dt < :hasta",
+        "valid": "he.hire_dt IS NOT NULL",
+        "hires": "COUNT(1)",
+        "departments": "COUNT(DISTINCT he.department_id)",
+        "jobs": "COUNT(DISTINCT he.job_id)",
+    },
+    "raw": {
+        "from": f"dbo.[hired_employees] he CROSS APPLY (SELECT {PARSE_HIRE_DT.format(col='he.[datetime]')} AS dt) c",
+        "t": "he",
+        "year": f"YEAR({_RAW_DT})",
+        "quarter": f"DATEPART(QUARTER, {_RAW_DT})",
+        "month": f"MONTH({_RAW_DT})",
+        "range": f"{_RAW_DT} >= :desde AND {_RAW_DT} < :hasta",
+        "valid": f"{_RAW_DT} IS NOT NULL",
+        "hires": "COUNT(1)",
+        "departments": "COUNT(DISTINCT he.department_id)",
+        "jobs": "COUNT(DISTINCT he.job_id)",
+    },
+}
+
+
+def _dimension(src: Dict[str, str], dim: str) -> Tuple[str, str]:
+    """(expresión agrupada, JOIN necesario o '')."""
+    t = src["t"]
+    if dim == "department":
+        return "d.name", f"JOIN dbo.[departments] d ON {t}.department_id = d.id"
+    if dim == "job":
+        return "j.name", f"JOIN dbo.[jobs] j ON {t}.job_id = j.id"
+    expr = src[dim]
+    if expr is None:
+        raise ValueError(f"La dimensión '{dim}' no está disponible en la fuente")
+    return expr, ""
+
+
+@lru_cache(maxsize=256)
+def compile_aggregate(source: str, dims: Tuple[str, ...], metrics: Tuple[str, ...],
+                      has_range: bool, has_departments: bool, has_jobs: bool) -> TextClause:
+    """
+    Sentencia de una forma de petición. Parámetros: :limit, y según los flags
+    :desde/:hasta (o :ylo/:yhi/:qlo/:qhi en agg), :department_ids, :job_ids.
+    """
+    src = _SOURCE[source]
+    t = src["t"]
+    selects, groups, joins = [], [], []
+    for dim in dims:
+        expr, join = _dimension(src, dim)
+        selects.append(f"{expr} AS [{dim}]")
+        groups.append(expr)
+        if join:
+            joins.append(join)
+    selects += [f"{src[m]} AS [{m}]" for m in metrics]
+
+    where = [src["valid"]] if src["valid"] else []
+    if has_range:
+        where.append(src["range"])
+    if has_departments:
+        where.append(f"{t}.department_id IN :department_ids")
+    if has_jobs:
+        where.append(f"{t}.job_id IN :job_ids")
+
+    sql = f"SELECT TOP (:limit) {', '.join(selects)} FROM {src['from']}"
+    if joins:
+        sql += " " + " ".join(joins)
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    if groups:
+        sql += " GROUP BY " + ", ".join(groups) + " ORDER BY " + ", ".join(groups)
+
+    stmt = text(sql)
+    if has_departments:
+        stmt = stmt.bindparams(bindparam("department_ids", expanding=True))
+    if has_jobs:
+        stmt = stmt.bindparams(bindparam("job_ids", expanding=True))
+    return stmt
+
+
+def plan_cache_stats() -> Dict[str, int]:
+    info = compile_aggregate.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "size": info.currsize, "max_entries": info.maxsize}
@@ -0,0 +1,224 @@
+# agregados.py
+# Tabla resumen de contrataciones mantenida de forma incremental:
+#
+#   dbo.[hiring_agg] (hire_year, hire_quarter, department_id, job_id) -> hires
+#
+# analytics.py lee de aquí en vez de agrupar hired_employees en cada petición,
+# así el coste depende del número de celdas año×trimestre×depto×cargo y no del
+# número de contrataciones. Los department_id / job_id NULL se guardan como -1
+# (la PK no admite NULL); los JOIN con departments/jobs los descartan igual que
+# antes y /hires-summary los sigue contando.
+#
+# Mantenimiento:
+#   - ingest.insert_employees suma el lote en la misma transacción del INSERT
+#   - historico.py suma cada chunk en la misma transacción de su to_sql
+#   - rebuild() recalcula todo desde hired_employees (primera vez y backfills)
+#
+# La tabla se da por lista cuando existe dbo.[hiring_agg_state], que solo crea
+# rebuild() dentro de la transacción que rellena hiring_agg. rebuild() toma
+# antes un bloqueo compartido de tabla sobre hired_employees hasta el COMMIT:
+# - ingesta que ya insertó: el rebuild espera a su COMMIT y cuenta sus filas
+#   (ella no vio hiring_agg_state y no sumó nada)
+# - ingesta posterior: su INSERT espera al COMMIT del rebuild y después suma
+# Por eso las ingestas comprueban ready() DESPUÉS de insertar en hired_employees.
+#
+# Uso:
+#   python agregados.py --rebuild        (SQL Server, mismas variables que app.py)
+#   python agregados.py --verify         (compara con un GROUP BY sobre hired_employees)
+
+import sys
+import time
+import logging
+import argparse
+from typing import Any, Dict, Iterable, List
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+AGG_TABLE   = "dbo.[hiring_agg]"
+STATE_TABLE = "dbo.[hiring_agg_state]"
+NO_ID = -1
+
+# Texto -> DATETIME2: estilo 127 (ISO-8601 con Z); si trae offset se pasa a UTC
+# (la misma conversión que usan el trigger y el backfill de migrar_fechas.py)
+PARSE_HIRE_DT = (
+    "COALESCE(TRY_CONVERT(DATETIME2(0), {col}, 127), "
+    "CONVERT(DATETIME2(0), SWITCHOFFSET(TRY_CONVERT(DATETIMEOFFSET(0), {col}), '+00:00')))"
+)
+
+_DDL = [
+    f"""
+    IF OBJECT_ID('dbo.hiring_agg') IS NULL
+    CREATE TABLE {AGG_TABLE} (
+        hire_year SMALLINT NOT NULL,
+        hire_quarter TINYINT NOT NULL,
+        department_id INT NOT NULL,
+        job_id INT NOT NULL,
+        hires INT NOT NULL,
+        CONSTRAINT PK_hiring_agg PRIMARY KEY (hire_year, hire_quarter, department_id, job_id)
+    )
+    """,
+    f"""
+    IF OBJECT_ID('dbo.hiring_agg_state') IS NULL
+    CREATE TABLE {STATE_TABLE} (
+        rebuilt_at DATETIME2(0) NOT NULL,
+        cells INT NOT NULL,
+        hires BIGINT NOT NULL
+    )
+    """,
+]
+
+
+def _grouped(source: str, alias: str, where: str = "") -> str:
+    """SELECT de celdas (año, trimestre, depto, cargo, hires) sobre filas con [datetime]."""
+    return f"""
+        SELECT YEAR(c.dt) AS hire_year,
+               DATEPART(QUARTER, c.dt) AS hire_quarter,
+               COALESCE({alias}.department_id, {NO_ID}) AS department_id,
+               COALESCE({alias}.job_id, {NO_ID}) AS job_id,
+               COUNT(1) AS hires
+        FROM {source}
+        CROSS APPLY (SELECT {PARSE_HIRE_DT.format(col=f'{alias}.[datetime]')} AS dt) c
+        WHERE c.dt IS NOT NULL {where}
+        GROUP BY YEAR(c.dt), DATEPART(QUARTER, c.dt),
+                 COALESCE({alias}.department_id, {NO_ID}), COALESCE({alias}.job_id, {NO_ID})
+    """
+
+
+def _merge(delta_sql: str) -> str:
+    return f"""
+        MERGE {AGG_TABLE} WITH (HOLDLOCK) AS a
+        USING ({delta_sql}) AS d
+           ON a.hire_year = d.hire_year AND a.hire_quarter = d.hire_quarter
+          AND a.department_id = d.department_id AND a.job_id = d.job_id
+        WHEN MATCHED THEN UPDATE SET hires = a.hires + d.hires
+        WHEN NOT MATCHED THEN
+            INSERT (hire_year, hire_quarter, department_id, job_id, hires)
+            VALUES (d.hire_year, d.hire_quarter, d.department_id, d.job_id, d.hires);
+    """
+
+
+# Lote de ingest.py: filas aceptadas de la staging de la sesión
+MERGE_FROM_EMPLOYEE_STAGE = _merge(_grouped("#stage_hired_employees s", "s", "AND s.reason IS NULL"))
+
+# Chunk de historico.py: filas recién insertadas en hired_employees, por id.
+# Misma conversión que el resto (PARSE_HIRE_DT), así el resumen no se desvía.
+_IDS_STAGE = "#stage_hiring_ids"
+_MERGE_FROM_IDS_STAGE = _merge(_grouped(
+    f"dbo.[hired_employees] he JOIN {_IDS_STAGE} i ON i.id = he.id", "he"))
+
+
+def ready(db) -> bool:
+    """True si hiring_agg está construida (Session o Connection, dentro de la transacción)."""
+    return db.execute(text("SELECT OBJECT_ID('dbo.hiring_agg_state')")).scalar() is not None
+
+
+def apply_employee_stage(db: Session) -> bool:
+    """Suma a hiring_agg las filas aceptadas de #stage_hired_employees (sin COMMIT)."""
+    if not ready(db):
+        return False
+    db.execute(text(MERGE_FROM_EMPLOYEE_STAGE))
+    return True
+
+
+def apply_employee_ids(conn: Connection, ids: Iterable[int]) -> bool:
+    """
+    Suma a hiring_agg las filas de hired_employees con esos id, ya insertadas
+    en la transacción de conn (sin COMMIT).
+    """
+    rows: List[Dict[str, Any]] = [{"id": int(i)} for i in ids]
+    if not rows or not ready(conn):
+        return False
+    conn.execute(text(f"IF OBJECT_ID('tempdb..{_IDS_STAGE}') IS NOT NULL DROP TABLE {_IDS_STAGE}"))
+    conn.execute(text(f"CREATE TABLE {_IDS_STAGE} (id INT NOT NULL PRIMARY KEY)"))
+    conn.execute(text(f"INSERT INTO {_IDS_STAGE} (id) VALUES (:id)"), rows)
+    conn.execute(text(_MERGE_FROM_IDS_STAGE))
+    conn.execute(text(f"DROP TABLE {_IDS_STAGE}"))
+    return True
+
+
+def rebuild(conn: Connection) -> Dict[str, Any]:
+    """
+    Recalcula hiring_agg desde hired_employees en la transacción de conn
+    (el llamador hace COMMIT). Bloquea las inserciones en hired_employees
+    hasta el COMMIT para que el resumen quede exacto.
+    """
+    t0 = time.perf_counter()
+    # Primero el bloqueo: ningún objeto nuevo es visible antes de tenerlo
+    source_rows = conn.execute(text(
+        "SELECT COUNT_BIG(1) FROM dbo.[hired_employees] WITH (TABLOCK, HOLDLOCK)"
+    )).scalar()
+    for ddl in _DDL:
+        conn.execute(text(ddl))
+    conn.execute(text(f"DELETE FROM {AGG_TABLE}"))
+    conn.execute(text(
+        f"INSERT INTO {AGG_TABLE} (hire_year, hire_quarter, department_id, job_id, hires) "
+        + _grouped("dbo.[hired_employees] he", "he")
+    ))
+    cells, hires = conn.execute(text(f"SELECT COUNT(1), COALESCE(SUM(CAST(hires AS BIGINT)), 0) FROM {AGG_TABLE}")).one()
+    conn.execute(text(f"DELETE FROM {STATE_TABLE}"))
+    conn.execute(text(f"INSERT INTO {STATE_TABLE} (rebuilt_at, cells, hires) VALUES (SYSUTCDATETIME(), :c, :h)"),
+                 {"c": cells, "h": hires})
+    return {
+        "source_rows": int(source_rows or 0),
+        "cells": int(cells),
+        "hires": int(hires),
+        "seconds": round(time.perf_counter() - t0, 3),
+    }
+
+
+def verify(conn: Connection) -> int:
+    """Celdas de hiring_agg que no coinciden con un GROUP BY completo de hired_employees."""
+    return int(conn.execute(text(f"""
+        WITH fresh AS ({_grouped("dbo.[hired_employees] he", "he")})
+        SELECT COUNT(1)
+        FROM fresh f
+        FULL JOIN {AGG_TABLE} a
+          ON a.hire_year = f.hire_year AND a.hire_quarter = f.hire_quarter
+         AND a.department_id = f.department_id AND a.job_id = f.job_id
+        WHERE a.hires IS NULL OR f.hires IS NULL OR a.hires <> f.hires
+    """)).scalar() or 0)
+
+
+def parse_args():
+    ap = argparse.ArgumentParser(description="Mantenimiento de la tabla resumen dbo.hiring_agg")
+    group = ap.add_mutually_exclusive_group(required=True)
+    group.add_argument("--rebuild", action="store_true", help="Recalcular desde hired_employees")
+    group.add_argument("--verify", action="store_true", help="Comparar con hired_employees sin modificar nada")
+    return ap.parse_args()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    args = parse_args()
+    from deps import get_engine
+    engine = get_engine()
+    try:
+        if args.rebuild:
+            with engine.begin() as conn:
+                r = rebuild(conn)
+            logger.info("✅ hiring_agg reconstruida: %s filas -> %s celdas (%s hires) en %ss",
+                        r["source_rows"], r["cells"], r["hires"], r["seconds"])
+            sys.exit(0)
+        with engine.connect() as conn:
+            if not ready(conn):
+                logger.error("❌ hiring_agg no existe todavía: ejecuta --rebuild")
+                sys.exit(1)
+            bad = verify(conn)
+        if bad:
+            logger.warning("⚠️ %s celdas de hiring_agg no coinciden; ejecuta --rebuild", bad)
+        else:
+            logger.info("✅ hiring_agg coincide con hired_employees")
+        sys.exit(1 if bad else 0)
+    except SystemExit:
+        raise
+    except Exception as e:
+        logger.error("❌ Error en hiring_agg: %s", e)
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
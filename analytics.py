@@ -1,13 +1,110 @@
 # analytics.py
+import os
+import time
+from datetime import date, datetime, timedelta
+
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy import text
 from sqlalchemy.orm import Session
-from typing import Dict, Any
+from typing import Dict, Any, Hashable, List, Optional, Tuple
+
+# Usar SIEMPRE la Session compartida (deps.py, sin importar app.py)
+from deps import get_db, get_current_user, run_db
+from etag import conditional_get
+from aggregate import DIMENSIONS, METRICS, compile_aggregate
+from agregados import PARSE_HIRE_DT
+from cache import MISS, ResultCache, data_versions
+
+# Resultados por (endpoint, parámetros); se invalidan cuando la ingesta cambia estas tablas
+ANALYTICS_TABLES = ("hired_employees", "departments", "jobs")
+
+# ETag por versión de esas tablas: un If-None-Match vigente responde 304 sin consultar
+router = APIRouter(prefix="/analytics", tags=["Analytics"],
+                   dependencies=[Depends(conditional_get(*ANALYTICS_TABLES))])
+
+ANALYTICS_CACHE_SIZE = int(os.getenv("ANALYTICS_CACHE_SIZE", "256"))
+ANALYTICS_CACHE_TTL  = float(os.getenv("ANALYTICS_CACHE_TTL", "300"))
+analytics_cache = ResultCache(max_entries=ANALYTICS_CACHE_SIZE, ttl=ANALYTICS_CACHE_TTL)
+
+# "sql" (por defecto) o "columnar": hired_employees en memoria (columnar.py)
+ANALYTICS_BACKEND = os.getenv("ANALYTICS_BACKEND", "sql").lower()
+COLUMNAR_REFRESH  = float(os.getenv("COLUMNAR_REFRESH", "30"))
+columnar_store = None
+if ANALYTICS_BACKEND == "columnar":
+    from columnar import ColumnarStore   # numpy/pandas solo si se usa
+    columnar_store = ColumnarStore(refresh_interval=COLUMNAR_REFRESH)
+
+
+async def _columnar(db: Session, method: str, *args):
+    """Resuelve un endpoint con el backend columnar, refrescándolo antes si hace falta."""
+    versions = data_versions.get(ANALYTICS_TABLES)
+
+    def _run():
+        columnar_store.ensure_fresh(db, versions)
+        return getattr(columnar_store, method)(*args)
+
+    return await run_db(_run)
+
+
+async def _cached(endpoint: str, params: Hashable, compute):
+    # Versiones leídas ANTES de consultar: si una ingesta confirma mientras tanto,
+    # la entrada nace vieja y la siguiente llamada recalcula
+    versions = data_versions.get(ANALYTICS_TABLES)
+    key = (endpoint, params)
+    value = analytics_cache.get(key, versions, endpoint)
+    if value is MISS:
+        value = await compute()
+        analytics_cache.put(key, versions, value)
+    return value
 
-# Usar SIEMPRE la Session del app.py
-from app import get_db, get_current_user
 
-router = APIRouter(prefix="/analytics", tags=["Analytics"])
+# Columnas tipadas de migrar_fechas.py. Se usan cuando existe su índice (último paso
+# de la migración); mientras tanto se mantiene el filtro sobre el NVARCHAR original.
+TYPED_INDEX = "IX_hired_employees_hire_dt"
+_SCHEMA_RECHECK = 60.0
+_schema = {
+    "typed": {"ready": False, "checked_at": 0.0, "sql": (
+        "SELECT 1 FROM sys.indexes WHERE name = :name AND object_id = OBJECT_ID('dbo.hired_employees')"
+    ), "params": {"name": TYPED_INDEX}},
+    # Tabla resumen de agregados.py: lista en cuanto un rebuild crea hiring_agg_state
+    "agg": {"ready": False, "checked_at": 0.0, "sql": (
+        "SELECT 1 WHERE OBJECT_ID('dbo.hiring_agg_state') IS NOT NULL"
+    ), "params": {}},
+}
+
+
+def _schema_ready(db: Session, feature: str) -> bool:
+    """Una vez disponible no se vuelve a comprobar; si no, se reintenta cada _SCHEMA_RECHECK s."""
+    f = _schema[feature]
+    if f["ready"]:
+        return True
+    now = time.monotonic()
+    if now - f["checked_at"] > _SCHEMA_RECHECK:
+        f["checked_at"] = now
+        f["ready"] = db.execute(text(f["sql"]), f["params"]).first() is not None
+    return f["ready"]
+
+
+def _typed_dates(db: Session) -> bool:
+    return _schema_ready(db, "typed")
+
+
+def _hiring_agg(db: Session) -> bool:
+    return _schema_ready(db, "agg")
+
+
+def _year_filter(db: Session, year: int) -> Tuple[str, str, Dict[str, Any]]:
+    """
+    (predicado WHERE, expresión de trimestre, parámetros) para filtrar por año.
+    Con la migración aplicada es un rango sobre hire_dt que usa el índice cubriente.
+    """
+    if _typed_dates(db):
+        return (
+            "he.hire_dt >= :desde AND he.hire_dt < :hasta",
+            "he.hire_quarter",
+            {"desde": datetime(year, 1, 1), "hasta": datetime(year + 1, 1, 1)},
+        )
+    return "YEAR(he.[datetime]) = :year", "DATEPART(QUARTER, he.[datetime])", {"year": year}
 
 @router.get("/test")
 async def test_analytics(
@@ -16,7 +113,7 @@ async def test_analytics(
 ):
     """Ping simple para verificar conexión y auth"""
     try:
-        c = db.execute(text("SELECT COUNT(*) FROM dbo.[hired_employees]")).scalar() or 0
+        c = await run_db(lambda: db.execute(text("SELECT COUNT(*) FROM dbo.[hired_employees]")).scalar()) or 0
         return {"message": "Analytics OK", "employee_count": int(c)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error de prueba: {str(e)}")
@@ -31,20 +128,40 @@ async def hires_by_quarter(
     """
     Contrataciones por trimestre por (departamento, cargo).
     """
-    try:
-        rows = db.execute(text("""
-            SELECT 
-                d.name AS department,
-                j.name AS job,
-                DATEPART(QUARTER, he.[datetime]) AS quarter,
-                COUNT(1) AS cnt
-            FROM dbo.[hired_employees] he
-            JOIN dbo.[departments] d ON he.department_id = d.id
-            JOIN dbo.[jobs] j ON he.job_id = j.id
-            WHERE YEAR(he.[datetime]) = :year
-            GROUP BY d.name, j.name, DATEPART(QUARTER, he.[datetime])
-            ORDER BY d.name, j.name, quarter
-        """), {"year": year}).mappings().all()
+    def _query():
+        if _hiring_agg(db):
+            return db.execute(text("""
+                SELECT
+                    d.name AS department,
+                    j.name AS job,
+                    a.hire_quarter AS quarter,
+                    SUM(a.hires) AS cnt
+                FROM dbo.[hiring_agg] a
+                JOIN dbo.[departments] d ON a.department_id = d.id
+                JOIN dbo.[jobs] j ON a.job_id = j.id
+                WHERE a.hire_year = :year
+                GROUP BY d.name, j.name, a.hire_quarter
+                ORDER BY d.name, j.name, quarter
+            """), {"year": year}).mappings().all()
+        where, quarter, params = _year_filter(db, year)
+        return db.execute(text(f"""
+                SELECT 
+                    d.name AS department,
+                    j.name AS job,
+                    {quarter} AS quarter,
+                    COUNT(1) AS cnt
+                FROM dbo.[hired_employees] he
+                JOIN dbo.[departments] d ON he.department_id = d.id
+                JOIN dbo.[jobs] j ON he.job_id = j.id
+                WHERE {where}
+                GROUP BY d.name, j.name, {quarter}
+                ORDER BY d.name, j.name, quarter
+            """), params).mappings().all()
+
+    async def _compute():
+        if columnar_store is not None:
+            return await _columnar(db, "hires_by_quarter", year)
+        rows = await run_db(_query)
 
         acc: Dict[tuple, Dict[str, Any]] = {}
         for r in rows:
@@ -59,6 +176,8 @@ async def hires_by_quarter(
 
         return list(acc.values())
 
+    try:
+        return await _cached("hires-by-quarter", year, _compute)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
 
@@ -72,26 +191,50 @@ async def departments_above_average(
     """
     Departamentos que contrataron por encima del promedio anual.
     """
-    try:
-        rows = db.execute(text("""
-            WITH DepartmentHires AS (
-                SELECT 
-                    d.id,
-                    d.name AS department,
-                    COUNT(he.id) AS hires
-                FROM dbo.[hired_employees] he
-                JOIN dbo.[departments] d ON he.department_id = d.id
-                WHERE YEAR(he.[datetime]) = :year
-                GROUP BY d.id, d.name
-            )
-            SELECT id, department, hires
-            FROM DepartmentHires
-            WHERE hires > (SELECT AVG(hires) FROM DepartmentHires)
-            ORDER BY hires DESC
-        """), {"year": year}).mappings().all()
+    def _query():
+        if _hiring_agg(db):
+            return db.execute(text("""
+                WITH DepartmentHires AS (
+                    SELECT
+                        d.id,
+                        d.name AS department,
+                        SUM(a.hires) AS hires
+                    FROM dbo.[hiring_agg] a
+                    JOIN dbo.[departments] d ON a.department_id = d.id
+                    WHERE a.hire_year = :year
+                    GROUP BY d.id, d.name
+                )
+                SELECT id, department, hires
+                FROM DepartmentHires
+                WHERE hires > (SELECT AVG(hires) FROM DepartmentHires)
+                ORDER BY hires DESC
+            """), {"year": year}).mappings().all()
+        where, _, params = _year_filter(db, year)
+        return db.execute(text(f"""
+                WITH DepartmentHires AS (
+                    SELECT 
+                        d.id,
+                        d.name AS department,
+                        COUNT(he.id) AS hires
+                    FROM dbo.[hired_employees] he
+                    JOIN dbo.[departments] d ON he.department_id = d.id
+                    WHERE {where}
+                    GROUP BY d.id, d.name
+                )
+                SELECT id, department, hires
+                FROM DepartmentHires
+                WHERE hires > (SELECT AVG(hires) FROM DepartmentHires)
+                ORDER BY hires DESC
+            """), params).mappings().all()
 
+    async def _compute():
+        if columnar_store is not None:
+            return await _columnar(db, "departments_above_average", year)
+        rows = await run_db(_query)
         return [dict(r) for r in rows]
 
+    try:
+        return await _cached("departments-above-average", year, _compute)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
 
@@ -105,13 +248,26 @@ async def hires_summary(
     """
     Resumen anual: hires por Q1..Q4 + total.
     """
-    try:
-        rows = db.execute(text("""
-            SELECT DATEPART(QUARTER, he.[datetime]) AS quarter, COUNT(1) AS cnt
-            FROM dbo.[hired_employees] he
-            WHERE YEAR(he.[datetime]) = :year
-            GROUP BY DATEPART(QUARTER, he.[datetime])
-        """), {"year": year}).mappings().all()
+    def _query():
+        if _hiring_agg(db):
+            return db.execute(text("""
+                SELECT a.hire_quarter AS quarter, SUM(a.hires) AS cnt
+                FROM dbo.[hiring_agg] a
+                WHERE a.hire_year = :year
+                GROUP BY a.hire_quarter
+            """), {"year": year}).mappings().all()
+        where, quarter, params = _year_filter(db, year)
+        return db.execute(text(f"""
+                SELECT {quarter} AS quarter, COUNT(1) AS cnt
+                FROM dbo.[hired_employees] he
+                WHERE {where}
+                GROUP BY {quarter}
+            """), params).mappings().all()
+
+    async def _compute():
+        if columnar_store is not None:
+            return await _columnar(db, "hires_summary", year)
+        rows = await run_db(_query)
 
         s = {"year": year, "q1": 0, "q2": 0, "q3": 0, "q4": 0, "total": 0}
         for r in rows:
@@ -123,6 +279,262 @@ async def hires_summary(
         s["total"] = s["q1"] + s["q2"] + s["q3"] + s["q4"]
         return s
 
+    try:
+        return await _cached("hires-summary", year, _compute)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
 
+
+
+# ---------------------------------------------------------------------------
+# Rangos de varios años / fechas en una sola consulta agrupada
+# ---------------------------------------------------------------------------
+GRANULARITIES = {"year": 1, "quarter": 4, "month": 12}
+MAX_RANGE_BUCKETS = 600
+
+# group_by -> [(nombre, columna agrupada, JOIN sobre la tabla {t})]
+RANGE_GROUPS = {
+    "none": [],
+    "department": [("department", "d.name", "JOIN dbo.[departments] d ON {t}.department_id = d.id")],
+    "job": [("job", "j.name", "JOIN dbo.[jobs] j ON {t}.job_id = j.id")],
+    "department_job": [
+        ("department", "d.name", "JOIN dbo.[departments] d ON {t}.department_id = d.id"),
+        ("job", "j.name", "JOIN dbo.[jobs] j ON {t}.job_id = j.id"),
+    ],
+}
+
+
+def _bucket_index(d: date, granularity: str) -> int:
+    if granularity == "year":
+        return d.year
+    if granularity == "quarter":
+        return d.year * 4 + (d.month - 1) // 3
+    return d.year * 12 + d.month - 1
+
+
+def _bucket_label(i: int, granularity: str) -> str:
+    if granularity == "year":
+        return str(i)
+    if granularity == "quarter":
+        return f"{i // 4}-Q{i % 4 + 1}"
+    return f"{i // 12}-{i % 12 + 1:02d}"
+
+
+def _quarter_start(d: date) -> bool:
+    return d.day == 1 and d.month in (1, 4, 7, 10)
+
+
+def _resolve_range(year_from: Optional[int], year_to: Optional[int],
+                   date_from: Optional[date], date_to: Optional[date]) -> Tuple[date, date]:
+    """[desde, hasta) a partir de year_from/year_to o de date_from/date_to (inclusivos)."""
+    if date_from is not None or date_to is not None:
+        if date_from is None or date_to is None:
+            raise HTTPException(status_code=400, detail="date_from y date_to van juntos")
+        if year_from is not None or year_to is not None:
+            raise HTTPException(status_code=400, detail="Use year_from/year_to o date_from/date_to, no ambos")
+        desde, hasta = date_from, date_to + timedelta(days=1)
+    elif year_from is not None:
+        desde, hasta = date(year_from, 1, 1), date((year_to or year_from) + 1, 1, 1)
+    else:
+        raise HTTPException(status_code=400, detail="Indique year_from (y opcional year_to) o date_from y date_to")
+    if hasta <= desde:
+        raise HTTPException(status_code=400, detail="El rango está vacío (fin anterior al inicio)")
+    return desde, hasta
+
+
+def _range_sql(db: Session, desde: date, hasta: date, granularity: str, group_by: str) -> Tuple[str, Dict[str, Any]]:
+    """
+    Una sola consulta: (grupos..., año, periodo, cnt) para todo el rango.
+    hiring_agg si el rango cae en trimestres completos; si no, hire_dt tipado
+    o, sin migración, la conversión del NVARCHAR original.
+    """
+    groups = RANGE_GROUPS[group_by]
+    use_agg = granularity != "month" and _quarter_start(desde) and _quarter_start(hasta) and _hiring_agg(db)
+    if use_agg:
+        t, source, count = "a", "dbo.[hiring_agg] a", "SUM(a.hires)"
+        year_e, period_e = "a.hire_year", ("0" if granularity == "year" else "a.hire_quarter")
+        where = ("a.hire_year BETWEEN :ylo AND :yhi "
+                 "AND a.hire_year * 4 + a.hire_quarter - 1 >= :qlo AND a.hire_year * 4 + a.hire_quarter - 1 < :qhi")
+        params = {"ylo": desde.year, "yhi": hasta.year,
+                  "qlo": _bucket_index(desde, "quarter"), "qhi": _bucket_index(hasta, "quarter")}
+    else:
+        t, count = "he", "COUNT(1)"
+        if _typed_dates(db):
+            source, dt = "dbo.[hired_employees] he", "he.hire_dt"
+        else:
+            source = f"dbo.[hired_employees] he CROSS APPLY (SELECT {PARSE_HIRE_DT.format(col='he.[datetime]')} AS dt) c"
+            dt = "c.dt"
+        year_e = f"YEAR({dt})"
+        period_e = {"year": "0", "quarter": f"DATEPART(QUARTER, {dt})", "month": f"MONTH({dt})"}[granularity]
+        where = f"{dt} >= :desde AND {dt} < :hasta"
+        params = {"desde": datetime(desde.year, desde.month, desde.day),
+                  "hasta": datetime(hasta.year, hasta.month, hasta.day)}
+
+    joins = " ".join(join.format(t=t) for _, _, join in groups)
+    cols = "".join(f"{col} AS {name}, " for name, col, _ in groups)
+    group_cols = "".join(f"{col}, " for _, col, _ in groups)
+    # Una constante en GROUP BY es inválida en SQL Server (error 164): con year el
+    # periodo 0 va solo en el SELECT
+    group_period = "" if granularity == "year" else f", {period_e}"
+    return f"""
+        SELECT {cols}{year_e} AS y, {period_e} AS p, {count} AS cnt
+        FROM {source} {joins}
+        WHERE {where}
+        GROUP BY {group_cols}{year_e}{group_period}
+    """, params
+
+
+def range_payload(rows: List[tuple], desde: date, hasta: date, granularity: str, group_by: str) -> Dict[str, Any]:
+    """
+    Resultado en columnas: la lista de buckets del rango (densa, también los
+    vacíos) y una serie de conteos por grupo alineada con ella.
+    """
+    per_year = GRANULARITIES[granularity]
+    lo = _bucket_index(desde, granularity)
+    hi = _bucket_index(hasta - timedelta(days=1), granularity)
+    width = len(RANGE_GROUPS[group_by])
+
+    series: Dict[tuple, List[int]] = {}
+    for r in rows:
+        key, y, p, cnt = tuple(r[:width]), int(r[width]), int(r[width + 1]), int(r[width + 2])
+        i = y * per_year + (p - 1 if per_year > 1 else 0) - lo
+        if 0 <= i <= hi - lo:
+            series.setdefault(key, [0] * (hi - lo + 1))[i] += cnt
+
+    groups = sorted(series)
+    out: Dict[str, Any] = {
+        "granularity": granularity,
+        "from": desde.isoformat(),
+        "to": (hasta - timedelta(days=1)).isoformat(),
+        "buckets": [_bucket_label(i, granularity) for i in range(lo, hi + 1)],
+        "group_by": group_by,
+    }
+    if width:
+        out["groups"] = [list(g) if width > 1 else g[0] for g in groups]
+        out["hires"] = [series[g] for g in groups]
+    else:
+        out["hires"] = series.get((), [0] * (hi - lo + 1))
+    out["total"] = sum(sum(v) for v in series.values())
+    return out
+
+
+@router.get("/hires-range")
+async def hires_range(
+    year_from: Optional[int] = Query(None, ge=1900, le=2999, description="Primer año (inclusive)"),
+    year_to: Optional[int] = Query(None, ge=1900, le=2999, description="Último año (inclusive); por defecto year_from"),
+    date_from: Optional[date] = Query(None, description="Inicio (inclusive), alternativa a year_from"),
+    date_to: Optional[date] = Query(None, description="Fin (inclusive)"),
+    granularity: str = Query("quarter", pattern="^(year|quarter|month)$"),
+    group_by: str = Query("none", pattern="^(none|department|job|department_job)$"),
+    db: Session = Depends(get_db),
+    user: str = Depends(get_current_user)
+):
+    """
+    Contrataciones de varios años o de un rango de fechas en una sola consulta,
+    por año / trimestre / mes y opcionalmente por departamento y/o cargo.
+    Devuelve columnas: buckets + una serie de conteos por grupo.
+    """
+    desde, hasta = _resolve_range(year_from, year_to, date_from, date_to)
+    n_buckets = _bucket_index(hasta - timedelta(days=1), granularity) - _bucket_index(desde, granularity) + 1
+    if n_buckets > MAX_RANGE_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"Máximo {MAX_RANGE_BUCKETS} buckets por consulta ({n_buckets} pedidos)")
+
+    def _query():
+        sql, params = _range_sql(db, desde, hasta, granularity, group_by)
+        return db.execute(text(sql), params).all()
+
+    async def _compute():
+        if columnar_store is not None and granularity != "month" and _quarter_start(desde) and _quarter_start(hasta):
+            rows = await _columnar(db, "hires_range", desde, hasta, granularity, group_by)
+        else:
+            rows = await run_db(_query)
+        return range_payload(rows, desde, hasta, granularity, group_by)
+
+    try:
+        return await _cached("hires-range", (desde, hasta, granularity, group_by), _compute)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
+
+
+# ---------------------------------------------------------------------------
+# Agregación genérica: dimensiones / filtros / métricas de lista blanca
+# ---------------------------------------------------------------------------
+def _csv_choice(value: str, allowed: Tuple[str, ...], what: str) -> Tuple[str, ...]:
+    items = tuple(dict.fromkeys(v.strip().lower() for v in value.split(",") if v.strip()))
+    bad = [v for v in items if v not in allowed]
+    if bad:
+        raise HTTPException(status_code=400, detail=f"{what} no soportadas: {', '.join(bad)} (válidas: {', '.join(allowed)})")
+    return items
+
+
+@router.get("/aggregate")
+async def aggregate(
+    dims: str = Query("year", description="Dimensiones separadas por coma: department, job, year, quarter, month"),
+    metrics: str = Query("hires", description="Métricas separadas por coma: hires, departments, jobs"),
+    year_from: Optional[int] = Query(None, ge=1900, le=2999),
+    year_to: Optional[int] = Query(None, ge=1900, le=2999),
+    date_from: Optional[date] = Query(None),
+    date_to: Optional[date] = Query(None),
+    department_id: Optional[List[int]] = Query(None, description="Filtro; se puede repetir"),
+    job_id: Optional[List[int]] = Query(None, description="Filtro; se puede repetir"),
+    limit: int = Query(10000, ge=1, le=100000, description="Máximo de filas del resultado"),
+    db: Session = Depends(get_db),
+    user: str = Depends(get_current_user)
+):
+    """
+    Una sola consulta GROUP BY compilada a partir de la petición (ver aggregate.py).
+    Devuelve columnas: una lista por dimensión y por métrica.
+    """
+    dim_list = _csv_choice(dims, DIMENSIONS, "Dimensiones")
+    metric_list = _csv_choice(metrics, METRICS, "Métricas")
+    if not metric_list:
+        raise HTTPException(status_code=400, detail="Indique al menos una métrica")
+    has_range = any(v is not None for v in (year_from, year_to, date_from, date_to))
+    desde, hasta = _resolve_range(year_from, year_to, date_from, date_to) if has_range else (None, None)
+    departments = tuple(sorted(set(department_id))) if department_id else ()
+    jobs = tuple(sorted(set(job_id))) if job_id else ()
+
+    def _query():
+        if ("month" not in dim_list and (not has_range or (_quarter_start(desde) and _quarter_start(hasta)))
+                and _hiring_agg(db)):
+            source = "agg"
+        else:
+            source = "typed" if _typed_dates(db) else "raw"
+        stmt = compile_aggregate(source, dim_list, metric_list, has_range, bool(departments), bool(jobs))
+
+        params: Dict[str, Any] = {"limit": limit + 1}
+        if has_range and source == "agg":
+            params.update(ylo=desde.year, yhi=hasta.year,
+                          qlo=_bucket_index(desde, "quarter"), qhi=_bucket_index(hasta, "quarter"))
+        elif has_range:
+            params.update(desde=datetime(desde.year, desde.month, desde.day),
+                          hasta=datetime(hasta.year, hasta.month, hasta.day))
+        if departments:
+            params["department_ids"] = list(departments)
+        if jobs:
+            params["job_ids"] = list(jobs)
+        return source, db.execute(stmt, params).all()
+
+    async def _compute():
+        source, rows = await run_db(_query)
+        truncated = len(rows) > limit
+        rows = rows[:limit]
+        names = dim_list + metric_list
+        return {
+            "dimensions": list(dim_list),
+            "metrics": list(metric_list),
+            "source": source,
+            "rows": len(rows),
+            "truncated": truncated,
+            "columns": {name: [r[i] for r in rows] for i, name in enumerate(names)},
+        }
+
+    shape = (dim_list, metric_list, desde, hasta, departments, jobs, limit)
+    try:
+        return await _cached("aggregate", shape, _compute)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
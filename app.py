@@ -2,91 +2,90 @@
 # FastAPI para ingesta/consulta en línea con SQL Server + JWT (versión final estable)
 
 import os
+import csv
+import base64
+import json
+import queue
 import logging
 import traceback
-from datetime import datetime, timedelta
+from contextlib import asynccontextmanager
 from pathlib import Path
 from typing import List, Optional
 
-from fastapi import FastAPI, Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from jose import jwt, JWTError
-from pydantic import BaseModel, Field, field_validator
-from sqlalchemy import create_engine, text, event
-from sqlalchemy.engine import Engine
-from sqlalchemy.orm import sessionmaker, Session
-from dotenv import load_dotenv
-from urllib.parse import quote_plus
-from passlib.context import CryptContext
-
-
-ENV_PATH = Path(__file__).parent / ".env"
-load_dotenv(dotenv_path=ENV_PATH, override=True)
-
-SERVER   = os.getenv("SERVER", ".")
-DATABASE = os.getenv("DATABASE", "Prueba_Sep")
-USERNAME = os.getenv("USERNAME", "sa")
-PASSWORD = os.getenv("PASSWORD", "123")
-DRIVER   = (os.getenv("DRIVER") or "ODBC Driver 18 for SQL Server").replace("+", " ")
-ENCRYPT  = os.getenv("ENCRYPT", "no")
-TRUST    = os.getenv("TRUST_SERVER_CERT", "yes")
-TIMEOUT  = os.getenv("CONNECTION_TIMEOUT", "30")
-
-SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret-change-me-in-production")
-ALGORITHM  = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "60"))
-
-API_USER = os.getenv("API_USER", "admin")
-API_PASS = os.getenv("API_PASS", "admin123")
-pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
-API_PASS_HASH = pwd_context.hash(API_PASS) if API_PASS else pwd_context.hash("admin123")
-
-logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
-logger = logging.getLogger(__name__)
-logger.info(
-    "DB target => server='%s', db='%s', user='%s', driver='%s', encrypt='%s', trust='%s'",
-    SERVER, DATABASE, USERNAME, DRIVER, ENCRYPT, TRUST
+import anyio
+from fastapi import APIRouter, FastAPI, Depends, File, Header, HTTPException, Query, Request, Response, UploadFile, status
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.security import OAuth2PasswordRequestForm
+from starlette.concurrency import iterate_in_threadpool
+from pydantic import BaseModel, Field, ValidationError, field_validator
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+import deps
+from deps import (
+    API_USER, SessionLocal, db_slot, get_engine, get_db, run_db, pool_config, slow_queries,
+    authenticate_user, create_access_token, get_current_user, token_cache,
+)
+from aggregate import plan_cache_stats
+from analytics import ANALYTICS_BACKEND, analytics_cache, columnar_store, router as analytics_router
+from dates import to_iso_many, to_iso_safely as _to_iso_safely
+from etag import conditional_get
+from export import MEDIA_TYPES, stream_table
+from group_commit import GroupCommitWriter
+from health import HEALTHY, STALE, HealthProbe
+from idempotency import IdempotencyStore, IN_PROGRESS, MISMATCH, REPLAY, fingerprint
+from metrics import API_ROWS, RouteMetricsMiddleware, gauge_lines, pool_metrics, render_prometheus
+from serialization import CompressionMiddleware, FastJSONResponse
+from validators import INT_MAX, ReferenceCache, validate_employee_batch
+from ingest import (
+    EMPLOYEE_COLUMNS, FILE_FORMATS,
+    ingest_employees_bulk, ingest_catalog_bulk, iter_file_batches,
 )
 
 
-def build_engine() -> Engine:
-    odbc = (
-        f"DRIVER={{{DRIVER}}};"
-        f"SERVER={SERVER};"
-        f"DATABASE={DATABASE};"
-        f"UID={USERNAME};"
-        f"PWD={PASSWORD};"
-        f"Encrypt={ENCRYPT};"
-        f"TrustServerCertificate={TRUST};"
-        f"Connection Timeout={TIMEOUT};"
-    )
-    url = f"mssql+pyodbc:///?odbc_connect={quote_plus(odbc)}"
-    eng = create_engine(url, pool_pre_ping=True, future=True)
+# Ingesta en streaming: filas por lote interno y tope de memoria por línea
+INGEST_STREAM_BATCH     = int(os.getenv("INGEST_STREAM_BATCH", "5000"))
+INGEST_STREAM_MAX_LINE  = 1024 * 1024
+INGEST_MAX_BATCH_ERRORS = 100
 
-    @event.listens_for(eng, "before_cursor_execute")
-    def _fast_execmany(conn, cursor, statement, parameters, context, executemany):
-        if executemany and hasattr(cursor, "fast_executemany"):
-            cursor.fast_executemany = True
+# Exportación en streaming: filas por fetchmany
+EXPORT_CHUNK = int(os.getenv("EXPORT_CHUNK", "5000"))
 
-    return eng
+# Ingesta asíncrona (Prefer: respond-async): ventana de group commit
+INGEST_GROUP_MAX_ROWS = int(os.getenv("INGEST_GROUP_MAX_ROWS", "5000"))
+INGEST_GROUP_MAX_WAIT = float(os.getenv("INGEST_GROUP_MAX_WAIT_MS", "50")) / 1000.0
 
-engine: Engine = build_engine()
-SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
+# Sonda de salud en segundo plano (segundos)
+HEALTH_PROBE_INTERVAL = float(os.getenv("HEALTH_PROBE_INTERVAL", "5"))
+HEALTH_STALE_AFTER    = float(os.getenv("HEALTH_STALE_AFTER", str(3 * HEALTH_PROBE_INTERVAL)))
 
-def get_db():
-    db: Session = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Cache de ids de departments/jobs para la validación referencial previa
+REF_CACHE_TTL = float(os.getenv("REF_CACHE_TTL", "60"))
+
+# Idempotency-Key: respuestas de ingesta recordadas (en memoria del proceso)
+IDEMPOTENCY_TTL         = float(os.getenv("IDEMPOTENCY_TTL", "86400"))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+logger = logging.getLogger(__name__)
+
+# Solo guardan la fábrica de sesiones: no abren conexiones hasta el primer uso
+ingest_writer = GroupCommitWriter(
+    SessionLocal,
+    max_rows=INGEST_GROUP_MAX_ROWS,
+    max_wait=INGEST_GROUP_MAX_WAIT,
+)
+
+reference_cache = ReferenceCache(SessionLocal, ttl=REF_CACHE_TTL)
+idempotency_store = IdempotencyStore(ttl=IDEMPOTENCY_TTL, max_entries=IDEMPOTENCY_MAX_ENTRIES)
 
 
 class Department(BaseModel):
-    id: int = Field(..., gt=0)
+    id: int = Field(..., gt=0, le=INT_MAX)
     name: str = Field(..., min_length=1, max_length=255)
 
 class Job(BaseModel):
-    id: int = Field(..., gt=0)
+    id: int = Field(..., gt=0, le=INT_MAX)
     name: str = Field(..., min_length=1, max_length=255)
 
 class HiredEmployeeCreate(BaseModel):
@@ -110,72 +109,82 @@ class HiredEmployeeResponse(BaseModel):
     department_id: Optional[int] = None
     job_id: Optional[int] = None
 
+class IngestJobStatus(BaseModel):
+    job_id: str
+    table: str
+    status: str  # queued | running | done | failed
+    received: int
+    inserted: int
+    duplicates: int
+    errors: List[str] = Field(default_factory=list)
+    created_at: str
+    finished_at: Optional[str] = None
+
 class Token(BaseModel):
     access_token: str
     token_type: str
 
 class BatchResponse(BaseModel):
     inserted: int
+    updated: int = 0
     duplicates: int = 0
     errors: List[str] = Field(default_factory=list)
 
+class StreamBatchSummary(BaseModel):
+    batch: int
+    received: int
+    inserted: int
+    updated: int = 0
+    duplicates: int = 0
+    errors: List[str] = Field(default_factory=list)
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
-
-def verify_password(plain: str, hashed: str) -> bool:
-    return pwd_context.verify(plain, hashed)
-
-def authenticate_user(username: str, password: str) -> bool:
-    if username != API_USER:
-        return False
-    return verify_password(password, API_PASS_HASH)
+class StreamIngestResponse(BaseModel):
+    received: int
+    inserted: int
+    duplicates: int
+    errors: int
+    updated: int = 0
+    batches: List[StreamBatchSummary] = Field(default_factory=list)
+    aborted: Optional[str] = None
 
-def create_access_token(subject: str, expires_minutes: int = ACCESS_TOKEN_EXPIRE_MINUTES) -> str:
-    expire = datetime.utcnow() + timedelta(minutes=expires_minutes)
-    to_encode = {"sub": subject, "exp": expire}
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-async def get_current_user(token: str = Depends(oauth2_scheme)) -> str:
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Token inválido o expirado",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        sub: str = payload.get("sub")
-        if sub is None or sub != API_USER:
-            raise credentials_exception
-        return sub
-    except JWTError:
-        raise credentials_exception
-
-
-app = FastAPI(
-    title="API PoC - Migración de Datos",
-    version="1.0.0",
-    description="API para ingesta y consulta de datos históricos"
-)
+# Rutas propias de app.py; create_app() las registra junto con los demás routers
+router = APIRouter()
 
-@app.get("/")
+@router.get("/")
 async def root():
     return {"message": "API de Migración de Datos", "version": "1.0.0"}
 
-@app.get("/health")
-async def health():
-    try:
-        with engine.connect() as conn:
-            conn.exec_driver_sql("SELECT 1")
-        return {"status": "healthy", "database": "connected"}
-    except Exception as e:
+def _ping_db() -> None:
+    # Conexión propia (deps.get_probe_engine): no espera turno en el pool compartido
+    with deps.get_probe_engine().connect() as conn:
+        conn.exec_driver_sql("SELECT 1")
+
+health_probe = HealthProbe(_ping_db, interval=HEALTH_PROBE_INTERVAL, stale_after=HEALTH_STALE_AFTER)
+
+@router.get("/health")
+async def health(deep: bool = Query(False, description="Sonda inmediata contra la BD en lugar del estado cacheado")):
+    """
+    Estado de la BD según la sonda en segundo plano (respuesta desde memoria).
+    Con deep=true se hace un SELECT 1 en el momento y se actualiza el estado.
+    """
+    snap = await run_db(health_probe.probe) if deep else health_probe.snapshot()
+    if snap["status"] != HEALTHY:
+        if snap["age_s"] is None:
+            reason = "sonda aún no ejecutada"
+        else:
+            reason = f"última sonda hace {snap['age_s']}s" if snap["status"] == STALE else snap["error"]
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail=f"Error de conexión a la base de datos: {str(e)}"
+            detail=f"Error de conexión a la base de datos ({snap['status']}): {reason}"
         )
+    return {"status": "healthy", "database": "connected", **{k: snap[k] for k in ("latency_ms", "checked_at", "age_s")}}
 
-@app.post("/login", response_model=Token)
+@router.post("/login", response_model=Token)
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    if not authenticate_user(form_data.username, form_data.password):
+    # pbkdf2 es CPU intensivo: fuera del event loop
+    ok = await anyio.to_thread.run_sync(authenticate_user, form_data.username, form_data.password)
+    if not ok:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Credenciales inválidas",
@@ -184,100 +193,254 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     token = create_access_token(subject=API_USER)
     return {"access_token": token, "token_type": "bearer"}
 
-
-def _to_iso_safely(val) -> Optional[str]:
-    """Devuelve ISO-8601 o None para cualquier valor de fecha extraño."""
+@router.get("/metrics/auth")
+async def auth_metrics(user: str = Depends(get_current_user)):
+    """Aciertos / fallos de la cache de tokens verificados."""
+    return token_cache.stats()
+
+@router.get("/metrics/analytics-cache")
+async def analytics_cache_metrics(user: str = Depends(get_current_user)):
+    """Aciertos / fallos / invalidaciones de la cache de resultados de analytics y de sentencias compiladas."""
+    stats = {**analytics_cache.stats(), "backend": ANALYTICS_BACKEND, "plans": plan_cache_stats()}
+    if columnar_store is not None:
+        stats["columnar"] = columnar_store.stats()
+    return stats
+
+@router.get("/metrics/pool")
+async def pool_metrics_view(user: str = Depends(get_current_user)):
+    """
+    Estado del pool de conexiones: en uso, overflow, histograma de espera por
+    conexión (ms) y rotación de conexiones (abiertas / cerradas / invalidadas).
+    """
+    return {"config": pool_config(), **pool_metrics.snapshot(get_engine())}
+
+@router.get("/admin/slow-queries")
+async def list_slow_queries(
+    limit: int = Query(50, ge=1, le=1000),
+    user: str = Depends(get_current_user),
+):
+    """Consultas lentas recientes (la más nueva primero), con plan estimado si está activado."""
+    return {
+        "threshold_ms": slow_queries.threshold_ms,
+        "capture_plans": slow_queries.capture_plans,
+        "total": slow_queries.total,
+        "queries": slow_queries.recent(limit),
+    }
+
+@router.delete("/admin/slow-queries", status_code=204)
+async def clear_slow_queries(user: str = Depends(get_current_user)):
+    slow_queries.clear()
+    return Response(status_code=204)
+
+@router.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """
+    Métricas en formato de texto de Prometheus (sin auth, para el scraper):
+    latencia por ruta, duración de consultas por huella, filas, ingesta, pool y cache de tokens.
+    """
+    extra = pool_metrics.prometheus_lines(get_engine())
+    auth = token_cache.stats()
+    extra += gauge_lines("auth_token_cache_size", "Tokens verificados en cache", auth["size"])
+    extra += [
+        "# HELP auth_token_cache_requests_total Búsquedas en la cache de tokens",
+        "# TYPE auth_token_cache_requests_total counter",
+        f'auth_token_cache_requests_total{{result="hit"}} {auth["hits"]}',
+        f'auth_token_cache_requests_total{{result="miss"}} {auth["misses"]}',
+    ]
+    probe = health_probe.snapshot()
+    if columnar_store is not None:
+        col = columnar_store.stats()
+        extra += gauge_lines("analytics_columnar_rows", "Filas de hired_employees en el backend columnar", col["rows"])
+        extra += gauge_lines("analytics_columnar_bytes", "Memoria de las columnas del backend columnar", col["bytes"])
+    extra += gauge_lines("db_up", "1 si la última sonda de salud fue exitosa", int(probe["status"] == HEALTHY))
+    if probe["latency_ms"] is not None:
+        extra += gauge_lines("db_probe_latency_seconds", "Latencia de la última sonda SELECT 1", probe["latency_ms"] / 1000.0)
+    return Response(render_prometheus(extra), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def _encode_cursor(last_id: int) -> str:
+    return base64.urlsafe_b64encode(f"id:{last_id}".encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str) -> int:
     try:
-        if isinstance(val, datetime):
-            return val.isoformat()
-        if isinstance(val, str):
-            try:
-                return datetime.fromisoformat(val.replace('Z', '+00:00')).isoformat()
-            except Exception:
-                pass
-            try:
-                import pandas as pd  # opcional; solo si está instalado
-                ts = pd.to_datetime(val, errors="coerce", utc=False)
-                if pd.isna(ts):
-                    return None
-                return ts.to_pydatetime().isoformat()
-            except Exception:
-                return None
-        return None
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        prefix, value = raw.split(":", 1)
+        if prefix != "id":
+            raise ValueError(prefix)
+        return int(value)
     except Exception:
-        return None
-
-
-@app.get("/departments", response_model=List[Department])
+        raise HTTPException(status_code=400, detail="Cursor de paginación inválido")
+
+def _page_query(db: Session, table: str, columns: str, skip: int, limit: int, after_id: Optional[int]):
+    """
+    Keyset (after_id): seek por PK, coste constante sin importar la profundidad.
+    OFFSET (skip) se mantiene solo por compatibilidad: coste lineal en skip.
+    """
+    if after_id is not None:
+        sql = f"""SELECT TOP (:limit) {columns} FROM dbo.[{table}]
+                  WHERE id > :after_id ORDER BY id"""
+        params = {"limit": limit, "after_id": after_id}
+    else:
+        sql = f"""SELECT {columns} FROM dbo.[{table}]
+                  ORDER BY id OFFSET :skip ROWS FETCH NEXT :limit ROWS ONLY"""
+        params = {"skip": skip, "limit": limit}
+    rows = db.execute(text(sql), params).mappings().all()
+    API_ROWS.inc((table, "page"), len(rows))
+    return rows
+
+def _set_next_cursor(response: Response, rows, limit: int) -> None:
+    """Página llena => puede haber más: X-Next-Cursor con el último id devuelto."""
+    if rows and len(rows) >= limit:
+        response.headers["X-Next-Cursor"] = _encode_cursor(rows[-1]["id"])
+
+def _json_rows(response: Response, rows: List[dict]) -> FastJSONResponse:
+    """
+    Filas de la BD (tipos JSON ya conocidos) serializadas directamente:
+    sin re-validar contra response_model, que queda solo para OpenAPI.
+    """
+    headers = {k: v for k, v in response.headers.items() if k not in ("content-length", "content-type")}
+    return FastJSONResponse(rows, headers=headers)
+
+def _resolve_after_id(after_id: Optional[int], cursor: Optional[str]) -> Optional[int]:
+    return _decode_cursor(cursor) if cursor else after_id
+
+_AFTER_ID = Query(None, description="Keyset: devolver filas con id > after_id")
+_CURSOR   = Query(None, description="Token opaco de X-Next-Cursor de la página anterior")
+
+@router.get("/departments", response_model=List[Department])
 async def list_departments(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    after_id: Optional[int] = _AFTER_ID,
+    cursor: Optional[str] = _CURSOR,
+    user: str = Depends(get_current_user),
+    _etag: None = Depends(conditional_get("departments")),
     db: Session = Depends(get_db),
-    user: str = Depends(get_current_user)
 ):
-    rows = db.execute(
-        text("""SELECT id, name FROM dbo.[departments]
-                ORDER BY id OFFSET :skip ROWS FETCH NEXT :limit ROWS ONLY"""),
-        {"skip": skip, "limit": limit}
-    ).mappings().all()
-    return list(rows)
-
-@app.get("/jobs", response_model=List[Job])
+    after = _resolve_after_id(after_id, cursor)
+    rows = await run_db(_page_query, db, "departments", "id, name", skip, limit, after)
+    _set_next_cursor(response, rows, limit)
+    return _json_rows(response, [dict(r) for r in rows])
+
+@router.get("/jobs", response_model=List[Job])
 async def list_jobs(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    after_id: Optional[int] = _AFTER_ID,
+    cursor: Optional[str] = _CURSOR,
+    user: str = Depends(get_current_user),
+    _etag: None = Depends(conditional_get("jobs")),
     db: Session = Depends(get_db),
-    user: str = Depends(get_current_user)
 ):
-    rows = db.execute(
-        text("""SELECT id, name FROM dbo.[jobs]
-                ORDER BY id OFFSET :skip ROWS FETCH NEXT :limit ROWS ONLY"""),
-        {"skip": skip, "limit": limit}
-    ).mappings().all()
-    return list(rows)
-
-@app.get("/employees", response_model=List[HiredEmployeeResponse])
+    after = _resolve_after_id(after_id, cursor)
+    rows = await run_db(_page_query, db, "jobs", "id, name", skip, limit, after)
+    _set_next_cursor(response, rows, limit)
+    return _json_rows(response, [dict(r) for r in rows])
+
+@router.get("/employees", response_model=List[HiredEmployeeResponse])
 async def list_employees(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    after_id: Optional[int] = _AFTER_ID,
+    cursor: Optional[str] = _CURSOR,
     db: Session = Depends(get_db),
     user: str = Depends(get_current_user)
 ):
-    try:
-        rows = db.execute(
-            text("""
-                SELECT id, name, [datetime], department_id, job_id
-                FROM dbo.[hired_employees]
-                ORDER BY id OFFSET :skip ROWS FETCH NEXT :limit ROWS ONLY
-            """),
-            {"skip": skip, "limit": limit}
-        ).mappings().all()
+    after = _resolve_after_id(after_id, cursor)
+    columns = "id, name, [datetime], department_id, job_id"
 
-        out = []
-        for r in rows:
-            out.append({
-                "id": r.get("id"),
-                "name": r.get("name"),
-                "datetime": _to_iso_safely(r.get("datetime")),
-                "department_id": r.get("department_id"),
-                "job_id": r.get("job_id"),
-            })
-        return out
+    def _query():
+        rows = _page_query(db, "hired_employees", columns, skip, limit, after)
+        # Fechas de toda la página en una sola conversión vectorizada
+        return _iso_chunk([dict(r) for r in rows])
+
+    try:
+        out = await run_db(_query)
+        _set_next_cursor(response, out, limit)
+        return _json_rows(response, out)
 
     except Exception as e:
         logger.error("Error en /employees: %s", e)
         logger.debug("Traceback:\n%s", traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"/employees error: {str(e)}")
 
-@app.get("/employees/_diag")
+_EXPORT_FORMAT = Query("ndjson", pattern="^(ndjson|csv|arrow)$", description="ndjson | csv | arrow (Arrow IPC stream)")
+_EXPORT_CHUNK  = Query(EXPORT_CHUNK, ge=100, le=100000, description="Filas por fetchmany")
+_EXPORT_EXT    = {"ndjson": "ndjson", "csv": "csv", "arrow": "arrows"}
+
+def _iso_chunk(rows: List[dict]) -> List[dict]:
+    for r, iso in zip(rows, to_iso_many([r["datetime"] for r in rows])):
+        r["datetime"] = iso
+    return rows
+
+def _export_response(table: str, fmt: str, chunk_size: int, convert=None) -> StreamingResponse:
+    """Respuesta chunked con la tabla completa; la conexión (y su hueco de DB_THREADS) vive lo que dura el stream."""
+    if fmt == "arrow":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise HTTPException(status_code=406, detail="Formato arrow no disponible: falta pyarrow")
+
+    def _counted(rows):
+        API_ROWS.inc((table, "export"), len(rows))
+        return convert(rows) if convert is not None else rows
+
+    async def _body():
+        # La conexión del cursor cuenta contra DB_THREADS como cualquier run_db
+        stream = stream_table(get_engine(), table, fmt, chunk_size, _counted)
+        async with db_slot():
+            try:
+                async for data in iterate_in_threadpool(stream):
+                    yield data
+            finally:
+                with anyio.CancelScope(shield=True):
+                    await anyio.to_thread.run_sync(stream.close)
+
+    return StreamingResponse(
+        _body(),
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{table}.{_EXPORT_EXT[fmt]}"'},
+    )
+
+@router.get("/employees/export")
+async def export_employees(
+    format: str = _EXPORT_FORMAT,
+    chunk_size: int = _EXPORT_CHUNK,
+    user: str = Depends(get_current_user)
+):
+    return _export_response("hired_employees", format, chunk_size, _iso_chunk)
+
+@router.get("/departments/export")
+async def export_departments(
+    format: str = _EXPORT_FORMAT,
+    chunk_size: int = _EXPORT_CHUNK,
+    user: str = Depends(get_current_user)
+):
+    return _export_response("departments", format, chunk_size)
+
+@router.get("/jobs/export")
+async def export_jobs(
+    format: str = _EXPORT_FORMAT,
+    chunk_size: int = _EXPORT_CHUNK,
+    user: str = Depends(get_current_user)
+):
+    return _export_response("jobs", format, chunk_size)
+
+@router.get("/employees/_diag")
 async def employees_diag(
     db: Session = Depends(get_db),
     user: str = Depends(get_current_user)
 ):
-    try:
-        rows = db.execute(
+    def _query():
+        return db.execute(
             text("SELECT TOP 3 id, name, [datetime], department_id, job_id FROM dbo.[hired_employees] ORDER BY id")
         ).mappings().all()
+
+    try:
+        rows = await run_db(_query)
         sample = []
         for r in rows:
             dt = r.get("datetime")
@@ -295,9 +458,11 @@ async def employees_diag(
         raise HTTPException(status_code=500, detail=f"/employees/_diag error: {str(e)}")
 
 
-@app.post("/ingest/employees", response_model=BatchResponse)
+@router.post("/ingest/employees", response_model=BatchResponse)
 async def ingest_employees(
     employees: List[HiredEmployeeCreate],
+    prefer: Optional[str] = Header(None, description="respond-async: encolar y devolver 202 con job id"),
+    idempotency_key: Optional[str] = Header(None, max_length=255, description="Reintentos seguros: misma clave = misma respuesta"),
     db: Session = Depends(get_db),
     user: str = Depends(get_current_user)
 ):
@@ -306,121 +471,332 @@ async def ingest_employees(
     if len(employees) > 1000:
         raise HTTPException(status_code=400, detail="Máximo 1000 registros por lote")
 
-    stmt = text("""
-        INSERT INTO dbo.[hired_employees]
-        (id, name, [datetime], department_id, job_id)
-        VALUES (:id, :name, :datetime, :department_id, :job_id)
-    """)
+    rows = [e.model_dump() for e in employees]
 
-    inserted = 0
-    duplicates = 0
-    errors: List[str] = []
+    async def _handle():
+        try:
+            if _wants_async(prefer):
+                valid, errors = await run_db(validate_employee_batch, rows, reference_cache)
+            else:
+                res = await run_db(_write_employees, db, rows)
+        except Exception as e:
+            logger.error("Error en /ingest/employees: %s", e)
+            logger.debug("Traceback:\n%s", traceback.format_exc())
+            raise HTTPException(status_code=500, detail=f"/ingest/employees error: {str(e)}")
+        if _wants_async(prefer):
+            return _enqueue_ingest("hired_employees", valid, errors)
+        return BatchResponse(**res)
+
+    scope = (user, "hired_employees", _wants_async(prefer))
+    return await _with_idempotency(idempotency_key, scope, rows, _handle)
+
+def _write_employees(db: Session, rows: List[dict]) -> dict:
+    """
+    Pre-chequeo vectorizado (reglas de validators.py, incluida la integridad
+    referencial contra reference_cache) y luego la ruta set-based de ingest.py.
+    Las filas malas no llegan a la BD.
+    """
+    valid, errors = validate_employee_batch(rows, reference_cache)
+    res = ingest_employees_bulk(db, valid) if valid else {"inserted": 0, "duplicates": 0, "errors": []}
+    res["errors"] = errors + res["errors"]
+    return res
+
+async def _with_idempotency(idem_key: Optional[str], scope: tuple, payload, handler):
+    """
+    Ejecuta handler() una sola vez por Idempotency-Key: los reintentos con la
+    misma clave y el mismo payload reciben la respuesta guardada sin tocar la BD.
+    """
+    if not idem_key:
+        return await handler()
+
+    key = (*scope, idem_key)
+    state, entry = idempotency_store.begin(key, fingerprint(payload))
+    if state == REPLAY:
+        headers = {"Idempotent-Replayed": "true"}
+        if entry.status_code == status.HTTP_202_ACCEPTED:
+            headers["Location"] = f"/ingest/jobs/{entry.body['job_id']}"
+        return JSONResponse(status_code=entry.status_code, content=entry.body, headers=headers)
+    if state == IN_PROGRESS:
+        raise HTTPException(status_code=409, detail="Hay un lote en curso con la misma Idempotency-Key")
+    if state == MISMATCH:
+        raise HTTPException(status_code=422, detail="Idempotency-Key reutilizada con un payload distinto")
 
     try:
-        db.execute(stmt, [
-            {
-                "id": e.id,
-                "name": e.name,
-                "datetime": e.datetime,
-                "department_id": e.department_id,
-                "job_id": e.job_id
-            } for e in employees
-        ])
-        db.commit()
-        inserted = len(employees)
+        resp = await handler()
     except Exception:
-        db.rollback()
-        # Fallback fila a fila para clasificar errores
-        for e in employees:
+        idempotency_store.release(key)
+        raise
+    if isinstance(resp, JSONResponse):
+        idempotency_store.complete(key, resp.status_code, json.loads(resp.body))
+    else:
+        idempotency_store.complete(key, status.HTTP_200_OK, resp.model_dump())
+    return resp
+
+def _wants_async(prefer: Optional[str]) -> bool:
+    return bool(prefer) and "respond-async" in prefer.lower()
+
+def _enqueue_ingest(table: str, rows: List[dict], errors: Optional[List[str]] = None) -> JSONResponse:
+    """Encola el lote en el escritor con group commit y responde 202 al instante."""
+    try:
+        job = ingest_writer.submit(table, rows, errors)
+    except queue.Full:
+        raise HTTPException(status_code=503, detail="Cola de ingesta llena, reintente más tarde")
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content=job.to_dict(),
+        headers={"Location": f"/ingest/jobs/{job.id}"},
+    )
+
+@router.get("/ingest/jobs/{job_id}", response_model=IngestJobStatus)
+async def ingest_job_status(job_id: str, user: str = Depends(get_current_user)):
+    job = ingest_writer.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job de ingesta no encontrado o expirado")
+    return job.to_dict()
+
+async def _iter_stream_lines(request: Request):
+    """Recorre el body por líneas sin cargarlo entero en memoria."""
+    buf = b""
+    async for chunk in request.stream():
+        buf += chunk
+        *lines, buf = buf.split(b"\n")
+        for line in lines:
+            yield line
+        if len(buf) > INGEST_STREAM_MAX_LINE:
+            raise HTTPException(status_code=413, detail="Línea demasiado larga en el stream")
+    if buf:
+        yield buf
+
+def _parse_stream_line(line: str, fmt: str, header: List[str]) -> dict:
+    if fmt == "ndjson":
+        obj = json.loads(line)
+        if not isinstance(obj, dict):
+            raise ValueError("se esperaba un objeto JSON por línea")
+        return obj
+    values = next(csv.reader([line]))
+    if len(values) != len(header):
+        raise ValueError(f"se esperaban {len(header)} columnas y llegaron {len(values)}")
+    return {k: (v if v != "" else None) for k, v in zip(header, values)}
+
+def _cap_errors(errors: List[str]) -> List[str]:
+    if len(errors) <= INGEST_MAX_BATCH_ERRORS:
+        return list(errors)
+    extra = len(errors) - INGEST_MAX_BATCH_ERRORS
+    return errors[:INGEST_MAX_BATCH_ERRORS] + [f"... y {extra} errores más"]
+
+def _add_batch_summary(out: StreamIngestResponse, received: int, res: Optional[dict], parse_errors: List[str]) -> None:
+    """Acumula el resultado de un lote interno (res=None si no llegó a la BD)."""
+    errors = list(parse_errors) + (res["errors"] if res else [])
+    summary = StreamBatchSummary(
+        batch=len(out.batches) + 1,
+        received=received,
+        inserted=res["inserted"] if res else 0,
+        updated=res.get("updated", 0) if res else 0,
+        duplicates=res["duplicates"] if res else 0,
+        errors=_cap_errors(errors),
+    )
+    out.received += summary.received
+    out.inserted += summary.inserted
+    out.updated += summary.updated
+    out.duplicates += summary.duplicates
+    out.errors += len(errors)
+    out.batches.append(summary)
+
+@router.post("/ingest/employees/stream", response_model=StreamIngestResponse)
+async def ingest_employees_stream(
+    request: Request,
+    format: Optional[str] = Query(None, pattern="^(ndjson|csv)$", description="Por defecto según Content-Type"),
+    batch_size: int = Query(INGEST_STREAM_BATCH, ge=1, le=50000, description="Filas por transacción"),
+    db: Session = Depends(get_db),
+    user: str = Depends(get_current_user)
+):
+    """
+    Ingesta sin límite de filas: NDJSON (un empleado por línea) o CSV con cabecera
+    opcional (id,name,datetime,department_id,job_id). El body se lee en streaming y
+    se escribe en lotes de batch_size filas, cada uno en su propia transacción.
+    """
+    fmt = format or ("csv" if "csv" in request.headers.get("content-type", "") else "ndjson")
+    header = list(EMPLOYEE_COLUMNS)
+
+    out = StreamIngestResponse(received=0, inserted=0, duplicates=0, errors=0)
+    batch: List[dict] = []
+    batch_errors: List[str] = []
+
+    async def _flush() -> None:
+        res = await run_db(_write_employees, db, batch) if batch else None
+        _add_batch_summary(out, len(batch) + len(batch_errors), res, batch_errors)
+        batch.clear()
+        batch_errors.clear()
+
+    line_no = 0
+    try:
+        async for raw in _iter_stream_lines(request):
+            line_no += 1
+            line = raw.decode("utf-8-sig" if line_no == 1 else "utf-8").strip()
+            if not line:
+                continue
+            if fmt == "csv" and line_no == 1:
+                # Cabecera si el primer campo (ya sin comillas) no es un id
+                first = [h.strip() for h in next(csv.reader([line]))]
+                if not first[0].isdigit():
+                    header = first
+                    continue
             try:
-                db.execute(stmt, {
-                    "id": e.id,
-                    "name": e.name,
-                    "datetime": e.datetime,
-                    "department_id": e.department_id,
-                    "job_id": e.job_id
-                })
-                db.commit()
-                inserted += 1
-            except Exception as ee:
-                db.rollback()
-                msg = str(ee)
-                if "PRIMARY KEY" in msg or "duplicate" in msg.lower():
-                    duplicates += 1
-                else:
-                    errors.append(f"ID {e.id}: {msg}")
-
-    return BatchResponse(inserted=inserted, duplicates=duplicates, errors=errors)
-
-@app.post("/ingest/departments", response_model=BatchResponse)
+                batch.append(HiredEmployeeCreate(**_parse_stream_line(line, fmt, header)).model_dump())
+            except (ValueError, ValidationError, csv.Error) as e:
+                batch_errors.append(f"Línea {line_no}: {e}")
+            if len(batch) + len(batch_errors) >= batch_size:
+                await _flush()
+        if batch or batch_errors:
+            await _flush()
+    except HTTPException:
+        raise
+    except Exception as e:
+        # Los lotes anteriores ya están confirmados: se devuelve el avance para reanudar
+        logger.error("Error en /ingest/employees/stream (línea %s): %s", line_no, e)
+        logger.debug("Traceback:\n%s", traceback.format_exc())
+        out.aborted = f"Lote {len(out.batches) + 1} (línea {line_no}): {str(e)}"
+        return JSONResponse(status_code=500, content=out.model_dump())
+
+    return out
+
+_INGEST_MODELS = {
+    "hired_employees": HiredEmployeeCreate,
+    "departments": Department,
+    "jobs": Job,
+}
+
+@router.post("/ingest/upload/{table}", response_model=StreamIngestResponse)
+async def ingest_upload(
+    table: str,
+    file: UploadFile = File(..., description="CSV, Parquet o Avro (layout de respaldo.py)"),
+    format: Optional[str] = Query(None, pattern="^(csv|parquet|avro)$", description="Por defecto según la extensión"),
+    batch_size: int = Query(INGEST_STREAM_BATCH, ge=1, le=50000, description="Filas por transacción"),
+    upsert: bool = Query(False, description="Solo departments/jobs: actualizar nombres existentes"),
+    db: Session = Depends(get_db),
+    user: str = Depends(get_current_user)
+):
+    """
+    Carga masiva de un archivo subido (hired_employees, departments o jobs).
+    Se lee por lotes de registros y cada lote va por la ruta set-based de /ingest/*.
+    """
+    model = _INGEST_MODELS.get(table)
+    if model is None:
+        raise HTTPException(status_code=404, detail=f"Tabla no soportada: {table}")
+    fmt = format or FILE_FORMATS.get(Path(file.filename or "").suffix.lower())
+    if fmt is None:
+        raise HTTPException(status_code=400, detail="No se pudo deducir el formato; use ?format=csv|parquet|avro")
+
+    def _load() -> StreamIngestResponse:
+        out = StreamIngestResponse(received=0, inserted=0, duplicates=0, errors=0)
+        try:
+            for records in iter_file_batches(file.file, fmt, batch_size):
+                rows, parse_errors = [], []
+                for rec in records:
+                    try:
+                        rows.append(model(**rec).model_dump())
+                    except ValidationError as e:
+                        parse_errors.append(f"ID {rec.get('id')}: {e}")
+                res = None
+                if rows:
+                    if table == "hired_employees":
+                        res = _write_employees(db, rows)
+                    else:
+                        res = ingest_catalog_bulk(db, table, rows, upsert)
+                        reference_cache.invalidate()
+                _add_batch_summary(out, len(records), res, parse_errors)
+        except Exception as e:
+            logger.error("Error en /ingest/upload/%s: %s", table, e)
+            logger.debug("Traceback:\n%s", traceback.format_exc())
+            out.aborted = f"Lote {len(out.batches) + 1}: {str(e)}"
+        return out
+
+    out = await run_db(_load)
+    if out.aborted:
+        return JSONResponse(status_code=500, content=out.model_dump())
+    return out
+
+@router.post("/ingest/departments", response_model=BatchResponse)
 async def ingest_departments(
     departments: List[Department],
+    upsert: bool = Query(False, description="Actualizar el nombre de los ids existentes"),
+    prefer: Optional[str] = Header(None, description="respond-async: encolar y devolver 202 con job id"),
+    idempotency_key: Optional[str] = Header(None, max_length=255, description="Reintentos seguros: misma clave = misma respuesta"),
     db: Session = Depends(get_db),
     user: str = Depends(get_current_user)
 ):
     if not departments:
         raise HTTPException(status_code=400, detail="Lista de departamentos vacía")
+    rows = [i.model_dump() for i in departments]
 
-    stmt = text("INSERT INTO dbo.[departments] (id, name) VALUES (:id, :name)")
-    inserted = 0
-    duplicates = 0
-    errors: List[str] = []
+    async def _handle():
+        if _wants_async(prefer) and not upsert:
+            return _enqueue_ingest("departments", rows)
+        return await _ingest_catalog("departments", rows, upsert, db)
 
-    for d in departments:
-        try:
-            db.execute(stmt, {"id": d.id, "name": d.name})
-            db.commit()
-            inserted += 1
-        except Exception as e:
-            db.rollback()
-            msg = str(e)
-            if "PRIMARY KEY" in msg or "duplicate" in msg.lower():
-                duplicates += 1
-            else:
-                errors.append(f"ID {d.id}: {msg}")
-
-    return BatchResponse(inserted=inserted, duplicates=duplicates, errors=errors)
+    scope = (user, "departments", upsert, _wants_async(prefer))
+    return await _with_idempotency(idempotency_key, scope, rows, _handle)
 
-@app.post("/ingest/jobs", response_model=BatchResponse)
+@router.post("/ingest/jobs", response_model=BatchResponse)
 async def ingest_jobs(
     jobs: List[Job],
+    upsert: bool = Query(False, description="Actualizar el nombre de los ids existentes"),
+    prefer: Optional[str] = Header(None, description="respond-async: encolar y devolver 202 con job id"),
+    idempotency_key: Optional[str] = Header(None, max_length=255, description="Reintentos seguros: misma clave = misma respuesta"),
     db: Session = Depends(get_db),
     user: str = Depends(get_current_user)
 ):
     if not jobs:
         raise HTTPException(status_code=400, detail="Lista de cargos vacía")
+    rows = [i.model_dump() for i in jobs]
 
-    stmt = text("INSERT INTO dbo.[jobs] (id, name) VALUES (:id, :name)")
-    inserted = 0
-    duplicates = 0
-    errors: List[str] = []
+    async def _handle():
+        if _wants_async(prefer) and not upsert:
+            return _enqueue_ingest("jobs", rows)
+        return await _ingest_catalog("jobs", rows, upsert, db)
 
-    for j in jobs:
-        try:
-            db.execute(stmt, {"id": j.id, "name": j.name})
-            db.commit()
-            inserted += 1
-        except Exception as e:
-            db.rollback()
-            msg = str(e)
-            if "PRIMARY KEY" in msg or "duplicate" in msg.lower():
-                duplicates += 1
-            else:
-                errors.append(f"ID {j.id}: {msg}")
+    scope = (user, "jobs", upsert, _wants_async(prefer))
+    return await _with_idempotency(idempotency_key, scope, rows, _handle)
 
-    return BatchResponse(inserted=inserted, duplicates=duplicates, errors=errors)
+async def _ingest_catalog(table: str, rows: List[dict], upsert: bool, db: Session) -> BatchResponse:
+    try:
+        res = await run_db(ingest_catalog_bulk, db, table, rows, upsert)
+        reference_cache.invalidate()
+    except Exception as e:
+        logger.error("Error en /ingest/%s: %s", table, e)
+        logger.debug("Traceback:\n%s", traceback.format_exc())
+        raise HTTPException(status_code=500, detail=f"/ingest/{table} error: {str(e)}")
+    return BatchResponse(**res)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Lo caro (engine/pyodbc y hash pbkdf2) se hace aquí y no al importar el módulo
+    await anyio.to_thread.run_sync(deps.startup)
+    health_probe.start()
+    logger.info("API lista")
+    yield
+    health_probe.stop()
+    ingest_writer.stop()
+    deps.shutdown()
+
+
+def create_app() -> FastAPI:
+    app = FastAPI(
+        title="API PoC - Migración de Datos",
+        version="1.0.0",
+        description="API para ingesta y consulta de datos históricos",
+        lifespan=lifespan,
+    )
+    app.add_middleware(CompressionMiddleware)
+    app.add_middleware(RouteMetricsMiddleware)
+    app.include_router(router)
+    app.include_router(analytics_router)
+    return app
 
 
-try:
-    from analytics import router as analytics_router
-    app.include_router(analytics_router)
-    logger.info("Analytics router registrado")
-except Exception as e:
-    logger.warning("No se pudo registrar analytics router: %s", e)
+app = create_app()
 
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("app:app", host="0.0.0.0", port=8001, reload=True)
-
-# Export para analytics.py
-__all__ = ["engine", "get_db", "get_current_user"]
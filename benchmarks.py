@@ -0,0 +1,489 @@
+# benchmarks.py
+# Benchmarks de rendimiento de la API (contra una instancia levantada con uvicorn)
+#
+# Uso:
+#   python benchmarks.py concurrency --api-url http://localhost:8001
+#   python benchmarks.py pagination --path /employees --depths 0,10000,100000
+#   python benchmarks.py dates --rows 1000,10000   (en proceso, no necesita la API)
+#   python benchmarks.py columnar --rows 1000000,10000000   (en proceso, SQLite como lado SQL)
+#   python benchmarks.py serialization --rows 1000,10000   (en proceso, no necesita la API)
+#   python benchmarks.py auth [--http]             (API con AUTH_CACHE_SIZE=0 vs por defecto)
+#   python benchmarks.py startup --runs 5           (levanta uvicorn localmente)
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+API_URL  = os.getenv("API_URL", "http://localhost:8001")
+API_USER = os.getenv("API_USER", "admin")
+API_PASS = os.getenv("API_PASS", "admin123")
+
+
+def login(api_url: str) -> str:
+    r = requests.post(
+        f"{api_url}/login",
+        data={"username": API_USER, "password": API_PASS},
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+        timeout=15,
+    )
+    r.raise_for_status()
+    return r.json()["access_token"]
+
+
+def percentile(samples, p: float) -> float:
+    if not samples:
+        return 0.0
+    s = sorted(samples)
+    k = min(len(s) - 1, max(0, int(round(p / 100.0 * (len(s) - 1)))))
+    return s[k]
+
+
+def report(label: str, samples_ms) -> None:
+    if not samples_ms:
+        print(f"{label:<28} sin muestras")
+        return
+    print(
+        f"{label:<28} n={len(samples_ms):<5} "
+        f"p50={percentile(samples_ms, 50):8.2f}ms "
+        f"p99={percentile(samples_ms, 99):8.2f}ms "
+        f"max={max(samples_ms):8.2f}ms "
+        f"mean={statistics.mean(samples_ms):8.2f}ms"
+    )
+
+
+def sample_latency(session: requests.Session, url: str, n: int, headers=None, interval: float = 0.01):
+    out = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        r = session.get(url, headers=headers or {}, timeout=60)
+        out.append((time.perf_counter() - t0) * 1000.0)
+        if r.status_code >= 500:
+            print(f"[WARN] {url} -> {r.status_code}")
+        time.sleep(interval)
+    return out
+
+
+# ---------------------------------------------------------------------------
+# concurrency: p99 de endpoints baratos mientras corren consultas lentas
+# ---------------------------------------------------------------------------
+def bench_concurrency(args) -> None:
+    token = login(args.api_url)
+    auth = {"Authorization": f"Bearer {token}"}
+    cheap_url = f"{args.api_url}{args.cheap_path}"
+    slow_url = f"{args.api_url}{args.slow_path}"
+
+    s = requests.Session()
+    print(f"[INFO] Endpoint barato: {cheap_url}")
+    print(f"[INFO] Endpoint lento:  {slow_url} x{args.slow_workers} concurrentes")
+
+    baseline = sample_latency(s, cheap_url, args.samples, auth)
+
+    stop = threading.Event()
+    slow_done = []
+
+    def slow_worker():
+        ws = requests.Session()
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            try:
+                ws.get(slow_url, headers=auth, timeout=120)
+            except requests.RequestException as e:
+                print(f"[WARN] consulta lenta falló: {e}")
+            slow_done.append((time.perf_counter() - t0) * 1000.0)
+
+    with ThreadPoolExecutor(max_workers=args.slow_workers) as pool:
+        for _ in range(args.slow_workers):
+            pool.submit(slow_worker)
+        time.sleep(args.warmup)
+        under_load = sample_latency(s, cheap_url, args.samples, auth)
+        stop.set()
+
+    print()
+    report("barato (sin carga)", baseline)
+    report("barato (con carga lenta)", under_load)
+    report("lento (concurrente)", slow_done)
+    ratio = percentile(under_load, 99) / max(percentile(baseline, 99), 1e-6)
+    print(f"\np99 con carga / p99 sin carga = {ratio:.2f}x")
+
+
+# ---------------------------------------------------------------------------
+# pagination: latencia por profundidad de página, OFFSET vs keyset (after_id)
+# ---------------------------------------------------------------------------
+def bench_pagination(args) -> None:
+    token = login(args.api_url)
+    auth = {"Authorization": f"Bearer {token}"}
+    s = requests.Session()
+    url = f"{args.api_url}{args.path}"
+    depths = [int(d) for d in args.depths.split(",") if d.strip()]
+
+    print(f"[INFO] {url} limit={args.limit} repeticiones={args.repeat}")
+    for depth in depths:
+        # id de la fila anterior a la página (sin medir) para el modo keyset
+        after_id = 0
+        if depth > 0:
+            r = s.get(url, params={"skip": depth - 1, "limit": 1}, headers=auth, timeout=120)
+            r.raise_for_status()
+            if not r.json():
+                print(f"[WARN] la tabla tiene menos de {depth} filas; se omite")
+                continue
+            after_id = r.json()[0]["id"]
+
+        offset_ms, keyset_ms = [], []
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            s.get(url, params={"skip": depth, "limit": args.limit}, headers=auth, timeout=120).raise_for_status()
+            offset_ms.append((time.perf_counter() - t0) * 1000.0)
+
+            t0 = time.perf_counter()
+            s.get(url, params={"after_id": after_id, "limit": args.limit}, headers=auth, timeout=120).raise_for_status()
+            keyset_ms.append((time.perf_counter() - t0) * 1000.0)
+
+        report(f"offset depth={depth}", offset_ms)
+        report(f"keyset depth={depth}", keyset_ms)
+
+
+# ---------------------------------------------------------------------------
+# dates: to_iso_safely por fila vs to_iso_many vectorizado (micro-benchmark)
+# ---------------------------------------------------------------------------
+_DATE_SAMPLES = {
+    "iso-z":   lambda i: f"2021-{i % 12 + 1:02d}-{i % 28 + 1:02d}T{i % 24:02d}:{i % 60:02d}:{i % 60:02d}Z",
+    "espacio": lambda i: f"2021-{i % 12 + 1:02d}-{i % 28 + 1:02d} {i % 24:02d}:{i % 60:02d}:{i % 60:02d}",
+    "us":      lambda i: f"{i % 12 + 1:02d}/{i % 28 + 1:02d}/2021 {i % 24:02d}:{i % 60:02d}",
+}
+
+def bench_dates(args) -> None:
+    from dates import to_iso_many, to_iso_safely
+
+    for n in [int(x) for x in args.rows.split(",") if x.strip()]:
+        for label, gen in _DATE_SAMPLES.items():
+            values = [gen(i) for i in range(n)]
+            to_iso_many(values[:10])  # calienta la cache de formatos
+
+            t0 = time.perf_counter()
+            per_row = [to_iso_safely(v) for v in values]
+            t_row = (time.perf_counter() - t0) * 1000.0
+
+            t0 = time.perf_counter()
+            batch = to_iso_many(values)
+            t_vec = (time.perf_counter() - t0) * 1000.0
+
+            same = "ok" if per_row == batch else "DIFERENTE"
+            print(
+                f"{label:<8} n={n:<7} por fila={t_row:9.2f}ms  vectorizado={t_vec:9.2f}ms  "
+                f"x{t_row / max(t_vec, 1e-6):6.1f}  resultado={same}"
+            )
+
+
+# ---------------------------------------------------------------------------
+# columnar: backend en memoria (columnar.py) vs GROUP BY en SQL, filas sintéticas.
+# El lado SQL es SQLite en disco con hire_year/hire_quarter ya tipados y su índice
+# cubriente (el equivalente a migrar_fechas.py), no un SQL Server real.
+# ---------------------------------------------------------------------------
+_COLUMNAR_SQL = {
+    "hires_by_quarter": """
+        SELECT d.name AS department, j.name AS job, he.hire_quarter AS quarter, COUNT(1) AS cnt
+        FROM hired_employees he
+        JOIN departments d ON he.department_id = d.id
+        JOIN jobs j ON he.job_id = j.id
+        WHERE he.hire_year = :year
+        GROUP BY d.name, j.name, he.hire_quarter
+    """,
+    "departments_above_average": """
+        WITH DepartmentHires AS (
+            SELECT d.id, d.name AS department, COUNT(he.id) AS hires
+            FROM hired_employees he
+            JOIN departments d ON he.department_id = d.id
+            WHERE he.hire_year = :year
+            GROUP BY d.id, d.name
+        )
+        SELECT id, department, hires FROM DepartmentHires
+        WHERE hires > (SELECT AVG(hires) FROM DepartmentHires)
+    """,
+    "hires_summary": """
+        SELECT he.hire_quarter AS quarter, COUNT(1) AS cnt
+        FROM hired_employees he
+        WHERE he.hire_year = :year
+        GROUP BY he.hire_quarter
+    """,
+}
+
+
+def bench_columnar(args) -> None:
+    import tempfile
+    import numpy as np
+    from sqlalchemy import create_engine, text
+    from columnar import ColumnarStore
+
+    rng = np.random.default_rng(7)
+    n_dept, n_job = 12, 183
+    departments = {i: f"Dept {i}" for i in range(1, n_dept + 1)}
+    jobs = {i: f"Job {i}" for i in range(1, n_job + 1)}
+
+    for n in [int(x) for x in args.rows.split(",") if x.strip()]:
+        ids = np.arange(1, n + 1, dtype=np.int64)
+        dept = rng.integers(1, n_dept + 1, n)
+        job = rng.integers(1, n_job + 1, n)
+        secs = rng.integers(1_546_300_800, 1_704_067_200, n)   # 2019-01-01 .. 2024-01-01 UTC
+        dts = np.datetime_as_string(secs.astype("datetime64[s]"), unit="s")
+        iso = np.char.add(dts, "Z").tolist()
+
+        store = ColumnarStore()
+        store.set_catalogs(departments, jobs)
+        t0 = time.perf_counter()
+        for lo in range(0, n, 1_000_000):
+            store.load(ids[lo:lo + 1_000_000], dept[lo:lo + 1_000_000], job[lo:lo + 1_000_000], iso[lo:lo + 1_000_000])
+        t_load = time.perf_counter() - t0
+
+        with tempfile.TemporaryDirectory() as tmp:
+            eng = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}", future=True)
+            t0 = time.perf_counter()
+            with eng.begin() as conn:
+                conn.execute(text("CREATE TABLE departments (id INTEGER PRIMARY KEY, name TEXT)"))
+                conn.execute(text("CREATE TABLE jobs (id INTEGER PRIMARY KEY, name TEXT)"))
+                conn.execute(text(
+                    "CREATE TABLE hired_employees (id INTEGER PRIMARY KEY, datetime TEXT, "
+                    "department_id INTEGER, job_id INTEGER, hire_year INTEGER, hire_quarter INTEGER)"
+                ))
+                conn.execute(text("INSERT INTO departments VALUES (:id, :name)"),
+                             [{"id": k, "name": v} for k, v in departments.items()])
+                conn.execute(text("INSERT INTO jobs VALUES (:id, :name)"),
+                             [{"id": k, "name": v} for k, v in jobs.items()])
+                years = secs.astype("datetime64[s]").astype("datetime64[Y]").astype(int) + 1970
+                months = secs.astype("datetime64[s]").astype("datetime64[M]").astype(int) % 12
+                raw = conn.connection.driver_connection
+                raw.executemany(
+                    "INSERT INTO hired_employees VALUES (?, ?, ?, ?, ?, ?)",
+                    zip(ids.tolist(), iso, dept.tolist(), job.tolist(), years.tolist(), (months // 3 + 1).tolist()),
+                )
+                conn.execute(text(
+                    "CREATE INDEX IX_hired_employees_hire_dt ON hired_employees "
+                    "(hire_year, hire_quarter, department_id, job_id)"
+                ))
+            t_sql_load = time.perf_counter() - t0
+            with eng.connect() as conn:
+                sql_bytes = conn.execute(text("PRAGMA page_count")).scalar() * conn.execute(text("PRAGMA page_size")).scalar()
+
+            print(f"n={n:,}  columnar: carga={t_load:6.1f}s memoria={store.stats()['bytes'] / 2**20:8.1f}MiB   "
+                  f"sqlite: carga={t_sql_load:6.1f}s disco={sql_bytes / 2**20:8.1f}MiB")
+
+            year = 2021
+            with eng.connect() as conn:
+                for name, sql in _COLUMNAR_SQL.items():
+                    method = getattr(store, name)
+                    col_ms, sql_ms = [], []
+                    for _ in range(args.repeat):
+                        t0 = time.perf_counter()
+                        col = method(year)
+                        col_ms.append((time.perf_counter() - t0) * 1000.0)
+                        t0 = time.perf_counter()
+                        rows = conn.execute(text(sql), {"year": year}).all()
+                        sql_ms.append((time.perf_counter() - t0) * 1000.0)
+                    if name == "hires_summary":
+                        same = sum(c for _, c in rows) == col["total"]
+                    elif name == "hires_by_quarter":
+                        same = sum(c for *_, c in rows) == sum(r["q1"] + r["q2"] + r["q3"] + r["q4"] for r in col)
+                    else:
+                        same = sorted(r[2] for r in rows) == sorted(r["hires"] for r in col)
+                    print(f"   {name:<28} columnar p50={percentile(col_ms, 50):9.2f}ms   "
+                          f"sql p50={percentile(sql_ms, 50):9.2f}ms   "
+                          f"x{percentile(sql_ms, 50) / max(percentile(col_ms, 50), 1e-6):7.1f}   "
+                          f"resultado={'ok' if same else 'DIFERENTE'}")
+            eng.dispose()
+
+
+# ---------------------------------------------------------------------------
+# serialization: página de /employees con response_model + JSONResponse (antes)
+# vs FastJSONResponse sin re-validar (después), y gzip / zstd. En proceso, sin BD.
+# ---------------------------------------------------------------------------
+def bench_serialization(args) -> None:
+    from typing import List
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from app import HiredEmployeeResponse
+    from serialization import CompressionMiddleware, FastJSONResponse, available_encodings
+
+    for n in [int(x) for x in args.rows.split(",") if x.strip()]:
+        rows = [
+            {"id": i, "name": f"Empleado {i}", "datetime": f"2021-{i % 12 + 1:02d}-{i % 28 + 1:02d}T10:00:00Z",
+             "department_id": i % 12 + 1, "job_id": i % 183 + 1}
+            for i in range(n)
+        ]
+        bench = FastAPI()
+        bench.add_middleware(CompressionMiddleware)
+
+        @bench.get("/antes", response_model=List[HiredEmployeeResponse])
+        def antes():
+            return [dict(r) for r in rows]
+
+        @bench.get("/despues", response_model=List[HiredEmployeeResponse])
+        def despues():
+            return FastJSONResponse([dict(r) for r in rows])
+
+        client = TestClient(bench)
+        cases = [("antes", "/antes", "identity"), ("después", "/despues", "identity")]
+        cases += [(f"después+{enc}", "/despues", enc) for enc in available_encodings()]
+        print(f"n={n:,}")
+        for label, path, enc in cases:
+            headers = {"Accept-Encoding": enc}
+            client.get(path, headers=headers)   # calienta
+            samples, size = [], 0
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                r = client.get(path, headers=headers)
+                samples.append((time.perf_counter() - t0) * 1000.0)
+                size = int(r.headers.get("content-length") or len(r.content))
+            report(f"   {label}", samples)
+            print(f"   {'':<28} bytes={size:,}")
+
+
+# ---------------------------------------------------------------------------
+# auth: costo de verificar el JWT por petición, jwt.decode vs TokenCache
+# ---------------------------------------------------------------------------
+def bench_auth(args) -> None:
+    from datetime import datetime, timedelta
+    from jose import jwt
+    from token_cache import TokenCache
+
+    secret = os.getenv("SECRET_KEY", "dev-secret-change-me-in-production")
+    token = jwt.encode({"sub": API_USER, "exp": datetime.utcnow() + timedelta(minutes=60)}, secret, algorithm="HS256")
+    cache = TokenCache(max_entries=1024)
+
+    t0 = time.perf_counter()
+    for _ in range(args.iterations):
+        jwt.decode(token, secret, algorithms=["HS256"])
+    t_decode = (time.perf_counter() - t0) * 1e6 / args.iterations
+
+    payload = jwt.decode(token, secret, algorithms=["HS256"])
+    cache.put(token, payload["sub"], payload["exp"])
+    t0 = time.perf_counter()
+    for _ in range(args.iterations):
+        cache.get(token)
+    t_cache = (time.perf_counter() - t0) * 1e6 / args.iterations
+
+    print(f"jwt.decode         {t_decode:8.1f}us/petición")
+    print(f"TokenCache (hit)   {t_cache:8.1f}us/petición   x{t_decode / max(t_cache, 1e-9):.1f}")
+
+    if not args.http:
+        return
+    # Extremo a extremo: comparar una API levantada con AUTH_CACHE_SIZE=0 (antes)
+    # contra la configuración por defecto (después)
+    token = login(args.api_url)
+    auth = {"Authorization": f"Bearer {token}"}
+    s = requests.Session()
+    url = f"{args.api_url}{args.path}"
+    sample_latency(s, url, 20, auth, interval=0)  # calienta conexiones y cache
+    report(f"GET {args.path}", sample_latency(s, url, args.samples, auth, interval=0))
+    r = s.get(f"{args.api_url}/metrics/auth", headers=auth, timeout=15)
+    if r.ok:
+        print(f"cache de tokens: {r.json()}")
+
+
+# ---------------------------------------------------------------------------
+# startup: import de app.py y tiempo hasta la primera respuesta sana de uvicorn
+# ---------------------------------------------------------------------------
+def bench_startup(args) -> None:
+    here = os.path.dirname(os.path.abspath(__file__))
+    import_ms, ready_ms = [], []
+    for _ in range(args.runs):
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "import app"], cwd=here, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        import_ms.append((time.perf_counter() - t0) * 1000.0)
+
+        url = f"http://127.0.0.1:{args.port}{args.path}"
+        t0 = time.perf_counter()
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app:app", "--port", str(args.port), "--log-level", "warning"],
+            cwd=here, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            while time.perf_counter() - t0 < args.timeout:
+                try:
+                    if requests.get(url, timeout=1).status_code == 200:
+                        ready_ms.append((time.perf_counter() - t0) * 1000.0)
+                        break
+                except requests.RequestException:
+                    pass
+                if proc.poll() is not None:
+                    print(f"[WARN] uvicorn terminó con código {proc.returncode}")
+                    break
+                time.sleep(0.01)
+            else:
+                print(f"[WARN] {url} no respondió 200 en {args.timeout}s")
+        finally:
+            proc.terminate()
+            proc.wait(timeout=10)
+
+    report("import app (proceso nuevo)", import_ms)
+    report(f"uvicorn -> 200 {args.path}", ready_ms)
+
+
+def parse_args():
+    ap = argparse.ArgumentParser(description="Benchmarks de la API")
+    ap.add_argument("--api-url", default=API_URL, help="URL base de la API")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    c = sub.add_parser("concurrency", help="Latencia de endpoints baratos bajo consultas lentas")
+    c.add_argument("--cheap-path", default="/departments?limit=10")
+    c.add_argument("--slow-path", default="/analytics/hires-by-quarter?year=2021")
+    c.add_argument("--slow-workers", type=int, default=8)
+    c.add_argument("--samples", type=int, default=200)
+    c.add_argument("--warmup", type=float, default=1.0, help="Segundos antes de medir bajo carga")
+    c.set_defaults(func=bench_concurrency)
+
+    p = sub.add_parser("pagination", help="Latencia de páginas profundas: OFFSET vs keyset")
+    p.add_argument("--path", default="/employees")
+    p.add_argument("--limit", type=int, default=100)
+    p.add_argument("--depths", default="0,1000,10000,100000")
+    p.add_argument("--repeat", type=int, default=20)
+    p.set_defaults(func=bench_pagination)
+
+    d = sub.add_parser("dates", help="Conversión de fechas por fila vs vectorizada")
+    d.add_argument("--rows", default="100,1000,10000")
+    d.set_defaults(func=bench_dates)
+
+    cl = sub.add_parser("columnar", help="Backend columnar en memoria vs GROUP BY en SQL (filas sintéticas)")
+    cl.add_argument("--rows", default="1000000,10000000")
+    cl.add_argument("--repeat", type=int, default=10)
+    cl.set_defaults(func=bench_columnar)
+
+    se = sub.add_parser("serialization", help="Serialización y compresión de páginas de /employees")
+    se.add_argument("--rows", default="1000,10000")
+    se.add_argument("--repeat", type=int, default=30)
+    se.set_defaults(func=bench_serialization)
+
+    a = sub.add_parser("auth", help="Costo de autenticación por petición con y sin cache de tokens")
+    a.add_argument("--iterations", type=int, default=20000)
+    a.add_argument("--http", action="store_true", help="Medir también la API (GET --path con token caliente)")
+    a.add_argument("--path", default="/departments?limit=10")
+    a.add_argument("--samples", type=int, default=500)
+    a.set_defaults(func=bench_auth)
+
+    st = sub.add_parser("startup", help="Tiempo de import y hasta la primera respuesta sana")
+    st.add_argument("--runs", type=int, default=5)
+    st.add_argument("--port", type=int, default=8011)
+    st.add_argument("--path", default="/health", help="Use / si no hay BD disponible")
+    st.add_argument("--timeout", type=float, default=60.0)
+    st.set_defaults(func=bench_startup)
+
+    return ap.parse_args()
+
+
+def main():
+    args = parse_args()
+    try:
+        args.func(args)
+    except requests.RequestException as e:
+        print(f"[ERROR] No se pudo contactar la API en {args.api_url}: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# cache.py
+# Cache en memoria de resultados de analytics, invalidada por versión de datos.
+#
+# Cada tabla tiene un contador que ingest.py incrementa tras un COMMIT que cambió
+# filas. Una entrada guarda las versiones de las tablas de las que depende y deja
+# de servirse en cuanto alguna cambia. El TTL acota lo que no pasa por esta API
+# (historico.py, otro worker de uvicorn, cambios hechos a mano en la BD).
+
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Sequence, Tuple
+
+from metrics import counter
+
+CACHE_REQUESTS = counter(
+    "analytics_cache_requests_total", "Búsquedas en la cache de analytics", ("endpoint", "result"))
+
+MISS = object()
+
+
+class DataVersions:
+    def __init__(self):
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def bump(self, table: str) -> int:
+        with self._lock:
+            v = self._versions.get(table, 0) + 1
+            self._versions[table] = v
+            return v
+
+    def get(self, tables: Sequence[str]) -> Tuple[int, ...]:
+        with self._lock:
+            return tuple(self._versions.get(t, 0) for t in tables)
+
+
+data_versions = DataVersions()
+
+
+class ResultCache:
+    """LRU acotado a max_entries; cada entrada vale mientras no cambien sus versiones ni venza el ttl."""
+
+    def __init__(self, max_entries: int = 256, ttl: float = 300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[Tuple[int, ...], float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, versions: Tuple[int, ...], endpoint: str = "") -> Any:
+        """Valor guardado o MISS."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_versions, expires_at, value = entry
+                if stored_versions == versions and expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    CACHE_REQUESTS.inc((endpoint, "hit"))
+                    return value
+                del self._entries[key]
+                self.stale += 1
+            self.misses += 1
+        CACHE_REQUESTS.inc((endpoint, "miss"))
+        return MISS
+
+    def put(self, key: Hashable, versions: Tuple[int, ...], value: Any) -> None:
+        if not self.max_entries:
+            return
+        with self._lock:
+            self._entries[key] = (versions, time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
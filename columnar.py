@@ -0,0 +1,305 @@
+# columnar.py
+# Backend opcional de analytics en memoria (ANALYTICS_BACKEND=columnar).
+#
+# hired_employees se guarda como columnas NumPy compactas, 11 bytes por fila:
+#   ids      int32
+#   dept     int16  código de departamento (0 = NULL; ver _Codes)
+#   job      int16  código de cargo
+#   year     int16  año UTC de [datetime] (0 si no se pudo interpretar)
+#   quarter  int8   trimestre 1..4
+#
+# Los endpoints de /analytics se resuelven con máscaras y np.bincount sobre
+# estas columnas, sin ida y vuelta a la BD. La carga es incremental por marca
+# de agua de id (WHERE id > :wm); como los ids los elige el cliente, tras cada
+# refresco se compara COUNT_BIG con las filas en memoria y, si no cuadra (ids
+# por debajo de la marca, borrados), se recarga completa.
+#
+# Se refresca cuando ingest.py cambia data_versions y, para escrituras que no
+# pasan por esta API (historico.py, otro worker), cada refresh_interval segundos.
+
+import time
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+NULL_ID = -1
+_INT16_MAX = np.iinfo(np.int16).max
+
+
+class _Codes:
+    """Diccionario id -> código int16 (código 0 reservado para NULL)."""
+
+    def __init__(self):
+        self.ids: List[int] = [NULL_ID]
+        self._codes: Dict[int, int] = {NULL_ID: 0}
+
+    def encode(self, values: np.ndarray) -> np.ndarray:
+        uniq = np.unique(values)
+        for v in uniq.tolist():
+            if v not in self._codes:
+                if len(self.ids) > _INT16_MAX:
+                    raise ValueError("Más de 32767 ids distintos: no caben en códigos int16")
+                self._codes[v] = len(self.ids)
+                self.ids.append(v)
+        lut = np.fromiter((self._codes[v] for v in uniq.tolist()), dtype=np.int16, count=len(uniq))
+        return lut[np.searchsorted(uniq, values)]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+class _Columns:
+    COLUMNS = (("ids", np.int32), ("dept", np.int16), ("job", np.int16), ("year", np.int16), ("quarter", np.int8))
+
+    def __init__(self, capacity: int = 1024):
+        self.n = 0
+        self.arrays = {name: np.zeros(capacity, dtype=dt) for name, dt in self.COLUMNS}
+        self.dept = _Codes()
+        self.job = _Codes()
+        self.max_id: Optional[int] = None
+
+    def append(self, ids: np.ndarray, dept: np.ndarray, job: np.ndarray,
+               year: np.ndarray, quarter: np.ndarray) -> None:
+        """Añade filas (dept/job como ids de catálogo, NULL_ID para NULL)."""
+        k = len(ids)
+        if not k:
+            return
+        need = self.n + k
+        cap = len(self.arrays["ids"])
+        if need > cap:
+            cap = max(need, cap * 2)
+            for name, dt in self.COLUMNS:
+                grown = np.zeros(cap, dtype=dt)
+                grown[:self.n] = self.arrays[name][:self.n]
+                self.arrays[name] = grown
+        new = {
+            "ids": ids, "dept": self.dept.encode(dept), "job": self.job.encode(job),
+            "year": year, "quarter": quarter,
+        }
+        for name, dt in self.COLUMNS:
+            self.arrays[name][self.n:need] = new[name].astype(dt, copy=False)
+        self.n = need
+        top = int(ids.max())
+        self.max_id = top if self.max_id is None else max(self.max_id, top)
+
+    def view(self) -> Dict[str, np.ndarray]:
+        return {name: a[:self.n] for name, a in self.arrays.items()}
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a[:self.n].nbytes for a in self.arrays.values())
+
+
+def year_quarter(values: Sequence[Optional[str]]) -> Tuple[np.ndarray, np.ndarray]:
+    """[datetime] texto -> (año, trimestre) en UTC; 0/0 si no se puede interpretar."""
+    dt = pd.to_datetime(pd.Series(values, dtype="object"), utc=True, errors="coerce", format="ISO8601")
+    ok = dt.notna().to_numpy()
+    year = np.where(ok, dt.dt.year.fillna(0).to_numpy(dtype=np.int64), 0)
+    quarter = np.where(ok, dt.dt.quarter.fillna(0).to_numpy(dtype=np.int64), 0)
+    return year.astype(np.int16), quarter.astype(np.int8)
+
+
+def _ids(values: Sequence[Optional[int]]) -> np.ndarray:
+    return pd.Series(values, dtype="Int64").fillna(NULL_ID).to_numpy(dtype=np.int64)
+
+
+class ColumnarStore:
+    def __init__(self, refresh_interval: float = 30.0, batch: int = 200_000):
+        self.refresh_interval = refresh_interval
+        self.batch = batch
+        self._cols = _Columns()
+        self._lock = threading.Lock()           # intercambio de columnas/catálogos
+        self._refresh_lock = threading.Lock()   # un solo refresco a la vez
+        self._departments: Dict[int, str] = {}
+        self._jobs: Dict[int, str] = {}
+        self._versions: Optional[Tuple[int, ...]] = None
+        self._refreshed_at = 0.0
+        self.refreshes = 0
+        self.full_reloads = 0
+        self.last_refresh_ms: Optional[float] = None
+
+    # ------------------------------------------------------------------
+    # Carga
+    # ------------------------------------------------------------------
+    def load(self, ids, departments, jobs, datetimes) -> None:
+        """Añade filas de hired_employees ya leídas (también lo usa benchmarks.py)."""
+        ids = np.asarray(ids, dtype=np.int64)
+        year, quarter = year_quarter(datetimes)
+        with self._lock:
+            self._cols.append(ids, _ids(departments), _ids(jobs), year, quarter)
+
+    def set_catalogs(self, departments: Dict[int, str], jobs: Dict[int, str]) -> None:
+        with self._lock:
+            self._departments, self._jobs = dict(departments), dict(jobs)
+
+    def ensure_fresh(self, db, versions: Tuple[int, ...]) -> None:
+        """Refresca si cambiaron las versiones de datos o venció refresh_interval."""
+        if not self._stale(versions):
+            return
+        with self._refresh_lock:
+            if self._stale(versions):
+                self.refresh(db)
+                self._versions = versions
+
+    def _stale(self, versions: Tuple[int, ...]) -> bool:
+        return versions != self._versions or time.monotonic() - self._refreshed_at > self.refresh_interval
+
+    def refresh(self, db) -> None:
+        t0 = time.perf_counter()
+        departments = dict(db.execute(text("SELECT id, name FROM dbo.[departments]")).all())
+        jobs = dict(db.execute(text("SELECT id, name FROM dbo.[jobs]")).all())
+        self.set_catalogs(departments, jobs)
+
+        fetched, total = 0, None
+        for _ in range(2):   # un reintento por si entra una ingesta entre la lectura y el COUNT
+            with self._lock:
+                watermark = self._cols.max_id
+            fetched += self._fetch_since(db, watermark)
+            total = int(db.execute(text("SELECT COUNT_BIG(1) FROM dbo.[hired_employees]")).scalar() or 0)
+            if total == self._cols.n:
+                break
+        else:
+            # Ids por debajo de la marca o filas borradas: recarga completa
+            logger.info("Columnar: %s filas en memoria vs %s en BD, recarga completa", self._cols.n, total)
+            fresh = ColumnarStore(self.refresh_interval, self.batch)
+            fresh._fetch_since(db, None)
+            with self._lock:
+                self._cols = fresh._cols
+            self.full_reloads += 1
+        db.rollback()   # no dejar abierta la transacción implícita de lectura
+
+        self._refreshed_at = time.monotonic()
+        self.refreshes += 1
+        self.last_refresh_ms = (time.perf_counter() - t0) * 1000.0
+        logger.debug("Columnar: refresco +%s filas en %.1fms", fetched, self.last_refresh_ms)
+
+    def _fetch_since(self, db, watermark: Optional[int]) -> int:
+        fetched = 0
+        while True:
+            where = "" if watermark is None else "WHERE id > :wm"
+            rows = db.execute(text(f"""
+                SELECT TOP (:n) id, department_id, job_id, [datetime]
+                FROM dbo.[hired_employees] {where}
+                ORDER BY id
+            """), {"n": self.batch, "wm": watermark}).all()
+            if not rows:
+                return fetched
+            ids, departments, jobs, datetimes = zip(*rows)
+            self.load(ids, departments, jobs, datetimes)
+            fetched += len(rows)
+            watermark = ids[-1]
+            if len(rows) < self.batch:
+                return fetched
+
+    # ------------------------------------------------------------------
+    # Consultas (mismo contrato que los endpoints SQL de analytics.py)
+    # ------------------------------------------------------------------
+    def _snapshot(self):
+        with self._lock:
+            return self._cols.view(), list(self._cols.dept.ids), list(self._cols.job.ids), self._departments, self._jobs
+
+    @staticmethod
+    def _cells(cols: Dict[str, np.ndarray], n_dept: int, n_job: int, year: int) -> np.ndarray:
+        """Conteos (depto, cargo, trimestre) del año: un bincount sobre la clave combinada."""
+        m = (cols["year"] == year) & (cols["quarter"] > 0)
+        key = (cols["dept"][m].astype(np.int64) * n_job + cols["job"][m]) * 4 + (cols["quarter"][m] - 1)
+        return np.bincount(key, minlength=n_dept * n_job * 4).reshape(n_dept, n_job, 4)
+
+    def hires_by_quarter(self, year: int) -> List[Dict[str, Any]]:
+        cols, dept_ids, job_ids, departments, jobs = self._snapshot()
+        cells = self._cells(cols, len(dept_ids), len(job_ids), year)
+        acc: Dict[tuple, Dict[str, Any]] = {}
+        d_nz, j_nz = np.nonzero(cells.sum(axis=2))
+        for d, j, qs in zip(d_nz.tolist(), j_nz.tolist(), cells[d_nz, j_nz].tolist()):
+            dname, jname = departments.get(dept_ids[d]), jobs.get(job_ids[j])
+            if dname is None or jname is None:   # JOIN con departments / jobs
+                continue
+            k = (dname, jname)
+            if k not in acc:
+                acc[k] = {"department": dname, "job": jname, "q1": 0, "q2": 0, "q3": 0, "q4": 0}
+            row = acc[k]
+            row["q1"] += qs[0]; row["q2"] += qs[1]; row["q3"] += qs[2]; row["q4"] += qs[3]
+        return [acc[k] for k in sorted(acc)]
+
+    def departments_above_average(self, year: int) -> List[Dict[str, Any]]:
+        cols, dept_ids, _, departments, _ = self._snapshot()
+        m = (cols["year"] == year) & (cols["quarter"] > 0)
+        per_dept = np.bincount(cols["dept"][m], minlength=len(dept_ids))
+        hires = [
+            {"id": dept_ids[d], "department": departments[dept_ids[d]], "hires": int(per_dept[d])}
+            for d in np.nonzero(per_dept)[0] if dept_ids[d] in departments
+        ]
+        if not hires:
+            return []
+        avg = sum(h["hires"] for h in hires) // len(hires)   # AVG de enteros en SQL Server trunca
+        return sorted((h for h in hires if h["hires"] > avg), key=lambda h: h["hires"], reverse=True)
+
+    def hires_summary(self, year: int) -> Dict[str, int]:
+        cols, _, _, _, _ = self._snapshot()
+        m = (cols["year"] == year) & (cols["quarter"] > 0)
+        q = np.bincount(cols["quarter"][m], minlength=5)
+        s = {"year": year, "q1": int(q[1]), "q2": int(q[2]), "q3": int(q[3]), "q4": int(q[4])}
+        s["total"] = s["q1"] + s["q2"] + s["q3"] + s["q4"]
+        return s
+
+    def hires_range(self, desde, hasta, granularity: str, group_by: str) -> List[tuple]:
+        """
+        Filas (grupos..., año, periodo, cnt) como la consulta de analytics._range_sql.
+        Solo rangos de trimestres completos y granularidad year / quarter (no hay mes en memoria).
+        """
+        cols, dept_ids, job_ids, departments, jobs = self._snapshot()
+        qlo = desde.year * 4 + (desde.month - 1) // 3
+        qhi = hasta.year * 4 + (hasta.month - 1) // 3
+        span = qhi - qlo
+        k = cols["year"].astype(np.int64) * 4 + cols["quarter"] - 1
+        m = (cols["quarter"] > 0) & (k >= qlo) & (k < qhi)
+        k = k[m] - qlo
+
+        n_job = len(job_ids)
+        if group_by == "department":
+            g, n_groups = cols["dept"][m].astype(np.int64), len(dept_ids)
+        elif group_by == "job":
+            g, n_groups = cols["job"][m].astype(np.int64), n_job
+        elif group_by == "department_job":
+            g, n_groups = cols["dept"][m].astype(np.int64) * n_job + cols["job"][m], len(dept_ids) * n_job
+        else:
+            g, n_groups = np.zeros(len(k), dtype=np.int64), 1
+        counts = np.bincount(g * span + k, minlength=n_groups * span).reshape(n_groups, span)
+
+        acc: Dict[tuple, int] = {}
+        g_nz, k_nz = np.nonzero(counts)
+        for gi, ki, c in zip(g_nz.tolist(), k_nz.tolist(), counts[g_nz, k_nz].tolist()):
+            if group_by == "department":
+                names = (departments.get(dept_ids[gi]),)
+            elif group_by == "job":
+                names = (jobs.get(job_ids[gi]),)
+            elif group_by == "department_job":
+                names = (departments.get(dept_ids[gi // n_job]), jobs.get(job_ids[gi % n_job]))
+            else:
+                names = ()
+            if None in names:   # JOIN con departments / jobs
+                continue
+            y, q = divmod(qlo + ki, 4)
+            key = names + ((y, 0) if granularity == "year" else (y, q + 1))
+            acc[key] = acc.get(key, 0) + c
+        return [key + (c,) for key, c in acc.items()]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            cols = self._cols
+            return {
+                "rows": cols.n,
+                "bytes": cols.nbytes,
+                "watermark": cols.max_id,
+                "departments": len(cols.dept) - 1,
+                "jobs": len(cols.job) - 1,
+                "refreshes": self.refreshes,
+                "full_reloads": self.full_reloads,
+                "last_refresh_ms": round(self.last_refresh_ms, 3) if self.last_refresh_ms is not None else None,
+            }
@@ -0,0 +1,187 @@
+# dates.py
+# Normalización de fechas a ISO-8601 para las respuestas de la API.
+# hired_employees.datetime es NVARCHAR(50): llega como texto y hay que parsearlo.
+#
+# - to_iso_safely: una fila (referencia, usada en diagnósticos)
+# - to_iso_many:   una página / bloque completo: fromisoformat por valor y, para lo
+#                  que no es ISO, llamadas vectorizadas de pandas reutilizando los
+#                  formatos que ya funcionaron
+
+import re
+import threading
+from datetime import datetime
+from typing import List, Optional, Sequence
+
+_TZ_SUFFIX = re.compile(r"(?:Z|[+-]\d{2}:?\d{2})$")
+
+# Formatos strftime que ya parsearon datos reales (el más reciente primero)
+_FORMAT_CACHE: List[str] = []
+_FORMAT_CACHE_MAX = 8
+_PROBE_ROWS = 5
+_format_lock = threading.Lock()
+
+
+def to_iso_safely(val) -> Optional[str]:
+    """Devuelve ISO-8601 o None para cualquier valor de fecha extraño."""
+    try:
+        if isinstance(val, datetime):
+            return val.isoformat()
+        if isinstance(val, str):
+            try:
+                return datetime.fromisoformat(val.replace('Z', '+00:00')).isoformat()
+            except Exception:
+                pass
+            try:
+                import pandas as pd  # opcional; solo si está instalado
+                ts = pd.to_datetime(val, errors="coerce", utc=False)
+                if pd.isna(ts):
+                    return None
+                return ts.to_pydatetime().isoformat()
+            except Exception:
+                return None
+        return None
+    except Exception:
+        return None
+
+
+def cached_formats() -> List[str]:
+    return list(_FORMAT_CACHE)
+
+
+def _remember_format(fmt: str) -> None:
+    with _format_lock:
+        if fmt in _FORMAT_CACHE:
+            _FORMAT_CACHE.remove(fmt)
+        _FORMAT_CACHE.insert(0, fmt)
+        del _FORMAT_CACHE[_FORMAT_CACHE_MAX:]
+
+
+def _matches(value: str, fmt: str) -> bool:
+    try:
+        datetime.strptime(value, fmt)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+def _is_aware_format(fmt: str) -> bool:
+    return "%z" in fmt or "%Z" in fmt
+
+
+def _swap_day_month(fmt: str) -> str:
+    return fmt.replace("%d", "\0").replace("%m", "%d").replace("\0", "%m")
+
+
+def _variants(fmt: str) -> List[str]:
+    """
+    Formatos a probar, en orden, para un formato adivinado o cacheado.
+
+    Si día y mes son ambiguos (no empieza por el año), siempre primero mes/día
+    y luego día/mes: cada valor se interpreta igual que en to_iso_safely, sin
+    depender de qué otras filas traiga el bloque ni de lo que vio la cache.
+    """
+    if "%d" not in fmt or "%m" not in fmt or fmt.startswith("%Y"):
+        return [fmt]
+    month_first = fmt if fmt.index("%m") < fmt.index("%d") else _swap_day_month(fmt)
+    return [month_first, _swap_day_month(month_first)]
+
+
+def _parse_groups(pd, s):
+    """
+    Parsea una Serie de texto probando primero los formatos cacheados, luego el
+    adivinado a partir de la primera fila pendiente y por último ISO8601/mixed.
+
+    Returns: lista de (Serie parseada, con_offset); cada fila aparece en un solo grupo
+    """
+    from pandas.tseries.api import guess_datetime_format
+
+    groups = []
+    pending = s
+    tried = set()
+
+    def attempt(fmt: str, aware: bool, remember: bool) -> None:
+        nonlocal pending
+        for variant in _variants(fmt) if remember else [fmt]:
+            tried.add(variant)
+            if pending.empty:
+                break
+            parsed = pd.to_datetime(pending, format=variant, errors="coerce", utc=aware)
+            ok = parsed.notna()
+            if ok.any():
+                groups.append((parsed[ok], aware))
+                pending = pending[~ok]
+                if remember:
+                    _remember_format(variant)
+
+    for fmt in cached_formats():
+        if pending.empty:
+            return groups
+        # Sondeo barato con strptime antes de pasar el formato por todo el bloque
+        if any(_matches(v, variant) for variant in _variants(fmt) for v in pending.iloc[:_PROBE_ROWS]):
+            attempt(fmt, _is_aware_format(fmt), remember=True)
+
+    # Normalmente todas las filas comparten formato: basta con adivinar una vez
+    while not pending.empty:
+        guess = guess_datetime_format(pending.iloc[0])
+        if not guess or guess in tried:
+            break
+        before = len(pending)
+        attempt(guess, _is_aware_format(guess), remember=True)
+        if len(pending) == before:
+            break
+
+    # Restos heterogéneos: separar por sufijo de zona (solo aquí, pocas filas)
+    if not pending.empty:
+        rest = pending
+        aware = rest.str.contains(_TZ_SUFFIX)
+        for mask, utc in ((~aware, False), (aware, True)):
+            pending = rest[mask]
+            for fmt in ("ISO8601", "mixed"):
+                if pending.empty:
+                    break
+                attempt(fmt, utc, remember=False)
+    return groups
+
+
+def _format_iso(np, parsed):
+    """ISO-8601 igual que datetime.isoformat() (microsegundos solo si no son cero), sin offset."""
+    if getattr(parsed.dt, "tz", None) is not None:
+        parsed = parsed.dt.tz_convert("UTC").dt.tz_localize(None)
+    arr = parsed.to_numpy(dtype="datetime64[us]")
+    frac = (arr.view("int64") % 1_000_000) != 0
+    return np.where(frac, np.datetime_as_string(arr, unit="us"), np.datetime_as_string(arr, unit="s"))
+
+
+def to_iso_many(values: Sequence) -> List[Optional[str]]:
+    """
+    Equivalente de [to_iso_safely(v) for v in values] para una página o bloque.
+
+    Primero datetime.fromisoformat por valor (en C, lo más rápido para el ISO-8601
+    de este dataset); solo lo que no es ISO pasa por pandas y la cache de formatos.
+
+    Diferencia conocida: en esos textos no ISO, un offset distinto de UTC se
+    devuelve convertido a UTC (+00:00), que representa el mismo instante.
+    """
+    out: List[Optional[str]] = [None] * len(values)
+    idx, strs = [], []
+    for i, v in enumerate(values):
+        if isinstance(v, str):
+            try:
+                out[i] = datetime.fromisoformat(v.replace('Z', '+00:00')).isoformat()
+            except ValueError:
+                idx.append(i)
+                strs.append(v)
+        elif isinstance(v, datetime):
+            out[i] = v.isoformat()
+    if not strs:
+        return out
+
+    import numpy as np
+    import pandas as pd
+
+    s = pd.Series(strs, index=idx, dtype=object)
+    for parsed, aware in _parse_groups(pd, s):
+        iso = _format_iso(np, parsed).astype(object)
+        for i, text in zip(parsed.index, iso + "+00:00" if aware else iso):
+            out[i] = text
+    return out
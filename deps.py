@@ -0,0 +1,298 @@
+# deps.py
+# Dependencias compartidas por app.py y los routers (analytics.py, ...):
+# configuración de BD y JWT, engine/sesiones, pool de hilos de BD y autenticación.
+#
+# Importar este módulo es barato: el engine (pyodbc) y el hash pbkdf2 de API_PASS
+# se crean en el primer uso o en el arranque (lifespan de app.create_app).
+
+import os
+import logging
+import threading
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Optional
+from urllib.parse import quote_plus
+
+import anyio
+from fastapi import Depends, HTTPException, status
+from fastapi.security import OAuth2PasswordBearer
+from jose import jwt, JWTError
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import NullPool
+from dotenv import load_dotenv
+
+from metrics import TimedQueuePool, attach_query_metrics, pool_metrics
+from slowlog import SlowQueryLog
+from token_cache import TokenCache
+
+
+ENV_PATH = Path(__file__).parent / ".env"
+load_dotenv(dotenv_path=ENV_PATH, override=True)
+
+SERVER   = os.getenv("SERVER", ".")
+DATABASE = os.getenv("DATABASE", "Prueba_Sep")
+USERNAME = os.getenv("USERNAME", "sa")
+PASSWORD = os.getenv("PASSWORD", "123")
+DRIVER   = (os.getenv("DRIVER") or "ODBC Driver 18 for SQL Server").replace("+", " ")
+ENCRYPT  = os.getenv("ENCRYPT", "no")
+TRUST    = os.getenv("TRUST_SERVER_CERT", "yes")
+TIMEOUT  = os.getenv("CONNECTION_TIMEOUT", "30")
+
+SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret-change-me-in-production")
+ALGORITHM  = "HS256"
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "60"))
+
+# JWT ya verificados (0 desactiva la cache)
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "1024"))
+
+API_USER = os.getenv("API_USER", "admin")
+API_PASS = os.getenv("API_PASS", "admin123")
+
+# Pool de conexiones y pool de hilos para trabajo bloqueante de BD.
+# Cada hilo de BD retiene como mucho una conexión, así que el límite de hilos
+# se dimensiona al máximo de conexiones que puede entregar el pool.
+DB_POOL_SIZE    = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))    # seg. esperando conexión libre
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))    # seg. de vida; -1 = sin reciclar
+DB_THREADS      = int(os.getenv("DB_THREADS", str(DB_POOL_SIZE + DB_MAX_OVERFLOW)))
+
+# Consultas lentas: umbral, tamaño del buffer y captura de plan estimado (1/0)
+SLOW_QUERY_MS       = float(os.getenv("SLOW_QUERY_MS", "500"))
+SLOW_QUERY_LOG_SIZE = int(os.getenv("SLOW_QUERY_LOG_SIZE", "100"))
+SLOW_QUERY_PLANS    = os.getenv("SLOW_QUERY_PLANS", "0") == "1"
+
+# Sonda de salud: engine aparte sin pool y con timeouts cortos (seg.), así mide
+# la BD y no lo ocupado que está el pool compartido
+HEALTH_CONNECT_TIMEOUT = int(os.getenv("HEALTH_CONNECT_TIMEOUT", "3"))
+HEALTH_QUERY_TIMEOUT   = int(os.getenv("HEALTH_QUERY_TIMEOUT", "3"))
+
+logger = logging.getLogger(__name__)
+
+slow_queries = SlowQueryLog(
+    threshold_ms=SLOW_QUERY_MS,
+    capacity=SLOW_QUERY_LOG_SIZE,
+    capture_plans=SLOW_QUERY_PLANS,
+)
+
+
+def _odbc_url(timeout) -> str:
+    odbc = (
+        f"DRIVER={{{DRIVER}}};"
+        f"SERVER={SERVER};"
+        f"DATABASE={DATABASE};"
+        f"UID={USERNAME};"
+        f"PWD={PASSWORD};"
+        f"Encrypt={ENCRYPT};"
+        f"TrustServerCertificate={TRUST};"
+        f"Connection Timeout={timeout};"
+    )
+    return f"mssql+pyodbc:///?odbc_connect={quote_plus(odbc)}"
+
+
+def build_engine() -> Engine:
+    eng = create_engine(
+        _odbc_url(TIMEOUT),
+        poolclass=TimedQueuePool,
+        pool_pre_ping=True,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        future=True,
+    )
+    pool_metrics.attach(eng)
+    attach_query_metrics(eng)
+    slow_queries.attach(eng)
+
+    @event.listens_for(eng, "before_cursor_execute")
+    def _fast_execmany(conn, cursor, statement, parameters, context, executemany):
+        if executemany and hasattr(cursor, "fast_executemany"):
+            cursor.fast_executemany = True
+
+    return eng
+
+
+def build_probe_engine() -> Engine:
+    """Engine de la sonda de salud: una conexión nueva por sonda (NullPool)."""
+    eng = create_engine(_odbc_url(HEALTH_CONNECT_TIMEOUT), poolclass=NullPool, future=True)
+
+    @event.listens_for(eng, "connect")
+    def _query_timeout(dbapi_conn, record):
+        dbapi_conn.timeout = HEALTH_QUERY_TIMEOUT   # pyodbc: timeout de cada consulta
+
+    return eng
+
+
+# ---------------------------------------------------------------------------
+# Estado perezoso: engine, fábrica de sesiones y hash de API_PASS
+# ---------------------------------------------------------------------------
+_init_lock = threading.RLock()
+_engine: Optional[Engine] = None
+_probe_engine: Optional[Engine] = None
+_session_factory: Optional[sessionmaker] = None
+_pwd_context = None
+_api_pass_hash: Optional[str] = None
+
+
+def get_engine() -> Engine:
+    global _engine, _session_factory
+    if _engine is None:
+        with _init_lock:
+            if _engine is None:
+                logger.info(
+                    "DB target => server='%s', db='%s', user='%s', driver='%s', encrypt='%s', trust='%s'",
+                    SERVER, DATABASE, USERNAME, DRIVER, ENCRYPT, TRUST
+                )
+                eng = build_engine()
+                _session_factory = sessionmaker(bind=eng, autoflush=False, autocommit=False, future=True)
+                _engine = eng
+    return _engine
+
+
+def get_probe_engine() -> Engine:
+    global _probe_engine
+    if _probe_engine is None:
+        with _init_lock:
+            if _probe_engine is None:
+                _probe_engine = build_probe_engine()
+    return _probe_engine
+
+
+def pool_config() -> dict:
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "db_threads": DB_THREADS,
+    }
+
+
+def SessionLocal() -> Session:
+    """Nueva Session sobre el engine compartido (mismo contrato que un sessionmaker)."""
+    get_engine()
+    return _session_factory()
+
+
+def get_db():
+    db: Session = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+_db_limiter: Optional[anyio.CapacityLimiter] = None
+
+def db_limiter() -> anyio.CapacityLimiter:
+    global _db_limiter
+    if _db_limiter is None:
+        _db_limiter = anyio.CapacityLimiter(DB_THREADS)
+    return _db_limiter
+
+
+async def run_db(func, *args):
+    """
+    Ejecuta trabajo bloqueante de BD (Session/Engine síncronos) en un pool de
+    hilos acotado a DB_THREADS, para no congelar el event loop de uvicorn.
+    """
+    return await anyio.to_thread.run_sync(func, *args, limiter=db_limiter())
+
+
+@asynccontextmanager
+async def db_slot():
+    """
+    Reserva un hueco del límite de run_db mientras dura el bloque: para trabajo
+    que retiene una conexión más allá de una llamada (exportaciones en streaming).
+    """
+    limiter, borrower = db_limiter(), object()
+    await limiter.acquire_on_behalf_of(borrower)
+    try:
+        yield
+    finally:
+        limiter.release_on_behalf_of(borrower)
+
+
+# ---------------------------------------------------------------------------
+# Autenticación
+# ---------------------------------------------------------------------------
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
+token_cache = TokenCache(max_entries=AUTH_CACHE_SIZE, max_ttl=ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+
+
+def _password_context():
+    global _pwd_context
+    if _pwd_context is None:
+        with _init_lock:
+            if _pwd_context is None:
+                from passlib.context import CryptContext
+                _pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
+    return _pwd_context
+
+
+def api_pass_hash() -> str:
+    """Hash pbkdf2 de API_PASS, calculado una sola vez (CPU intensivo)."""
+    global _api_pass_hash
+    if _api_pass_hash is None:
+        with _init_lock:
+            if _api_pass_hash is None:
+                _api_pass_hash = _password_context().hash(API_PASS or "admin123")
+    return _api_pass_hash
+
+
+def verify_password(plain: str, hashed: str) -> bool:
+    return _password_context().verify(plain, hashed)
+
+def authenticate_user(username: str, password: str) -> bool:
+    if username != API_USER:
+        return False
+    return verify_password(password, api_pass_hash())
+
+def create_access_token(subject: str, expires_minutes: int = ACCESS_TOKEN_EXPIRE_MINUTES) -> str:
+    expire = datetime.utcnow() + timedelta(minutes=expires_minutes)
+    to_encode = {"sub": subject, "exp": expire}
+    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> str:
+    sub = token_cache.get(token)
+    if sub is not None:
+        return sub
+
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Token inválido o expirado",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        sub: str = payload.get("sub")
+        if sub is None or sub != API_USER:
+            raise credentials_exception
+        token_cache.put(token, sub, payload.get("exp"))
+        return sub
+    except JWTError:
+        raise credentials_exception
+
+
+# ---------------------------------------------------------------------------
+# Arranque / parada (llamados desde el lifespan de la app)
+# ---------------------------------------------------------------------------
+def startup() -> None:
+    """Trabajo caro diferido: engine (carga pyodbc) y hash de API_PASS."""
+    get_engine()
+    api_pass_hash()
+
+
+def shutdown() -> None:
+    global _engine, _probe_engine
+    with _init_lock:
+        if _probe_engine is not None:
+            _probe_engine.dispose()
+            _probe_engine = None
+        if _engine is not None:
+            _engine.dispose()
+            _engine = None
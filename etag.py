@@ -0,0 +1,66 @@
+# etag.py
+# ETag fuertes y GET condicional (If-None-Match -> 304) para listados y analytics.
+#
+# La etiqueta se deriva de la versión de datos de las tablas que lee el endpoint
+# (cache.data_versions, que ingest.py incrementa en cada COMMIT que cambia filas),
+# de la URL y de un id de arranque del proceso: un reinicio o otro worker de
+# uvicorn nunca reutilizan etiquetas. Se resuelve en una dependencia, después de
+# autenticar y ANTES del handler: un 304 no toca la BD ni serializa nada.
+#
+# Como en la cache de analytics, las escrituras que no pasan por esta API
+# (historico.py, otro worker, cambios a mano) no cambian la versión; la etiqueta
+# incluye además una época de ETAG_TTL segundos para que caduque igualmente.
+
+import os
+import time
+import hashlib
+import secrets
+from typing import Sequence
+
+from fastapi import Depends, HTTPException, Request, Response
+
+from cache import data_versions
+from deps import get_current_user
+from metrics import counter
+
+ETAG_TTL = float(os.getenv("ETAG_TTL", "300"))   # 0 = sin época (solo versión de datos)
+BOOT_ID = secrets.token_hex(4)
+
+CONDITIONAL_REQUESTS = counter(
+    "http_conditional_requests_total", "GET con ETag por resultado", ("result",))
+
+
+def compute_etag(request: Request, tables: Sequence[str]) -> str:
+    epoch = int(time.time() // ETAG_TTL) if ETAG_TTL > 0 else 0
+    query = "&".join(sorted(f"{k}={v}" for k, v in request.query_params.multi_items()))
+    raw = f"{request.url.path}?{query}|{','.join(tables)}|{data_versions.get(tables)}|{epoch}"
+    return f'"{BOOT_ID}-{hashlib.sha1(raw.encode()).hexdigest()[:20]}"'
+
+
+def if_none_match(header: str, etag: str) -> bool:
+    """Comparación débil de If-None-Match (RFC 9110): ignora el prefijo W/."""
+    if header.strip() == "*":
+        return True
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+def conditional_get(*tables: str):
+    """Dependencia: pone ETag/Cache-Control o corta con 304 si el cliente ya lo tiene."""
+    async def _conditional(request: Request, response: Response,
+                           user: str = Depends(get_current_user)) -> None:
+        etag = compute_etag(request, tables)
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        sent = request.headers.get("if-none-match")
+        if sent and if_none_match(sent, etag):
+            CONDITIONAL_REQUESTS.inc(("not_modified",))
+            raise HTTPException(status_code=304, headers=headers)
+        CONDITIONAL_REQUESTS.inc(("modified" if sent else "unconditional",))
+        response.headers.update(headers)
+
+    return _conditional
@@ -0,0 +1,122 @@
+# export.py
+# Exportación completa de tablas en streaming (NDJSON / CSV / Arrow IPC).
+# Las filas se leen del cursor con fetchmany y se emiten por bloques, así la
+# memoria es constante sin importar el tamaño de la tabla.
+
+import io
+import csv
+import json
+import logging
+from typing import Callable, Dict, Iterator, List, Optional, Sequence
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+
+EXPORT_COLUMNS: Dict[str, Sequence[str]] = {
+    "hired_employees": ("id", "name", "datetime", "department_id", "job_id"),
+    "departments":     ("id", "name"),
+    "jobs":            ("id", "name"),
+}
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv":    "text/csv; charset=utf-8",
+    "arrow":  "application/vnd.apache.arrow.stream",
+}
+
+# Convierte un bloque de filas (dicts) antes de serializarlo
+ChunkConverter = Callable[[List[dict]], List[dict]]
+
+
+def iter_table_chunks(engine: Engine, table: str, chunk_size: int) -> Iterator[List[dict]]:
+    """Lee la tabla completa por bloques de chunk_size filas desde un único cursor."""
+    columns = EXPORT_COLUMNS[table]
+    cols = ", ".join(f"[{c}]" for c in columns)
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True).execute(
+            text(f"SELECT {cols} FROM dbo.[{table}] ORDER BY id")
+        )
+        while True:
+            rows = result.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield [dict(zip(columns, r)) for r in rows]
+
+
+def _ndjson(chunks: Iterator[List[dict]], columns: Sequence[str]) -> Iterator[bytes]:
+    for rows in chunks:
+        yield "".join(json.dumps(r, ensure_ascii=False, default=str) + "\n" for r in rows).encode("utf-8")
+
+
+def _csv(chunks: Iterator[List[dict]], columns: Sequence[str]) -> Iterator[bytes]:
+    buf = io.StringIO()
+    w = csv.writer(buf, lineterminator="\n")
+    w.writerow(columns)
+    for rows in chunks:
+        w.writerows([r[c] for c in columns] for r in rows)
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+
+def _arrow_schema(table: str):
+    import pyarrow as pa
+    if table == "hired_employees":
+        return pa.schema([
+            ("id", pa.int64()),
+            ("name", pa.string()),
+            ("datetime", pa.string()),
+            ("department_id", pa.int64()),
+            ("job_id", pa.int64()),
+        ])
+    return pa.schema([("id", pa.int64()), ("name", pa.string())])
+
+
+def _arrow(chunks: Iterator[List[dict]], columns: Sequence[str], table: str) -> Iterator[bytes]:
+    import pyarrow as pa
+    schema = _arrow_schema(table)
+    sink = io.BytesIO()
+
+    def drain() -> bytes:
+        data = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return data
+
+    with pa.ipc.new_stream(sink, schema) as writer:
+        yield drain()  # cabecera con el esquema
+        for rows in chunks:
+            batch = pa.RecordBatch.from_pydict({c: [r[c] for r in rows] for c in columns}, schema=schema)
+            writer.write_batch(batch)
+            yield drain()
+    yield drain()  # marca de fin de stream
+
+
+def stream_table(engine: Engine, table: str, fmt: str, chunk_size: int = 5000,
+                 convert: Optional[ChunkConverter] = None) -> Iterator[bytes]:
+    """Generador de bytes con la tabla completa serializada en fmt (ndjson | csv | arrow)."""
+    columns = EXPORT_COLUMNS[table]
+    chunks = iter_table_chunks(engine, table, chunk_size)
+    if convert is not None:
+        chunks = (convert(rows) for rows in chunks)
+
+    if fmt == "ndjson":
+        body = _ndjson(chunks, columns)
+    elif fmt == "csv":
+        body = _csv(chunks, columns)
+    elif fmt == "arrow":
+        body = _arrow(chunks, columns, table)
+    else:
+        raise ValueError(f"Formato de exportación no soportado: {fmt}")
+
+    try:
+        yield from body
+    except Exception as e:
+        # Las cabeceras ya se enviaron: solo queda cortar el stream y dejar rastro
+        logger.error("Exportación de %s interrumpida: %s", table, e)
+        raise
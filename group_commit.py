@@ -0,0 +1,216 @@
+# group_commit.py
+# Ingesta asíncrona con group commit: muchas peticiones pequeñas se encolan y un
+# único hilo escritor las agrupa en transacciones grandes (una por tabla y ciclo).
+
+import time
+import uuid
+import queue
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from ingest import DUPLICATE, dedupe_by_id, insert_rows
+
+logger = logging.getLogger(__name__)
+
+
+class IngestJob:
+    """Estado de un lote encolado (lo que devuelve GET /ingest/jobs/{id})."""
+
+    def __init__(self, table: str, rows: List[Dict[str, Any]], errors: Optional[List[str]] = None):
+        self.id = uuid.uuid4().hex
+        self.table = table
+        self.rows = rows
+        self.status = "queued"
+        self.errors: List[str] = list(errors or [])
+        self.received = len(rows) + len(self.errors)
+        self.inserted = 0
+        self.duplicates = 0
+        self.created_at = datetime.now(timezone.utc)
+        self.finished_at: Optional[datetime] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "table": self.table,
+            "status": self.status,
+            "received": self.received,
+            "inserted": self.inserted,
+            "duplicates": self.duplicates,
+            "errors": self.errors,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class GroupCommitWriter:
+    """
+    Hilo escritor con group commit.
+
+    - submit() encola el lote y devuelve el job al instante
+    - el hilo espera hasta max_wait segundos o max_rows filas, agrupa los lotes
+      pendientes por tabla y escribe cada grupo en una sola transacción
+    - si la transacción del grupo falla, reintenta cada job por separado: solo
+      queda "failed" el job cuya escritura falla
+    - los jobs terminados se conservan job_ttl segundos (como mucho max_jobs)
+    """
+
+    def __init__(self, session_factory, max_rows: int = 5000, max_wait: float = 0.05,
+                 max_queue: int = 1000, job_ttl: float = 3600, max_jobs: int = 10000):
+        self.session_factory = session_factory
+        self.max_rows = max_rows
+        self.max_wait = max_wait
+        self.job_ttl = job_ttl
+        self.max_jobs = max_jobs
+        self._queue: "queue.Queue[IngestJob]" = queue.Queue(maxsize=max_queue)
+        self._jobs: "OrderedDict[str, IngestJob]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    # --- API pública -------------------------------------------------------
+    def submit(self, table: str, rows: List[Dict[str, Any]], errors: Optional[List[str]] = None) -> IngestJob:
+        """
+        Encola un lote (errors: rechazos ya detectados antes de encolar).
+        Lanza queue.Full si el escritor va atrasado.
+        """
+        self._ensure_started()
+        job = IngestJob(table, rows, errors)
+        with self._lock:
+            self._evict()
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                self._jobs.pop(job.id, None)
+            raise
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Detiene el hilo tras vaciar la cola."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    # --- Internos -----------------------------------------------------------
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="ingest-group-commit", daemon=True)
+                self._thread.start()
+
+    def _evict(self) -> None:
+        # Los jobs pendientes nunca se descartan (ya están acotados por max_queue)
+        now = datetime.now(timezone.utc)
+        while self._jobs:
+            oldest = next(iter(self._jobs.values()))
+            if oldest.finished_at is None:
+                break
+            fresh = (now - oldest.finished_at).total_seconds() <= self.job_ttl
+            if fresh and len(self._jobs) < self.max_jobs:
+                break
+            self._jobs.popitem(last=False)
+
+    def _collect(self) -> List[IngestJob]:
+        try:
+            first = self._queue.get(timeout=0.5)
+        except queue.Empty:
+            return []
+        jobs = [first]
+        rows = len(first.rows)
+        deadline = time.monotonic() + self.max_wait
+        while rows < self.max_rows:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                job = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            jobs.append(job)
+            rows += len(job.rows)
+        return jobs
+
+    def _run(self) -> None:
+        while not (self._stop.is_set() and self._queue.empty()):
+            jobs = self._collect()
+            if not jobs:
+                continue
+            by_table: Dict[str, List[IngestJob]] = {}
+            for job in jobs:
+                job.status = "running"
+                by_table.setdefault(job.table, []).append(job)
+            for table, group in by_table.items():
+                try:
+                    self._commit_group(table, group)
+                except Exception as e:
+                    logger.exception("Fallo inesperado en el escritor de ingesta")
+                    self._finish(group, failed=str(e))
+
+    def _commit_group(self, table: str, group: List[IngestJob]) -> None:
+        # Un id repetido entre jobs del mismo grupo cuenta como duplicado del posterior
+        owner: Dict[Any, IngestJob] = {}
+        rows: List[Dict[str, Any]] = []
+        duplicates = {job.id: 0 for job in group}
+        for job in group:
+            unique, repeated = dedupe_by_id(job.rows)
+            duplicates[job.id] += repeated
+            for r in unique:
+                if r["id"] in owner:
+                    duplicates[job.id] += 1
+                    continue
+                owner[r["id"]] = job
+                rows.append(r)
+
+        db = self.session_factory()
+        try:
+            rejected = insert_rows(db, table, rows) if rows else {}
+        except Exception as e:
+            if len(group) > 1:
+                # Un job no debe hacer fallar a los demás: cada uno en su transacción
+                logger.warning("Group commit de %s (%s jobs) falló: %s; se reintenta job a job",
+                               table, len(group), e)
+                for job in group:
+                    self._commit_group(table, [job])
+                return
+            logger.error("Escritura del job %s en %s falló: %s", group[0].id, table, e)
+            self._finish(group, failed=str(e))
+            return
+        finally:
+            db.close()
+
+        accepted = {job.id: 0 for job in group}
+        for rid, job in owner.items():
+            reason = rejected.get(rid)
+            if reason is None:
+                accepted[job.id] += 1
+            elif reason == DUPLICATE:
+                duplicates[job.id] += 1
+            else:
+                job.errors.append(reason)
+        for job in group:
+            job.inserted = accepted[job.id]
+            job.duplicates += duplicates[job.id]
+        logger.info("Group commit de %s: %s jobs, %s filas en una transacción", table, len(group), len(rows))
+        self._finish(group)
+
+    def _finish(self, group: List[IngestJob], failed: Optional[str] = None) -> None:
+        now = datetime.now(timezone.utc)
+        for job in group:
+            if failed:
+                job.status = "failed"
+                job.errors.append(f"Error de escritura: {failed}")
+            else:
+                job.status = "done"
+            job.finished_at = now
+            job.rows = []  # liberar memoria
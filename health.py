@@ -0,0 +1,87 @@
+# health.py
+# Sonda de salud de la BD en segundo plano: un hilo propio hace SELECT 1 cada
+# `interval` segundos y deja el resultado en memoria. /health responde desde
+# aquí sin tocar el pool, así no se encola detrás del tráfico real ni oscila
+# cuando la BD está bajo carga.
+
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+STARTING  = "starting"
+HEALTHY   = "healthy"
+UNHEALTHY = "unhealthy"
+STALE     = "stale"      # la sonda no ha terminado a tiempo (BD colgada / hilo bloqueado)
+
+
+class HealthProbe:
+    def __init__(self, ping: Callable[[], None], interval: float = 5.0, stale_after: Optional[float] = None):
+        self.ping = ping
+        self.interval = interval
+        self.stale_after = stale_after if stale_after is not None else 3 * interval
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._status = STARTING
+        self._latency_ms: Optional[float] = None
+        self._error: Optional[str] = None
+        self._checked_at: Optional[float] = None     # time.time() de la última sonda terminada
+        self._checked_mono: Optional[float] = None
+        self._failures = 0
+
+    def start(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="health-probe", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def probe(self) -> Dict[str, Any]:
+        """Una sonda síncrona (la usa el hilo y también /health?deep=true)."""
+        t0 = time.perf_counter()
+        try:
+            self.ping()
+            error = None
+        except Exception as e:
+            error = str(e)
+        latency = (time.perf_counter() - t0) * 1000.0
+        with self._lock:
+            if error is None:
+                if self._status != HEALTHY:
+                    logger.info("Health: BD disponible (%.1fms)", latency)
+                self._status, self._failures = HEALTHY, 0
+            else:
+                if self._status != UNHEALTHY:
+                    logger.warning("Health: BD no disponible: %s", error)
+                self._status = UNHEALTHY
+                self._failures += 1
+            self._latency_ms, self._error = latency, error
+            self._checked_at, self._checked_mono = time.time(), time.monotonic()
+        return self.snapshot()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            status = self._status
+            age = time.monotonic() - self._checked_mono if self._checked_mono is not None else None
+            if status != STARTING and age is not None and age > self.stale_after:
+                status = STALE
+            return {
+                "status": status,
+                "latency_ms": round(self._latency_ms, 3) if self._latency_ms is not None else None,
+                "checked_at": self._checked_at,
+                "age_s": round(age, 3) if age is not None else None,
+                "consecutive_failures": self._failures,
+                "error": self._error,
+            }
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.probe()
+            self._stop.wait(self.interval)
@@ -7,6 +7,8 @@ import pandas as pd
 from sqlalchemy import create_engine, text
 from dotenv import load_dotenv
 
+from agregados import apply_employee_ids
+
 
 os.makedirs("logs", exist_ok=True)
 logging.basicConfig(
@@ -69,13 +71,17 @@ def load_data_from_csv(file_path: str, table_name: str, engine, chunk_size: int
 
         for i, chunk in enumerate(pd.read_csv(file_path, chunksize=chunk_size)):
 
-            chunk.to_sql(
-                table_name,
-                con=engine,
-                if_exists="append",
-                index=False,
-                method="multi"   
-            )
+            # Chunk y su suma en hiring_agg en la misma transacción
+            with engine.begin() as conn:
+                chunk.to_sql(
+                    table_name,
+                    con=conn,
+                    if_exists="append",
+                    index=False,
+                    method="multi"
+                )
+                if table_name == "hired_employees":
+                    apply_employee_ids(conn, chunk["id"])
             total_rows += len(chunk)
             logger.info(f"   Lote {i+1}: {len(chunk)} filas (acumulado={total_rows})")
 
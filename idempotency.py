@@ -0,0 +1,82 @@
+# idempotency.py
+# Memoria de lotes de ingesta ya procesados por Idempotency-Key: un reintento del
+# cliente (p. ej. tras un timeout) recibe la misma respuesta sin tocar la BD.
+
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+NEW         = "new"          # primera vez: procesar y llamar a complete()/release()
+REPLAY      = "replay"       # ya completado: devolver la respuesta guardada
+IN_PROGRESS = "in_progress"  # otra petición con la misma clave está en curso
+MISMATCH    = "mismatch"     # misma clave, payload distinto
+
+
+def fingerprint(payload: Any) -> str:
+    """Hash estable del payload (para detectar claves reutilizadas con otro contenido)."""
+    raw = json.dumps(payload, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _Entry:
+    __slots__ = ("fingerprint", "expires_at", "status_code", "body")
+
+    def __init__(self, fp: str, expires_at: float):
+        self.fingerprint = fp
+        self.expires_at = expires_at
+        self.status_code: Optional[int] = None
+        self.body: Optional[Dict[str, Any]] = None
+
+
+class IdempotencyStore:
+    """
+    Almacén en memoria del proceso, acotado a max_entries y con expiración ttl.
+    Las claves se guardan en orden de llegada, así que las expiradas están al frente.
+    """
+
+    def __init__(self, ttl: float = 86400, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def begin(self, key: Hashable, fp: str) -> Tuple[str, Optional[_Entry]]:
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            entry = self._entries.get(key)
+            if entry is None:
+                self._entries[key] = _Entry(fp, now + self.ttl)
+                return NEW, None
+            if entry.fingerprint != fp:
+                return MISMATCH, entry
+            if entry.body is None:
+                return IN_PROGRESS, entry
+            return REPLAY, entry
+
+    def complete(self, key: Hashable, status_code: int, body: Dict[str, Any]) -> None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.status_code = status_code
+                entry.body = body
+
+    def release(self, key: Hashable) -> None:
+        """Olvida una clave cuyo procesamiento falló, para permitir el reintento."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.body is None:
+                del self._entries[key]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _evict(self, now: float) -> None:
+        while self._entries:
+            oldest = next(iter(self._entries.values()))
+            if oldest.expires_at > now and len(self._entries) < self.max_entries:
+                break
+            self._entries.popitem(last=False)
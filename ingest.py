@@ -0,0 +1,352 @@
+# ingest.py
+# Ingesta masiva basada en conjuntos: el lote se carga de una vez en una tabla
+# temporal (#stage) y luego sentencias set-based clasifican e insertan las filas.
+# Un lote con duplicados cuesta lo mismo que un lote limpio.
+
+import time
+from typing import Any, Dict, Iterable, List, Sequence
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from agregados import apply_employee_stage
+from cache import data_versions
+from metrics import record_ingest
+
+
+EMPLOYEE_COLUMNS = ("id", "name", "datetime", "department_id", "job_id")
+CATALOG_COLUMNS  = ("id", "name")
+CATALOG_TABLES   = ("departments", "jobs")
+
+# Motivos de rechazo que devuelve la clasificación en BD
+DUPLICATE = "duplicate"
+
+_EMPLOYEE_STAGE = "#stage_hired_employees"
+
+# Longitudes de dbo.hired_employees. La staging admite un carácter más y
+# _clip_lengths recorta a ese tamaño: un valor largo se rechaza por fila en la
+# clasificación en vez de tumbar el lote entero con un error de truncamiento
+# (sin NVARCHAR(MAX), que fast_executemany envía mucho más lento).
+EMPLOYEE_MAX_LENGTHS = {"name": 255, "datetime": 50}
+
+_EMPLOYEE_STAGE_DDL = f"""
+    CREATE TABLE {_EMPLOYEE_STAGE} (
+        id INT NOT NULL,
+        name NVARCHAR({EMPLOYEE_MAX_LENGTHS["name"] + 1}) NULL,
+        [datetime] NVARCHAR({EMPLOYEE_MAX_LENGTHS["datetime"] + 1}) NULL,
+        department_id INT NULL,
+        job_id INT NULL,
+        reason VARCHAR(20) NULL
+    )
+"""
+
+# UPDLOCK/HOLDLOCK: la clasificación de duplicados queda protegida hasta el
+# commit, así ningún lote concurrente puede insertar el mismo id entremedio.
+_EMPLOYEE_CLASSIFY = f"""
+    UPDATE s SET reason = CASE
+        WHEN EXISTS (SELECT 1 FROM dbo.[hired_employees] h WITH (UPDLOCK, HOLDLOCK)
+                     WHERE h.id = s.id) THEN 'duplicate'
+        WHEN s.name IS NULL THEN 'name'
+        WHEN s.[datetime] IS NULL THEN 'datetime'
+        WHEN LEN(s.name + N'.') - 1 > {EMPLOYEE_MAX_LENGTHS["name"]} THEN 'name_length'
+        WHEN LEN(s.[datetime] + N'.') - 1 > {EMPLOYEE_MAX_LENGTHS["datetime"]} THEN 'datetime_length'
+        WHEN s.department_id IS NOT NULL
+             AND NOT EXISTS (SELECT 1 FROM dbo.[departments] d WHERE d.id = s.department_id)
+             THEN 'department_id'
+        WHEN s.job_id IS NOT NULL
+             AND NOT EXISTS (SELECT 1 FROM dbo.[jobs] j WHERE j.id = s.job_id)
+             THEN 'job_id'
+    END
+    FROM {_EMPLOYEE_STAGE} s
+"""
+
+_EMPLOYEE_INSERT = f"""
+    INSERT INTO dbo.[hired_employees] (id, name, [datetime], department_id, job_id)
+    SELECT id, name, [datetime], department_id, job_id
+    FROM {_EMPLOYEE_STAGE}
+    WHERE reason IS NULL
+"""
+
+_EMPLOYEE_REJECTED = f"SELECT id, reason FROM {_EMPLOYEE_STAGE} WHERE reason IS NOT NULL"
+
+
+def dedupe_by_id(rows: Iterable[Dict[str, Any]], keep_last: bool = False):
+    """Quita ids repetidos dentro del lote (gana la primera aparición, o la última con keep_last)."""
+    unique: Dict[Any, Dict[str, Any]] = {}
+    repeated = 0
+    for r in rows:
+        if r["id"] in unique:
+            repeated += 1
+            if not keep_last:
+                continue
+        unique[r["id"]] = r
+    return list(unique.values()), repeated
+
+
+def _create_stage(db: Session, name: str, ddl: str) -> None:
+    # Las conexiones del pool se reutilizan: una #tabla de una petición fallida
+    # podría seguir viva en la sesión de SQL Server.
+    db.execute(text(f"IF OBJECT_ID('tempdb..{name}') IS NOT NULL DROP TABLE {name}"))
+    db.execute(text(ddl))
+
+
+def _load_stage(db: Session, name: str, columns: Sequence[str], rows: List[Dict[str, Any]]) -> None:
+    cols = ", ".join(f"[{c}]" for c in columns)
+    params = ", ".join(f":{c}" for c in columns)
+    # executemany -> fast_executemany (ver build_engine en app.py)
+    db.execute(text(f"INSERT INTO {name} ({cols}) VALUES ({params})"), rows)
+
+
+def _clip_lengths(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Recorta a longitud máxima + 1 (basta para detectar el exceso en la clasificación)."""
+    out = rows
+    for field, limit in EMPLOYEE_MAX_LENGTHS.items():
+        if any(isinstance(r.get(field), str) and len(r[field]) > limit for r in out):
+            if out is rows:
+                out = [dict(r) for r in rows]
+            for r in out:
+                v = r.get(field)
+                if isinstance(v, str) and len(v) > limit:
+                    r[field] = v[:limit + 1]
+    return out
+
+
+def _drop_stage(db: Session, name: str) -> None:
+    db.execute(text(f"DROP TABLE {name}"))
+
+
+def _reject_message(row: Dict[str, Any], reason: str) -> str:
+    if reason in ("name", "datetime"):
+        return f"ID {row['id']}: {reason} es obligatorio"
+    if reason.endswith("_length"):
+        field = reason[:-len("_length")]
+        return f"ID {row['id']}: {field} supera {EMPLOYEE_MAX_LENGTHS[field]} caracteres"
+    return f"ID {row['id']}: {reason} {row.get(reason)} no existe"
+
+
+def summarize(received: int, repeated: int, rejected: Dict[Any, str]) -> Dict[str, Any]:
+    """Convierte {id: motivo} de filas rechazadas al formato de BatchResponse."""
+    errors = [m for m in rejected.values() if m != DUPLICATE]
+    return {
+        "inserted": received - len(rejected),
+        "duplicates": repeated + len(rejected) - len(errors),
+        "errors": errors,
+    }
+
+
+def insert_employees(db: Session, rows: List[Dict[str, Any]]) -> Dict[Any, str]:
+    """
+    Inserta filas de hired_employees (ids ya únicos) en una sola transacción.
+
+    1. executemany del lote a #stage_hired_employees
+    2. UPDATE set-based que marca duplicados y filas inválidas (NOT NULL / longitud / FK)
+    3. INSERT ... SELECT de las filas sin motivo de rechazo
+    4. MERGE de sus conteos en hiring_agg (agregados.py), si ya existe
+
+    Returns: {id: DUPLICATE o mensaje de error} de las filas rechazadas
+    """
+    by_id = {r["id"]: r for r in rows}
+    t0 = time.perf_counter()
+    try:
+        _create_stage(db, _EMPLOYEE_STAGE, _EMPLOYEE_STAGE_DDL)
+        _load_stage(db, _EMPLOYEE_STAGE, EMPLOYEE_COLUMNS, _clip_lengths(rows))
+        db.execute(text(_EMPLOYEE_CLASSIFY))
+        db.execute(text(_EMPLOYEE_INSERT))
+        apply_employee_stage(db)
+        rejected = db.execute(text(_EMPLOYEE_REJECTED)).all()
+        _drop_stage(db, _EMPLOYEE_STAGE)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    record_ingest("hired_employees", time.perf_counter() - t0,
+                  inserted=len(rows) - len(rejected), rejected=len(rejected))
+    if len(rows) > len(rejected):
+        data_versions.bump("hired_employees")
+
+    return {
+        rid: reason if reason == DUPLICATE else _reject_message(by_id[rid], reason)
+        for rid, reason in rejected
+    }
+
+
+def ingest_employees_bulk(db: Session, rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Inserta un lote de hired_employees en una sola transacción (ver insert_employees).
+
+    Returns: dict con inserted, duplicates y errors (mismo formato que BatchResponse)
+    """
+    unique, repeated = dedupe_by_id(rows)
+    return summarize(len(unique), repeated, insert_employees(db, unique))
+
+
+_CATALOG_STAGE_DDL = """
+    CREATE TABLE {stage} (
+        id INT NOT NULL PRIMARY KEY,
+        name NVARCHAR(255) NOT NULL,
+        reason VARCHAR(20) NULL
+    )
+"""
+
+_CATALOG_CLASSIFY = """
+    UPDATE s SET reason = 'duplicate'
+    FROM {stage} s
+    WHERE EXISTS (SELECT 1 FROM dbo.[{table}] t WITH (UPDLOCK, HOLDLOCK) WHERE t.id = s.id)
+"""
+
+_CATALOG_INSERT = """
+    INSERT INTO dbo.[{table}] (id, name)
+    SELECT id, name FROM {stage} WHERE reason IS NULL
+"""
+
+_CATALOG_DUPLICATES = "SELECT id FROM {stage} WHERE reason IS NOT NULL"
+
+# Upsert: una sola sentencia; solo reescribe filas cuyo nombre cambió
+_CATALOG_MERGE = """
+    MERGE dbo.[{table}] WITH (HOLDLOCK) AS t
+    USING {stage} AS s ON t.id = s.id
+    WHEN MATCHED AND t.name <> s.name THEN
+        UPDATE SET name = s.name
+    WHEN NOT MATCHED BY TARGET THEN
+        INSERT (id, name) VALUES (s.id, s.name)
+    OUTPUT $action;
+"""
+
+
+def insert_catalog(db: Session, table: str, rows: List[Dict[str, Any]]) -> Dict[Any, str]:
+    """
+    Inserta filas de departments/jobs (ids ya únicos) en una sola transacción;
+    los ids existentes no se tocan.
+
+    Returns: {id: DUPLICATE} de las filas rechazadas
+    """
+    if table not in CATALOG_TABLES:
+        raise ValueError(f"Tabla de catálogo no soportada: {table}")
+
+    stage = f"#stage_{table}"
+    fmt = {"stage": stage, "table": table}
+    t0 = time.perf_counter()
+    try:
+        _create_stage(db, stage, _CATALOG_STAGE_DDL.format(**fmt))
+        _load_stage(db, stage, CATALOG_COLUMNS, rows)
+        db.execute(text(_CATALOG_CLASSIFY.format(**fmt)))
+        db.execute(text(_CATALOG_INSERT.format(**fmt)))
+        rejected = db.execute(text(_CATALOG_DUPLICATES.format(**fmt))).scalars().all()
+        _drop_stage(db, stage)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    record_ingest(table, time.perf_counter() - t0, inserted=len(rows) - len(rejected), rejected=len(rejected))
+    if len(rows) > len(rejected):
+        data_versions.bump(table)
+
+    return {rid: DUPLICATE for rid in rejected}
+
+
+def upsert_catalog(db: Session, table: str, rows: List[Dict[str, Any]]) -> Dict[str, int]:
+    """
+    MERGE set-based de departments/jobs (ids ya únicos) en una sola transacción:
+    los ids nuevos se insertan y los existentes con nombre distinto se actualizan.
+
+    Returns: dict con inserted y updated
+    """
+    if table not in CATALOG_TABLES:
+        raise ValueError(f"Tabla de catálogo no soportada: {table}")
+
+    stage = f"#stage_{table}"
+    fmt = {"stage": stage, "table": table}
+    t0 = time.perf_counter()
+    try:
+        _create_stage(db, stage, _CATALOG_STAGE_DDL.format(**fmt))
+        _load_stage(db, stage, CATALOG_COLUMNS, rows)
+        actions = db.execute(text(_CATALOG_MERGE.format(**fmt))).scalars().all()
+        _drop_stage(db, stage)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    res = {"inserted": actions.count("INSERT"), "updated": actions.count("UPDATE")}
+    record_ingest(table, time.perf_counter() - t0, unchanged=len(rows) - len(actions), **res)
+    if actions:
+        data_versions.bump(table)
+    return res
+
+
+def ingest_catalog_bulk(db: Session, table: str, rows: List[Dict[str, Any]], upsert: bool = False) -> Dict[str, Any]:
+    """
+    Inserta (o actualiza con upsert=True) un lote de departments/jobs en una sola transacción.
+
+    - insert: los ids existentes se cuentan como duplicados y no se tocan
+    - upsert: MERGE set-based; los ids existentes con nombre distinto se actualizan,
+      los idénticos se cuentan como duplicados
+
+    Returns: dict con inserted, updated, duplicates y errors
+    """
+    unique, repeated = dedupe_by_id(rows, keep_last=upsert)
+    if not upsert:
+        return {"updated": 0, **summarize(len(unique), repeated, insert_catalog(db, table, unique))}
+
+    res = upsert_catalog(db, table, unique)
+    return {
+        "inserted": res["inserted"],
+        "updated": res["updated"],
+        "duplicates": repeated + len(unique) - res["inserted"] - res["updated"],
+        "errors": [],
+    }
+
+
+def insert_rows(db: Session, table: str, rows: List[Dict[str, Any]]) -> Dict[Any, str]:
+    """Despacha insert_employees / insert_catalog según la tabla."""
+    if table == "hired_employees":
+        return insert_employees(db, rows)
+    return insert_catalog(db, table, rows)
+
+
+# ---------------------------------------------------------------------------
+# Lectura por lotes de archivos (CSV / Parquet / Avro, mismo layout que respaldo.py)
+# ---------------------------------------------------------------------------
+FILE_FORMATS = {".csv": "csv", ".parquet": "parquet", ".avro": "avro"}
+
+
+def _clean_value(v):
+    if v is None:
+        return None
+    if isinstance(v, float) and v != v:  # NaN de pandas
+        return None
+    if hasattr(v, "isoformat"):  # datetime / Timestamp
+        return v.isoformat()
+    return v
+
+
+def _clean_records(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [{k: _clean_value(v) for k, v in r.items()} for r in records]
+
+
+def iter_file_batches(fileobj, fmt: str, batch_size: int):
+    """Genera listas de registros (dict) de como mucho batch_size filas."""
+    if fmt == "csv":
+        import pandas as pd
+        for df in pd.read_csv(fileobj, chunksize=batch_size, dtype=object, keep_default_na=False, na_values=[""]):
+            yield _clean_records(df.to_dict(orient="records"))
+
+    elif fmt == "parquet":
+        import pyarrow.parquet as pq
+        pf = pq.ParquetFile(fileobj)
+        for rb in pf.iter_batches(batch_size=batch_size):
+            yield _clean_records(rb.to_pylist())
+
+    elif fmt == "avro":
+        from fastavro import reader as avro_reader
+        batch: List[Dict[str, Any]] = []
+        for rec in avro_reader(fileobj):
+            batch.append(rec)
+            if len(batch) >= batch_size:
+                yield _clean_records(batch)
+                batch = []
+        if batch:
+            yield _clean_records(batch)
+
+    else:
+        raise ValueError(f"Formato no soportado: {fmt}")
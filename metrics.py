@@ -0,0 +1,397 @@
+# metrics.py
+# Métricas en memoria del proceso, exportables en formato de texto de Prometheus.
+#
+# - pool de conexiones: eventos de SQLAlchemy (connect / checkout / checkin /
+#   close / invalidate). La espera por una conexión no tiene evento propio, así
+#   que se mide en TimedQueuePool._do_get, el punto donde QueuePool bloquea.
+# - consultas: before/after_cursor_execute, agrupadas por huella de la sentencia
+# - rutas: middleware ASGI con la plantilla de ruta (/ingest/jobs/{job_id})
+# - ingesta: filas por tabla y resultado (rows/s = rate() en Prometheus)
+
+import re
+import time
+import bisect
+import threading
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+
+# Límites superiores en ms (el último bucket, +Inf, es implícito)
+DEFAULT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class Histogram:
+    """Histograma acumulativo al estilo Prometheus (cuentas por límite superior)."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS_MS):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+            self._count += 1
+            if value > self._max:
+                self._max = value
+
+    def prometheus_lines(self, name: str, labelnames: Sequence[str], labels: Sequence[str],
+                         scale: float = 1.0) -> List[str]:
+        """Líneas _bucket/_sum/_count; scale convierte la unidad (p. ej. 0.001 para ms -> s)."""
+        with self._lock:
+            counts, total, n = list(self._counts), self._sum, self._count
+        lines, acc = [], 0
+        for bound, c in zip(list(self.buckets) + [None], counts):
+            acc += c
+            le = "+Inf" if bound is None else _num(float(bound) * scale)
+            le_label = f'le="{le}"'
+            lines.append(f"{name}_bucket{_labels(labelnames, labels, le_label)} {acc}")
+        lines.append(f"{name}_sum{_labels(labelnames, labels)} {_num(total * scale)}")
+        lines.append(f"{name}_count{_labels(labelnames, labels)} {n}")
+        return lines
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counts, total, n, mx = list(self._counts), self._sum, self._count, self._max
+        cumulative, acc = {}, 0
+        for bound, c in zip(list(self.buckets) + ["+Inf"], counts):
+            acc += c
+            cumulative[str(bound)] = acc
+        return {
+            "buckets": cumulative,
+            "count": n,
+            "sum": round(total, 3),
+            "mean": round(total / n, 3) if n else 0.0,
+            "max": round(mx, 3),
+        }
+
+
+# Segundos, para las familias exportadas a Prometheus
+LATENCY_BUCKETS_S = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(v: float) -> str:
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class _Family:
+    """Serie con etiquetas; pasado max_series, las combinaciones nuevas van a "other"."""
+
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), max_series: int = 500):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.max_series = max_series
+        self._series: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, labels: Tuple[str, ...]):
+        series = self._series.get(labels)
+        if series is None:
+            with self._lock:
+                if labels not in self._series and len(self._series) >= self.max_series:
+                    labels = ("other",) * len(self.labelnames)
+                series = self._series.get(labels)
+                if series is None:
+                    series = self._series[labels] = self._new()
+        return series
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for labels, series in sorted(self._series.items()):
+            lines.extend(self._render_series(labels, series))
+        return lines
+
+
+class CounterFamily(_Family):
+    kind = "counter"
+
+    def _new(self):
+        return [0]
+
+    def inc(self, labels: Tuple[str, ...] = (), n: float = 1) -> None:
+        series = self._get(labels)
+        with self._lock:
+            series[0] += n
+
+    def _render_series(self, labels, series):
+        return [f"{self.name}{_labels(self.labelnames, labels)} {_num(series[0])}"]
+
+
+class HistogramFamily(_Family):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS_S, max_series: int = 500):
+        super().__init__(name, help, labelnames, max_series)
+        self.buckets = tuple(buckets)
+
+    def _new(self):
+        return Histogram(self.buckets)
+
+    def observe(self, labels: Tuple[str, ...], value: float) -> None:
+        self._get(labels).observe(value)
+
+    def _render_series(self, labels, hist: "Histogram"):
+        return hist.prometheus_lines(self.name, self.labelnames, labels)
+
+
+REGISTRY: List[_Family] = []
+
+
+def counter(name: str, help: str, labelnames: Sequence[str] = ()) -> CounterFamily:
+    fam = CounterFamily(name, help, labelnames)
+    REGISTRY.append(fam)
+    return fam
+
+
+def histogram(name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS_S) -> HistogramFamily:
+    fam = HistogramFamily(name, help, labelnames, buckets)
+    REGISTRY.append(fam)
+    return fam
+
+
+def gauge_lines(name: str, help: str, value: float, labelnames: Sequence[str] = (), labels: Sequence[str] = ()) -> List[str]:
+    return [f"# HELP {name} {help}", f"# TYPE {name} gauge", f"{name}{_labels(labelnames, labels)} {_num(value)}"]
+
+
+def render_prometheus(extra: Sequence[str] = ()) -> str:
+    lines: List[str] = []
+    for fam in REGISTRY:
+        lines.extend(fam.render())
+    lines.extend(extra)
+    return "\n".join(lines) + "\n"
+
+
+class PoolMetrics:
+    def __init__(self):
+        self.checkout_wait_ms = Histogram()
+        self._lock = threading.Lock()
+        self.counters = {
+            "checkouts": 0,
+            "checkins": 0,
+            "timeouts": 0,
+            "opened": 0,
+            "closed": 0,
+            "invalidated": 0,
+        }
+
+    def inc(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += n
+
+    def attach(self, engine: Engine) -> None:
+        """Registra los eventos del pool del engine (se conservan tras engine.dispose())."""
+        @event.listens_for(engine, "connect")
+        def _connect(dbapi_conn, record):
+            self.inc("opened")
+
+        @event.listens_for(engine, "close")
+        def _close(dbapi_conn, record):
+            self.inc("closed")
+
+        @event.listens_for(engine, "invalidate")
+        def _invalidate(dbapi_conn, record, error):
+            self.inc("invalidated")
+
+        @event.listens_for(engine, "checkout")
+        def _checkout(dbapi_conn, record, proxy):
+            self.inc("checkouts")
+
+        @event.listens_for(engine, "checkin")
+        def _checkin(dbapi_conn, record):
+            self.inc("checkins")
+
+    def snapshot(self, engine: Engine) -> Dict[str, Any]:
+        pool = engine.pool
+        with self._lock:
+            counters = dict(self.counters)
+        current = {}
+        if isinstance(pool, QueuePool):
+            current = {
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                "overflow": max(pool.overflow(), 0),
+            }
+        return {
+            **current,
+            "checkouts": counters["checkouts"],
+            "checkins": counters["checkins"],
+            "timeouts": counters["timeouts"],
+            "connections": {
+                "opened": counters["opened"],
+                "closed": counters["closed"],
+                "invalidated": counters["invalidated"],
+            },
+            "checkout_wait_ms": self.checkout_wait_ms.snapshot(),
+        }
+
+
+    def prometheus_lines(self, engine: Engine) -> List[str]:
+        snap = self.snapshot(engine)
+        lines: List[str] = []
+        for key in ("size", "checked_out", "checked_in", "overflow"):
+            if key in snap:
+                lines += gauge_lines(f"db_pool_{key}", f"Conexiones del pool: {key}", snap[key])
+        with self._lock:
+            counters = dict(self.counters)
+        for key, value in counters.items():
+            lines += [f"# HELP db_pool_{key}_total Eventos del pool: {key}",
+                      f"# TYPE db_pool_{key}_total counter",
+                      f"db_pool_{key}_total {value}"]
+        lines += ["# HELP db_pool_checkout_wait_seconds Espera por una conexión libre",
+                  "# TYPE db_pool_checkout_wait_seconds histogram"]
+        lines += self.checkout_wait_ms.prometheus_lines("db_pool_checkout_wait_seconds", (), (), scale=0.001)
+        return lines
+
+
+pool_metrics = PoolMetrics()
+
+
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool que mide cuánto espera cada checkout por una conexión libre
+    (incluye abrir una conexión nueva cuando el pool crece hacia el overflow).
+    """
+
+    def _do_get(self):
+        t0 = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            pool_metrics.inc("timeouts")
+            raise
+        finally:
+            pool_metrics.checkout_wait_ms.observe((time.perf_counter() - t0) * 1000.0)
+
+
+# ---------------------------------------------------------------------------
+# Consultas: duración y filas por huella de sentencia
+# ---------------------------------------------------------------------------
+DB_QUERY_SECONDS = histogram(
+    "db_query_duration_seconds", "Duración de cursor.execute por huella de sentencia", ("fingerprint",))
+DB_QUERY_ROWS = counter(
+    "db_query_rows_total", "Filas afectadas (rowcount del driver; -1 en SELECT no se cuenta)", ("fingerprint",))
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACES = re.compile(r"\s+")
+FINGERPRINT_MAX = 160
+
+
+@lru_cache(maxsize=2048)
+def fingerprint_sql(statement: str) -> str:
+    """SQL normalizado: sin literales ni espacios repetidos, listas IN colapsadas, truncado."""
+    fp = _SPACES.sub(" ", statement).strip()
+    fp = _LITERALS.sub("?", fp)
+    fp = _IN_LISTS.sub("(?)", fp)
+    return fp[:FINGERPRINT_MAX]
+
+
+# Funciones (conn, statement, parameters, seconds, rowcount, executemany) llamadas tras
+# cada sentencia; las usa slowlog.py. No deben lanzar excepciones.
+QUERY_OBSERVERS: List[Callable[..., None]] = []
+
+
+def attach_query_metrics(engine: Engine) -> None:
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("_query_t0", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        stack = conn.info.get("_query_t0")
+        if not stack:
+            return
+        elapsed = time.perf_counter() - stack.pop()
+        fp = (fingerprint_sql(statement),)
+        DB_QUERY_SECONDS.observe(fp, elapsed)
+        rows = getattr(cursor, "rowcount", -1)
+        if rows and rows > 0:
+            DB_QUERY_ROWS.inc(fp, rows)
+        for observer in QUERY_OBSERVERS:
+            observer(conn, statement, parameters, elapsed, rows, executemany)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        # La sentencia falló: after_cursor_execute no llega, se descarta el inicio
+        conn = context.connection
+        if conn is not None and conn.info.get("_query_t0"):
+            conn.info["_query_t0"].pop()
+
+
+# ---------------------------------------------------------------------------
+# Rutas HTTP
+# ---------------------------------------------------------------------------
+HTTP_SECONDS = histogram(
+    "http_request_duration_seconds", "Latencia por ruta (hasta el último byte de la respuesta)", ("method", "route"))
+HTTP_REQUESTS = counter(
+    "http_requests_total", "Peticiones por ruta y código de estado", ("method", "route", "status"))
+API_ROWS = counter(
+    "api_rows_returned_total", "Filas devueltas por páginas de lectura y exportaciones", ("table", "kind"))
+
+
+class RouteMetricsMiddleware:
+    """Middleware ASGI puro (sin BaseHTTPMiddleware): no envuelve ni copia el cuerpo."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        t0 = time.perf_counter()
+        status = [500]
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            method = scope.get("method", "")
+            HTTP_SECONDS.observe((method, route), time.perf_counter() - t0)
+            HTTP_REQUESTS.inc((method, route, str(status[0])))
+
+
+# ---------------------------------------------------------------------------
+# Ingesta
+# ---------------------------------------------------------------------------
+INGEST_ROWS = counter(
+    "ingest_rows_total", "Filas procesadas por la ingesta (rows/s = rate())", ("table", "outcome"))
+INGEST_SECONDS = histogram(
+    "ingest_batch_duration_seconds", "Duración de la transacción de cada lote de ingesta", ("table",))
+
+
+def record_ingest(table: str, seconds: float, **outcomes: int) -> None:
+    INGEST_SECONDS.observe((table,), seconds)
+    for outcome, n in outcomes.items():
+        if n:
+            INGEST_ROWS.inc((table, outcome), n)
@@ -0,0 +1,254 @@
+# migrar_fechas.py
+# Migración en línea de hired_employees.[datetime] (NVARCHAR) a columnas tipadas:
+#
+#   hire_dt       DATETIME2(0)  instante de contratación (UTC si el texto traía offset)
+#   hire_year     SMALLINT      YEAR(hire_dt)
+#   hire_quarter  TINYINT       trimestre 1..4
+#
+# Pasos (todos idempotentes; se puede relanzar si se corta a la mitad):
+#   1. ALTER TABLE ADD de columnas NULL (solo metadatos, no reescribe la tabla)
+#   2. trigger que rellena las columnas en cada INSERT/UPDATE de [datetime]
+#   3. backfill por lotes de --batch ids existentes (keyset sobre la PK, así un
+#      id atípico no genera miles de rangos vacíos), un COMMIT por lote
+#      (transacciones cortas, sin escalar a bloqueo de tabla: lotes < 5000 filas
+#      en SQL Server)
+#   4. índice cubriente sobre hire_dt (ONLINE si la edición lo permite)
+#
+# analytics.py empieza a usar las columnas nuevas cuando existe el índice del paso 4.
+#
+# Uso:
+#   python migrar_fechas.py                       (SQL Server, mismas variables que app.py)
+#   python migrar_fechas.py --sqlite test_backup.db
+#   python migrar_fechas.py --batch 2000 --pause 0.1
+#   python migrar_fechas.py --verify
+
+import os
+import sys
+import time
+import logging
+import argparse
+from urllib.parse import quote_plus
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
+
+from agregados import PARSE_HIRE_DT
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+INDEX_NAME   = "IX_hired_employees_hire_dt"
+TRIGGER_NAME = "trg_hired_employees_hire_dt"
+NEW_COLUMNS  = ("hire_dt", "hire_year", "hire_quarter")
+
+
+# ---------------------------------------------------------------------------
+# SQL Server
+# ---------------------------------------------------------------------------
+# Texto -> DATETIME2: estilo 127 (ISO-8601 con Z); si trae offset se pasa a UTC
+_MSSQL_PARSE = PARSE_HIRE_DT
+
+MSSQL = {
+    "table": "dbo.[hired_employees]",
+    "columns": "SELECT name FROM sys.columns WHERE object_id = OBJECT_ID('dbo.hired_employees')",
+    "add": ["ALTER TABLE dbo.[hired_employees] ADD hire_dt DATETIME2(0) NULL, "
+            "hire_year SMALLINT NULL, hire_quarter TINYINT NULL"],
+    "trigger": [f"""
+        CREATE OR ALTER TRIGGER dbo.{TRIGGER_NAME} ON dbo.[hired_employees]
+        AFTER INSERT, UPDATE AS
+        BEGIN
+            SET NOCOUNT ON;
+            IF NOT UPDATE([datetime]) RETURN;
+            UPDATE he
+               SET hire_dt = c.dt, hire_year = YEAR(c.dt), hire_quarter = DATEPART(QUARTER, c.dt)
+              FROM dbo.[hired_employees] he
+              JOIN inserted i ON i.id = he.id
+             CROSS APPLY (SELECT {_MSSQL_PARSE.format(col='i.[datetime]')} AS dt) c;
+        END
+    """],
+    "backfill": f"""
+        UPDATE he
+           SET hire_dt = c.dt, hire_year = YEAR(c.dt), hire_quarter = DATEPART(QUARTER, c.dt)
+          FROM dbo.[hired_employees] he
+         CROSS APPLY (SELECT {_MSSQL_PARSE.format(col='he.[datetime]')} AS dt) c
+         WHERE he.id > :lo AND he.id <= :hi
+           AND he.hire_dt IS NULL AND he.[datetime] IS NOT NULL
+    """,
+    "next_upper": "SELECT MAX(id) FROM (SELECT TOP (:batch) id FROM dbo.[hired_employees] "
+                  "WHERE id > :lo ORDER BY id) t",
+    "index_exists": f"SELECT 1 FROM sys.indexes WHERE name = '{INDEX_NAME}' "
+                    f"AND object_id = OBJECT_ID('dbo.hired_employees')",
+    "index": f"CREATE INDEX {INDEX_NAME} ON dbo.[hired_employees] (hire_dt) "
+             f"INCLUDE (hire_year, hire_quarter, department_id, job_id)",
+    "index_online": " WITH (ONLINE = ON)",
+}
+
+
+# ---------------------------------------------------------------------------
+# SQLite (la base de pruebas de respaldo.py: create_sqlite_backup_engine)
+# ---------------------------------------------------------------------------
+def _sqlite_set(src: str) -> str:
+    return (
+        f"hire_dt = datetime({src}), "
+        f"hire_year = CAST(strftime('%Y', {src}) AS INTEGER), "
+        f"hire_quarter = (CAST(strftime('%m', {src}) AS INTEGER) + 2) / 3"
+    )
+
+SQLITE = {
+    "table": "hired_employees",
+    "columns": "SELECT name FROM pragma_table_info('hired_employees')",
+    "add": ["ALTER TABLE hired_employees ADD COLUMN hire_dt TEXT",
+            "ALTER TABLE hired_employees ADD COLUMN hire_year INTEGER",
+            "ALTER TABLE hired_employees ADD COLUMN hire_quarter INTEGER"],
+    "trigger": [
+        f"DROP TRIGGER IF EXISTS {TRIGGER_NAME}_ins",
+        f"DROP TRIGGER IF EXISTS {TRIGGER_NAME}_upd",
+        f"""CREATE TRIGGER {TRIGGER_NAME}_ins AFTER INSERT ON hired_employees
+            BEGIN UPDATE hired_employees SET {_sqlite_set('NEW.datetime')} WHERE id = NEW.id; END""",
+        f"""CREATE TRIGGER {TRIGGER_NAME}_upd AFTER UPDATE OF datetime ON hired_employees
+            BEGIN UPDATE hired_employees SET {_sqlite_set('NEW.datetime')} WHERE id = NEW.id; END""",
+    ],
+    "backfill": f"""
+        UPDATE hired_employees SET {_sqlite_set('datetime')}
+         WHERE id > :lo AND id <= :hi AND hire_dt IS NULL AND datetime IS NOT NULL
+    """,
+    "next_upper": "SELECT MAX(id) FROM (SELECT id FROM hired_employees "
+                  "WHERE id > :lo ORDER BY id LIMIT :batch) t",
+    "index_exists": f"SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = '{INDEX_NAME}'",
+    "index": f"CREATE INDEX {INDEX_NAME} ON hired_employees "
+             f"(hire_dt, hire_year, hire_quarter, department_id, job_id)",
+    "index_online": None,
+}
+
+
+def build_mssql_engine() -> Engine:
+    driver = (os.getenv("DRIVER") or "ODBC Driver 18 for SQL Server").replace("+", " ")
+    odbc = (
+        f"DRIVER={{{driver}}};"
+        f"SERVER={os.getenv('SERVER', '.')};"
+        f"DATABASE={os.getenv('DATABASE', 'Prueba_Sep')};"
+        f"UID={os.getenv('USERNAME', 'sa')};"
+        f"PWD={os.getenv('PASSWORD', '123')};"
+        f"Encrypt={os.getenv('ENCRYPT', 'no')};"
+        f"TrustServerCertificate={os.getenv('TRUST_SERVER_CERT', 'yes')};"
+    )
+    return create_engine(f"mssql+pyodbc:///?odbc_connect={quote_plus(odbc)}", future=True)
+
+
+def dialect_sql(engine: Engine) -> dict:
+    return SQLITE if engine.dialect.name == "sqlite" else MSSQL
+
+
+def add_columns(engine: Engine, sql: dict) -> None:
+    with engine.begin() as conn:
+        existing = {r[0] for r in conn.execute(text(sql["columns"]))}
+        if all(c in existing for c in NEW_COLUMNS):
+            logger.info("[1/4] Columnas tipadas ya existen")
+            return
+        if any(c in existing for c in NEW_COLUMNS):
+            raise RuntimeError(f"Migración a medias: existen solo {sorted(existing & set(NEW_COLUMNS))}")
+        for stmt in sql["add"]:
+            conn.execute(text(stmt))
+    logger.info("[1/4] Columnas hire_dt / hire_year / hire_quarter agregadas")
+
+
+def install_trigger(engine: Engine, sql: dict) -> None:
+    # Antes del backfill: las filas que entren durante la migración ya llegan rellenas
+    with engine.begin() as conn:
+        for stmt in sql["trigger"]:
+            conn.execute(text(stmt))
+    logger.info("[2/4] Trigger %s instalado", TRIGGER_NAME)
+
+
+def backfill(engine: Engine, sql: dict, batch: int, pause: float) -> int:
+    with engine.connect() as conn:
+        lo = conn.execute(text(f"SELECT MIN(id) FROM {sql['table']}")).scalar()
+    if lo is None:
+        logger.info("[3/4] Tabla vacía, nada que rellenar")
+        return 0
+
+    total, start = 0, time.time()
+    cursor = lo - 1
+    while True:
+        # Límite del lote: el id número `batch` después del cursor (seek por la PK)
+        with engine.connect() as conn:
+            upper = conn.execute(text(sql["next_upper"]), {"lo": cursor, "batch": batch}).scalar()
+        if upper is None:
+            break
+        with engine.begin() as conn:
+            n = conn.execute(text(sql["backfill"]), {"lo": cursor, "hi": upper}).rowcount or 0
+        total += max(n, 0)
+        logger.info("   ids (%s, %s]: %s filas (acumulado=%s)", cursor, upper, n, total)
+        cursor = upper
+        if pause:
+            time.sleep(pause)
+    logger.info("[3/4] Backfill completo: %s filas en %.1fs", total, time.time() - start)
+    return total
+
+
+def create_index(engine: Engine, sql: dict) -> None:
+    with engine.connect() as conn:
+        if conn.execute(text(sql["index_exists"])).first():
+            logger.info("[4/4] Índice %s ya existe", INDEX_NAME)
+            return
+    if sql["index_online"]:
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(sql["index"] + sql["index_online"]))
+            logger.info("[4/4] Índice %s creado (ONLINE)", INDEX_NAME)
+            return
+        except Exception as e:
+            # ONLINE = ON solo existe en Enterprise / Developer / Azure SQL
+            logger.warning("ONLINE no disponible (%s); se crea el índice en modo normal", e.__class__.__name__)
+    with engine.begin() as conn:
+        conn.execute(text(sql["index"]))
+    logger.info("[4/4] Índice %s creado", INDEX_NAME)
+
+
+def verify(engine: Engine, sql: dict) -> int:
+    """Filas con fecha en texto que no se pudieron convertir (quedan fuera de analytics)."""
+    with engine.connect() as conn:
+        pending = conn.execute(text(
+            f"SELECT COUNT(1) FROM {sql['table']} WHERE [datetime] IS NOT NULL AND hire_dt IS NULL"
+        )).scalar()
+    if pending:
+        logger.warning("%s filas con [datetime] no convertible (hire_dt NULL)", pending)
+    else:
+        logger.info("Verificación OK: todas las fechas tienen hire_dt")
+    return int(pending or 0)
+
+
+def parse_args():
+    ap = argparse.ArgumentParser(description="Migra hired_employees.[datetime] a columnas tipadas")
+    ap.add_argument("--sqlite", metavar="PATH", help="Base SQLite de pruebas (p. ej. test_backup.db)")
+    ap.add_argument("--batch", type=int, default=int(os.getenv("MIGRATION_BATCH", "4000")),
+                    help="Ids por lote (default 4000)")
+    ap.add_argument("--pause", type=float, default=0.05, help="Segundos de pausa entre lotes")
+    ap.add_argument("--verify", action="store_true", help="Solo contar filas sin convertir")
+    return ap.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.sqlite:
+        # La misma base de pruebas que respaldo.py (import diferido: carga .env y pyarrow)
+        from respaldo import create_sqlite_backup_engine
+        engine = create_sqlite_backup_engine(args.sqlite)
+    else:
+        engine = build_mssql_engine()
+    sql = dialect_sql(engine)
+    try:
+        if not args.verify:
+            add_columns(engine, sql)
+            install_trigger(engine, sql)
+            backfill(engine, sql, max(1, args.batch), args.pause)
+            create_index(engine, sql)
+        pending = verify(engine, sql)
+        sys.exit(1 if args.verify and pending else 0)
+    except Exception as e:
+        logger.error("❌ Migración fallida: %s", e)
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
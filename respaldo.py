@@ -20,7 +20,7 @@ def load_env_manually():
         print("DRIVER=ODBC+Driver+18+for+SQL+Server")
         sys.exit(1)
     
-      with open(env_path, 'r', encoding='utf-8') as f:
+    with open(env_path, 'r', encoding='utf-8') as f:
         for line in f:
             line = line.strip()
             if line and not line.startswith('#'):
@@ -88,9 +88,9 @@ def build_engine_from_env():
         print("[INFO] Usando SQLite temporalmente para pruebas...")
         return create_sqlite_backup_engine()
 
-def create_sqlite_backup_engine():
+def create_sqlite_backup_engine(path: str = 'test_backup.db'):
     """Crea engine de SQLite para pruebas temporales"""
-    engine = create_engine('sqlite:///test_backup.db')
+    engine = create_engine(f'sqlite:///{path}')
     
     from sqlalchemy import MetaData, Table, Column, Integer, String
     metadata = MetaData()
@@ -112,7 +112,7 @@ def create_sqlite_backup_engine():
     
     metadata.create_all(engine)
     
-    with engine.connect() as conn:
+    with engine.begin() as conn:
         conn.execute(text("""
             INSERT OR IGNORE INTO departments (id, name) 
             VALUES (1, 'IT'), (2, 'HR'), (3, 'Finance')
@@ -129,7 +129,7 @@ def create_sqlite_backup_engine():
             (3, 'Carlos Lopez', '2023-03-10T10:00:00', 3, 3)
         """))
     
-    print("[INFO] Base de datos SQLite de prueba creada: 'test_backup.db'")
+    print(f"[INFO] Base de datos SQLite de prueba creada: '{path}'")
     return engine
 
 
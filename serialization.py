@@ -0,0 +1,167 @@
+# serialization.py
+# Ruta rápida de respuestas grandes:
+#
+# - FastJSONResponse: serializa con orjson si está instalado (json estándar si no).
+#   Los handlers de listados la devuelven directamente con filas de la BD, que ya
+#   tienen tipos JSON; así FastAPI no las re-valida contra response_model (el
+#   response_model se mantiene solo para la documentación OpenAPI).
+# - CompressionMiddleware: ASGI puro que negocia zstd (si está zstandard) o gzip
+#   según Accept-Encoding, solo para tipos de texto y cuerpos >= min_size.
+#   Las respuestas en streaming (exportaciones) se comprimen por trozos.
+#   Al comprimir, el ETag pasa a débil (W/"..."): la representación ya no es
+#   idéntica byte a byte y etag.if_none_match compara en modo débil.
+
+import os
+import gzip
+import json
+import zlib
+from typing import Any, List, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # opcional
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:  # opcional
+    zstandard = None
+
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+ZSTD_LEVEL = int(os.getenv("ZSTD_LEVEL", "3"))
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def available_encodings() -> List[str]:
+    return (["zstd"] if zstandard is not None else []) + ["gzip"]
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """zstd > gzip entre los aceptados con q > 0; None si ninguno."""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[token] = q
+    for enc in available_encodings():
+        if accepted.get(enc, accepted.get("*", 0.0)) > 0:
+            return enc
+    return None
+
+
+class _Compressor:
+    def __init__(self, encoding: str):
+        if encoding == "zstd":
+            self._obj = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+            self._flush_block = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        else:
+            self._obj = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            self._flush_block = zlib.Z_SYNC_FLUSH
+
+    def chunk(self, data: bytes) -> bytes:
+        """Comprime y vacía el bloque: el cliente recibe cada trozo sin esperar al final."""
+        return self._obj.compress(data) + self._obj.flush(self._flush_block)
+
+    def finish(self) -> bytes:
+        return self._obj.flush()
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class CompressionMiddleware:
+    """Middleware ASGI puro: no usa BaseHTTPMiddleware ni copia cuerpos que no comprime."""
+
+    def __init__(self, app, min_size: int = COMPRESS_MIN_BYTES):
+        self.app = app
+        self.min_size = min_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start: List[Optional[dict]] = [None]
+        compressor: List[Optional[_Compressor]] = [None]
+        passthrough = [False]
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                start[0] = message
+                return
+            if message["type"] != "http.response.body" or passthrough[0]:
+                return await send(message)
+
+            body = message.get("body", b"")
+            more = message.get("more_body", False)
+            if compressor[0] is None:
+                # Primer trozo: decidir
+                headers = Headers(raw=start[0]["headers"])
+                if not self._compressible(start[0]["status"], headers, body, more):
+                    passthrough[0] = True
+                    await send(start[0])
+                    return await send(message)
+                compressor[0] = _Compressor(encoding)
+                mutable = MutableHeaders(raw=start[0]["headers"])
+                mutable["Content-Encoding"] = encoding
+                mutable.add_vary_header("Accept-Encoding")
+                etag = mutable.get("etag")
+                if etag and not etag.startswith("W/"):
+                    mutable["ETag"] = "W/" + etag
+                if not more:
+                    data = compress(body, encoding)
+                    mutable["Content-Length"] = str(len(data))
+                    await send(start[0])
+                    return await send({"type": "http.response.body", "body": data})
+                if "content-length" in mutable:
+                    del mutable["Content-Length"]
+                await send(start[0])
+
+            data = compressor[0].chunk(body) if body else b""
+            if not more:
+                data += compressor[0].finish()
+            await send({"type": "http.response.body", "body": data, "more_body": more})
+
+        await self.app(scope, receive, _send)
+        if start[0] is not None and compressor[0] is None and not passthrough[0]:
+            await send(start[0])   # respuesta sin cuerpo
+
+    def _compressible(self, status: int, headers: Headers, body: bytes, more: bool) -> bool:
+        if status < 200 or status in (204, 304) or "content-encoding" in headers:
+            return False
+        ctype = headers.get("content-type", "")
+        if not ctype.startswith(COMPRESSIBLE_TYPES):
+            return False
+        if more:
+            return True   # streaming: tamaño desconocido, se comprime por trozos
+        return len(body) >= self.min_size
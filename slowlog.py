@@ -0,0 +1,172 @@
+# slowlog.py
+# Registro de consultas lentas: toda sentencia que supere threshold_ms se escribe
+# en el log y queda en un buffer circular en memoria (ver /admin/slow-queries).
+#
+# - parámetros redactados: solo tipo y longitud, nunca el valor
+# - plan estimado opcional, capturado en un hilo aparte con otra conexión del pool:
+#     SQL Server -> SET SHOWPLAN_XML ON (no ejecuta la consulta)
+#     SQLite     -> EXPLAIN QUERY PLAN
+#   Solo para SELECT / WITH sin tablas temporales (#stage_* no existe en otra
+#   sesión) y como mucho un plan por huella cada plan_ttl segundos.
+
+import time
+import queue
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from itertools import count
+from typing import Any, Deque, Dict, List, Optional
+
+from sqlalchemy.engine import Engine
+
+from metrics import QUERY_OBSERVERS, fingerprint_sql
+
+logger = logging.getLogger(__name__)
+
+STATEMENT_MAX_CHARS = 2000
+PLAN_MAX_CHARS = 200_000
+
+# Marca en conn.info de las conexiones que capturan planes (no se registran a sí mismas)
+_PLAN_CONN = "_slowlog_plan"
+
+
+def redact(parameters: Any, executemany: bool) -> Any:
+    """Tipos y longitudes de los parámetros, sin valores."""
+    if executemany:
+        n = len(parameters) if hasattr(parameters, "__len__") else "?"
+        return f"<executemany: {n} filas>"
+
+    def one(v):
+        if v is None:
+            return None
+        if isinstance(v, (str, bytes)):
+            return f"<{type(v).__name__}:{len(v)}>"
+        return f"<{type(v).__name__}>"
+
+    if isinstance(parameters, dict):
+        return {k: one(v) for k, v in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [one(v) for v in parameters]
+    return one(parameters)
+
+
+def _plannable(statement: str) -> bool:
+    head = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return head in ("SELECT", "WITH") and "#" not in statement
+
+
+class SlowQueryLog:
+    def __init__(self, threshold_ms: float = 500, capacity: int = 100,
+                 capture_plans: bool = False, plan_ttl: float = 300):
+        self.threshold_ms = threshold_ms
+        self.capture_plans = capture_plans
+        self.plan_ttl = plan_ttl
+        self._entries: Deque[Dict[str, Any]] = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self._ids = count(1)
+        self._engine: Optional[Engine] = None
+        self._plans: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=32)
+        self._planned_at: Dict[str, float] = {}
+        self._thread: Optional[threading.Thread] = None
+        self.total = 0
+
+    def attach(self, engine: Engine) -> None:
+        """Se engancha a las métricas de consultas del engine (metrics.attach_query_metrics)."""
+        self._engine = engine
+        if self.observe not in QUERY_OBSERVERS:
+            QUERY_OBSERVERS.append(self.observe)
+
+    def observe(self, conn, statement: str, parameters, seconds: float, rowcount: int, executemany: bool) -> None:
+        ms = seconds * 1000.0
+        if ms < self.threshold_ms or conn.info.get(_PLAN_CONN):
+            return
+        try:
+            entry = {
+                "id": next(self._ids),
+                "at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "fingerprint": fingerprint_sql(statement),
+                "statement": statement[:STATEMENT_MAX_CHARS],
+                "params": redact(parameters, executemany),
+                "duration_ms": round(ms, 3),
+                "rowcount": rowcount,
+                "plan_status": "off",
+                "plan": None,
+            }
+            logger.warning(
+                "Consulta lenta %.1fms filas=%s: %s params=%s",
+                ms, rowcount, entry["fingerprint"], entry["params"],
+            )
+            if self.capture_plans:
+                self._queue_plan(entry, statement, parameters, executemany)
+            with self._lock:
+                self._entries.append(entry)
+                self.total += 1
+        except Exception as e:  # nunca romper la consulta original
+            logger.debug("slowlog: no se pudo registrar la consulta: %s", e)
+
+    def recent(self, limit: int = 50) -> List[Dict[str, Any]]:
+        with self._lock:
+            items = list(self._entries)
+        return [dict(e) for e in reversed(items[-limit:])]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    # ------------------------------------------------------------------
+    # Captura de planes
+    # ------------------------------------------------------------------
+    def _queue_plan(self, entry: Dict[str, Any], statement: str, parameters, executemany: bool) -> None:
+        if executemany or self._engine is None or not _plannable(statement):
+            entry["plan_status"] = "skipped"
+            return
+        now = time.monotonic()
+        last = self._planned_at.get(entry["fingerprint"])
+        if last is not None and now - last < self.plan_ttl:
+            entry["plan_status"] = "recent"   # ya hay un plan reciente de esta huella
+            return
+        try:
+            self._plans.put_nowait({"entry": entry, "statement": statement, "parameters": parameters})
+        except queue.Full:
+            entry["plan_status"] = "dropped"
+            return
+        self._planned_at[entry["fingerprint"]] = now
+        entry["plan_status"] = "pending"
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._plan_worker, name="slowlog-plans", daemon=True)
+            self._thread.start()
+
+    def _plan_worker(self) -> None:
+        while True:
+            job = self._plans.get()
+            entry = job["entry"]
+            try:
+                entry["plan"] = self._capture(job["statement"], job["parameters"])[:PLAN_MAX_CHARS]
+                entry["plan_status"] = "captured"
+            except Exception as e:
+                entry["plan"] = None
+                entry["plan_status"] = f"error: {e.__class__.__name__}: {e}"[:500]
+
+    def _capture(self, statement: str, parameters) -> str:
+        params = tuple(parameters) if isinstance(parameters, list) else parameters
+        with self._engine.connect() as conn:
+            conn.info[_PLAN_CONN] = True
+            try:
+                if conn.dialect.name == "sqlite":
+                    rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, params).all()
+                    return "\n".join(" | ".join(str(c) for c in r) for r in rows)
+
+                conn.exec_driver_sql("SET SHOWPLAN_XML ON")
+                try:
+                    return str(conn.exec_driver_sql(statement, params).scalar())
+                finally:
+                    try:
+                        conn.exec_driver_sql("SET SHOWPLAN_XML OFF")
+                    except Exception:
+                        conn.invalidate()  # no devolver al pool una sesión en modo SHOWPLAN
+                        raise
+            finally:
+                conn.info.pop(_PLAN_CONN, None)
+                if not conn.invalidated:
+                    conn.rollback()
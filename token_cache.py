@@ -0,0 +1,80 @@
+# token_cache.py
+# Cache LRU de JWT ya verificados: el dashboard y los clientes de lotes reutilizan
+# el mismo token miles de veces y no hace falta repetir la verificación HMAC.
+# Solo se guardan tokens válidos, indexados por su sha256 (nunca el token en claro).
+
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+
+def token_key(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class TokenCache:
+    """
+    LRU acotado a max_entries. Cada entrada vence con el claim `exp` del token
+    (o a los max_ttl segundos si el token no trae exp).
+    max_entries = 0 desactiva la cache.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_ttl: float = 3600):
+        self.max_entries = max_entries
+        self.max_ttl = max_ttl
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    def get(self, token: str) -> Optional[str]:
+        """Subject del token si está en cache y no ha vencido; None en otro caso."""
+        if not self.max_entries:
+            return None
+        key = token_key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            sub, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return sub
+
+    def put(self, token: str, sub: str, exp: Optional[float]) -> None:
+        if not self.max_entries:
+            return
+        expires_at = min(float(exp), time.time() + self.max_ttl) if exp is not None else time.time() + self.max_ttl
+        key = token_key(token)
+        with self._lock:
+            self._entries[key] = (sub, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
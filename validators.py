@@ -1,28 +1,172 @@
 # validators.py
+import re
+import time
+import threading
 from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
 
-def validate_employee_data(employee_data: dict) -> list:
+from sqlalchemy import text
+
+
+# department_id y job_id admiten NULL en hired_employees: solo se validan si vienen
+REQUIRED_FIELDS = ['id', 'name', 'datetime']
+EMPLOYEE_FIELDS = REQUIRED_FIELDS + ['department_id', 'job_id']
+
+# Columnas INT de hired_employees (y de la staging de ingest.py): un valor fuera
+# de rango haría fallar el INSERT del lote entero, así que se rechaza la fila
+INT_FIELDS = ['id', 'department_id', 'job_id']
+INT_MIN, INT_MAX = -2**31, 2**31 - 1
+
+# Fechas que entienden a la vez la lectura (dates.to_iso_many) y los agregados
+# (agregados.PARSE_HIRE_DT: estilo 127 o DATETIMEOFFSET, sin depender del idioma
+# del servidor): ISO-8601 con fecha completa, hora opcional, hasta 7 decimales
+# y Z / ±HH:MM opcional tras los segundos
+HIRE_DT_PATTERN = re.compile(
+    r"\d{4}-\d{2}-\d{2}(?:[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d{1,7})?(?:Z|[+-]\d{2}:\d{2})?)?)?"
+)
+
+
+class ReferenceCache:
+    """
+    Ids válidos de departments y jobs en memoria para validar integridad
+    referencial sin ir a la BD en cada lote.
+
+    - se recarga cada `ttl` segundos
+    - si un lote trae ids desconocidos y la copia tiene más de `min_refresh`
+      segundos, se recarga una vez antes de rechazar (catálogos recién cargados
+      por otra vía: historico.py, otro worker, ingesta asíncrona...)
+    """
+
+    def __init__(self, session_factory, ttl: float = 60.0, min_refresh: float = 1.0):
+        self.session_factory = session_factory
+        self.ttl = ttl
+        self.min_refresh = min_refresh
+        self._lock = threading.Lock()
+        self._loaded_at = 0.0
+        self._ids: Dict[str, frozenset] = {"departments": frozenset(), "jobs": frozenset()}
+
+    def refresh(self) -> None:
+        db = self.session_factory()
+        try:
+            ids = {
+                table: frozenset(db.execute(text(f"SELECT id FROM dbo.[{table}]")).scalars().all())
+                for table in ("departments", "jobs")
+            }
+        finally:
+            db.close()
+        with self._lock:
+            self._ids = ids
+            self._loaded_at = time.monotonic()
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._loaded_at = 0.0
+
+    def age(self) -> float:
+        return time.monotonic() - self._loaded_at
+
+    def get(self, table: str) -> frozenset:
+        if self.age() > self.ttl:
+            self.refresh()
+        return self._ids[table]
+
+
+def validate_employee_data(employee_data: dict, refs: Optional[ReferenceCache] = None) -> list:
     """
     Valida reglas de calidad para empleados
     Returns: Lista de errores
     """
     errors = []
-    
+
     # 1. Todos los campos obligatorios
-    required_fields = ['id', 'name', 'datetime', 'department_id', 'job_id']
-    for field in required_fields:
-        if field not in employee_data:
+    for field in REQUIRED_FIELDS:
+        if employee_data.get(field) is None:
             errors.append(f"Campo requerido faltante: {field}")
-    
+    for field in INT_FIELDS:
+        value = employee_data.get(field)
+        if isinstance(value, int) and not INT_MIN <= value <= INT_MAX:
+            errors.append(f"{field} fuera de rango")
+
     # 2. Validar formato de fecha
-    if 'datetime' in employee_data:
+    if employee_data.get('datetime') is not None:
+        value = str(employee_data['datetime'])
         try:
-            datetime.fromisoformat(employee_data['datetime'].replace('Z', '+00:00'))
+            if not HIRE_DT_PATTERN.fullmatch(value):
+                raise ValueError(value)
+            datetime.fromisoformat(value.replace('Z', '+00:00'))
         except ValueError:
             errors.append("Formato de fecha inválido. Use ISO-8601")
-    
+
     # 3. Validar que department_id exista
     # 4. Validar que job_id exista
-    # ... agregar más reglas según necesidad
-    
-    return errors
\ No newline at end of file
+    if refs is not None:
+        for field, table in (('department_id', 'departments'), ('job_id', 'jobs')):
+            value = employee_data.get(field)
+            if value is not None and value not in refs.get(table):
+                errors.append(f"{field} {value} no existe")
+
+    return errors
+
+
+def _unknown(values, valid: frozenset):
+    return values.notna() & ~values.isin(valid)
+
+
+def validate_employee_batch(rows: List[Dict[str, Any]], refs: Optional[ReferenceCache] = None) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    Versión vectorizada de validate_employee_data para un lote completo:
+    una pasada por columna en pandas en lugar de una validación por fila.
+
+    Returns: (filas válidas, errores "ID x: motivo" de las rechazadas)
+    """
+    if not rows:
+        return [], []
+
+    import pandas as pd  # diferido: no pesa en el arranque de la API
+
+    df = pd.DataFrame.from_records(rows, columns=EMPLOYEE_FIELDS)
+    reasons = pd.Series(None, index=df.index, dtype=object)
+
+    def mark(mask: pd.Series, messages) -> None:
+        # Solo se reporta el primer motivo de cada fila, como en la clasificación en BD
+        mask = mask & reasons.isna()
+        if mask.any():
+            reasons[mask] = messages[mask] if isinstance(messages, pd.Series) else messages
+
+    # 1. Todos los campos obligatorios
+    for field in REQUIRED_FIELDS:
+        col = df[field]
+        missing = col.isna() | (col.astype(str).str.strip() == "") if field == "name" else col.isna()
+        mark(missing, f"campo requerido faltante: {field}")
+    in_range = {}
+    for field in INT_FIELDS:
+        numeric = pd.to_numeric(df[field], errors="coerce")
+        out = df[field].notna() & ~numeric.between(INT_MIN, INT_MAX)
+        mark(out, f"{field} fuera de rango")
+        in_range[field] = numeric.where(~out)
+
+    # 2. Validar formato de fecha (ISO-8601, ver HIRE_DT_PATTERN) y que sea una fecha real
+    text = df["datetime"].astype(str)
+    shape = text.str.fullmatch(HIRE_DT_PATTERN.pattern)
+    parsed = pd.to_datetime(df["datetime"].where(shape), format="ISO8601", errors="coerce", utc=True)
+    mark(df["datetime"].notna() & parsed.isna(), "formato de fecha inválido, use ISO-8601")
+
+    # 3. Validar que department_id exista
+    # 4. Validar que job_id exista
+    if refs is not None:
+        checks = (("department_id", "departments"), ("job_id", "jobs"))
+        bad = {field: _unknown(in_range[field], refs.get(table)) for field, table in checks}
+        if any(m.any() for m in bad.values()) and refs.age() > refs.min_refresh:
+            refs.refresh()
+            bad = {field: _unknown(in_range[field], refs.get(table)) for field, table in checks}
+        for field, mask in bad.items():
+            mark(mask, field + " " + in_range[field].astype("Int64").astype(str) + " no existe")
+
+    rejected = reasons.notna()
+    if not rejected.any():
+        return rows, []
+
+    keep = (~rejected).tolist()
+    valid = [r for r, ok in zip(rows, keep) if ok]
+    errors = ("ID " + df.loc[rejected, "id"].astype(str) + ": " + reasons[rejected]).tolist()
+    return valid, errors